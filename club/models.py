@@ -434,9 +434,11 @@ class Membership(models.Model):
         clubs = {m.club_id for m in memberships}
         users = {m.user_id for m in memberships}
         groups = Group.objects.filter(Q(club__in=clubs) | Q(club_board__in=clubs))
-        return User.groups.through.objects.filter(
+        res = User.groups.through.objects.filter(
             Q(group__in=groups) & Q(user__in=users)
         ).delete()
+        Membership._clear_groups_cache(memberships)
+        return res
 
     @staticmethod
     def _add_club_groups(
@@ -488,9 +490,23 @@ class Membership(models.Model):
                         group_id=membership.club.board_group_id,
                     )
                 )
-        return User.groups.through.objects.bulk_create(
+        res = User.groups.through.objects.bulk_create(
             club_groups, ignore_conflicts=True
         )
+        Membership._clear_groups_cache(memberships)
+        return res
+
+    @staticmethod
+    def _clear_groups_cache(memberships: Iterable[Membership]):
+        """Clear the cached groups of the users of those memberships.
+
+        The club groups are edited in bulk, which doesn't send
+        the `m2m_changed` signal, so the cache must be cleared here.
+        """
+        for membership in memberships:
+            if Membership.user.is_cached(membership):
+                membership.user.clear_group_state()
+        User.clear_groups_cache(m.user_id for m in memberships)
 
 
 class Mailing(models.Model):
@@ -12,7 +12,7 @@
 # OR WITHIN THE LOCAL FILE "LICENSE"
 #
 #
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 from django.conf import settings
 from django.core.cache import cache
@@ -25,8 +25,11 @@ from model_bakery import baker
 
 from club.forms import MailingForm
 from club.models import Club, Mailing, Membership
+from club.views import ClubSellingView
 from core.baker_recipes import subscriber_user
 from core.models import AnonymousUser, User
+from counter.baker_recipes import product_recipe, sale_recipe
+from counter.models import Selling
 from sith.settings import SITH_BAR_MANAGER, SITH_MAIN_CLUB_ID
 
 
@@ -904,3 +907,37 @@ class TestClubSellingView(TestCase):
             reverse("club:club_sellings", kwargs={"club_id": self.ae.id})
         )
         assert response.status_code == 200
+
+    def test_totals_from_rollup(self):
+        """Test that the totals read from the rollup are the same as the raw ones."""
+        product = product_recipe.make(club=self.ae, purchase_price=1)
+        customer = subscriber_user.make().customer
+        # the days of the rollup are in the timezone of the site
+        paris = timezone.get_default_timezone()
+        for day in (1, 2, 2, 3):
+            sale_recipe.make(
+                club=self.ae,
+                product=product,
+                customer=customer,
+                is_validated=True,
+                quantity=2,
+                unit_price=3,
+                date=datetime(2024, 5, day, tzinfo=paris),
+            )
+        view = ClubSellingView()
+        view.object = self.ae
+        filters = {
+            "begin_date": datetime(2024, 5, 2, tzinfo=paris),
+            "end_date": datetime(2024, 5, 3, tzinfo=paris),
+            "counters": [],
+        }
+        qs = Selling.objects.filter(
+            club=self.ae, date__gte=filters["begin_date"], date__lte=filters["end_date"]
+        )
+        expected = {"total": 18, "quantity": 6, "purchase_price": 3}
+        with self.assertNumQueries(2):
+            assert view.get_totals(qs, filters, []) == expected
+        # a window which isn't aligned on days is computed from the raw sales
+        filters["end_date"] += timedelta(seconds=1)
+        with self.assertNumQueries(1):
+            assert view.get_totals(qs, filters, []) == expected
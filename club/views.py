@@ -23,11 +23,12 @@
 #
 
 import csv
+from decimal import Decimal
 
 from django.conf import settings
 from django.core.exceptions import NON_FIELD_ERRORS, PermissionDenied, ValidationError
 from django.core.paginator import InvalidPage, Paginator
-from django.db.models import Sum
+from django.db.models import F, QuerySet, Sum
 from django.http import (
     Http404,
     HttpResponseRedirect,
@@ -41,6 +42,7 @@ from django.utils.translation import gettext_lazy as _
 from django.views.generic import DetailView, ListView, TemplateView, View
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 
+from accounting.models import CurrencyField
 from club.forms import ClubEditForm, ClubMemberForm, MailingForm, SellingsForm
 from club.models import Club, Mailing, MailingSubscription, Membership
 from com.views import (
@@ -60,7 +62,7 @@ from core.views import (
     TabedViewMixin,
     UserIsRootMixin,
 )
-from counter.models import Selling
+from counter.models import Product, SalesDailyRollup, Selling
 
 
 class ClubTabsMixin(TabedViewMixin):
@@ -357,15 +359,11 @@ class ClubSellingView(ClubTabsMixin, CanEditMixin, DetailFormView):
                 qs = qs.filter(product__in=selected_products)
 
             kwargs["result"] = qs.all().order_by("-id")
-            kwargs["total"] = sum([s.quantity * s.unit_price for s in kwargs["result"]])
-            total_quantity = qs.all().aggregate(Sum("quantity"))
-            if total_quantity["quantity__sum"]:
-                kwargs["total_quantity"] = total_quantity["quantity__sum"]
-            benefit = (
-                qs.exclude(product=None).all().aggregate(Sum("product__purchase_price"))
-            )
-            if benefit["product__purchase_price__sum"]:
-                kwargs["benefit"] = benefit["product__purchase_price__sum"]
+            if any(v is not None for v in form.cleaned_data.values()):
+                totals = self.get_totals(qs, form.cleaned_data, selected_products)
+                kwargs["total"] = totals["total"]
+                kwargs["total_quantity"] = totals["quantity"]
+                kwargs["benefit"] = totals["purchase_price"]
 
         kwargs["paginator"] = Paginator(kwargs["result"], self.paginate_by)
         try:
@@ -375,6 +373,48 @@ class ClubSellingView(ClubTabsMixin, CanEditMixin, DetailFormView):
 
         return kwargs
 
+    def get_totals(
+        self, qs: QuerySet[Selling], filters: dict, products: list[Product]
+    ) -> dict[str, Decimal | int]:
+        """Compute the turnover, the number of sold items
+        and the purchase price of the sales matching the filters.
+
+        If the date bounds are at local midnight, the totals are read
+        from the `SalesDailyRollup` table instead of the raw sales.
+        """
+        begin, end = filters["begin_date"], filters["end_date"]
+        if not (
+            SalesDailyRollup.is_day_aligned(begin)
+            and SalesDailyRollup.is_day_aligned(end)
+        ):
+            return qs.aggregate(
+                total=Sum(
+                    F("quantity") * F("unit_price"),
+                    default=0,
+                    output_field=CurrencyField(),
+                ),
+                quantity=Sum("quantity", default=0),
+                purchase_price=Sum("product__purchase_price", default=0),
+            )
+        rollups = SalesDailyRollup.objects.filter(club=self.object)
+        if begin:
+            rollups = rollups.filter(day__gte=SalesDailyRollup.day_of(begin))
+        if filters["counters"]:
+            rollups = rollups.filter(counter__in=filters["counters"])
+        if products:
+            rollups = rollups.filter(product__in=products)
+        if not end:
+            return rollups.summary()
+        # the end bound is inclusive, so the sales made
+        # exactly at midnight must be counted apart
+        totals = rollups.filter(day__lt=SalesDailyRollup.day_of(end)).summary()
+        for sale in qs.filter(date=end).select_related("product"):
+            totals["total"] += sale.quantity * sale.unit_price
+            totals["quantity"] += sale.quantity
+            if sale.product:
+                totals["purchase_price"] += sale.product.purchase_price
+        return totals
+
 
 class ClubSellingCSVView(ClubSellingView):
     """Generate sellings in csv for a given period."""
@@ -1,7 +1,9 @@
 from typing import Annotated
+from uuid import uuid4
 
 import annotated_types
 from django.conf import settings
+from django.core.cache import cache
 from django.db.models import F
 from django.http import HttpResponse
 from ninja import Query
@@ -111,23 +113,41 @@ class FamilyController(ControllerBase):
     ):
         user: User = self.get_object_or_exception(User, pk=user_id)
 
-        relations = user.get_family(godfathers_depth, godchildren_depth)
+        relations = self._get_relationships(user, godfathers_depth, godchildren_depth)
         if not relations:
             # If the user has no relations, return only the user
             # He is alone in its family, but the family exists nonetheless
             return {"users": [user], "relationships": []}
 
-        user_ids = {r.from_user_id for r in relations} | {
-            r.to_user_id for r in relations
-        }
+        user_ids = {r.godchild for r in relations} | {r.godfather for r in relations}
         return {
             "users": User.objects.filter(id__in=user_ids).distinct(),
-            "relationships": (
-                [
-                    FamilyGodfatherSchema(
-                        godchild=r.from_user_id, godfather=r.to_user_id
-                    )
-                    for r in relations
-                ]
-            ),
+            "relationships": relations,
         }
+
+    @staticmethod
+    def _get_relationships(
+        user: User, godfathers_depth: int, godchildren_depth: int
+    ) -> list[FamilyGodfatherSchema]:
+        """Get the relationships of the family of the user.
+
+        The family graphs of the most viewed profiles are requested
+        over and over, so they are cached.
+        The cache keys contain a version, which changes
+        each time a relationship is added or removed (see `core.signals`).
+        """
+        version = cache.get_or_set(
+            "family_graph_version", lambda: uuid4().hex, timeout=None
+        )
+        key = f"family_graph_{version}_{user.id}_{godfathers_depth}_{godchildren_depth}"
+        relations = cache.get(key)
+        if relations is None:
+            relations = [
+                (r.from_user_id, r.to_user_id)
+                for r in user.get_family(godfathers_depth, godchildren_depth)
+            ]
+            cache.set(key, relations)
+        return [
+            FamilyGodfatherSchema(godchild=godchild, godfather=godfather)
+            for godchild, godfather in relations
+        ]
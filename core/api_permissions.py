@@ -78,7 +78,8 @@ class IsOldSubscriber(BasePermission):
 class CanView(BasePermission):
     """Check that this user has the permission to view the object of this route.
 
-    Wrap the `user.can_view(obj)` method.
+    Give the same result as the `user.can_view(obj)` method,
+    with the permission resolver of the user.
     To see an example, look at the example in the module docstring.
     """
 
@@ -88,13 +89,14 @@ class CanView(BasePermission):
     def has_object_permission(
         self, request: HttpRequest, controller: ControllerBase, obj: Any
     ) -> bool:
-        return request.user.can_view(obj)
+        return request.user.permission_resolver.can_view(obj)
 
 
 class CanEdit(BasePermission):
     """Check that this user has the permission to edit the object of this route.
 
-    Wrap the `user.can_edit(obj)` method.
+    Give the same result as the `user.can_edit(obj)` method,
+    with the permission resolver of the user.
     To see an example, look at the example in the module docstring.
     """
 
@@ -104,7 +106,7 @@ class CanEdit(BasePermission):
     def has_object_permission(
         self, request: HttpRequest, controller: ControllerBase, obj: Any
     ) -> bool:
-        return request.user.can_edit(obj)
+        return request.user.permission_resolver.can_edit(obj)
 
 
 class IsOwner(BasePermission):
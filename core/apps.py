@@ -24,7 +24,7 @@ import logging
 
 from django.apps import AppConfig
 from django.core.cache import cache
-from django.core.signals import request_started
+from django.core.signals import request_finished, request_started
 
 
 class SithConfig(AppConfig):
@@ -33,6 +33,7 @@ class SithConfig(AppConfig):
 
     def ready(self):
         import core.signals  # noqa F401
+        from core.models import group_memo
         from forum.models import Forum
 
         cache.clear()
@@ -46,3 +47,9 @@ class SithConfig(AppConfig):
             weak=False,
             dispatch_uid="clear_cached_memberships",
         )
+        request_started.connect(
+            group_memo.start, weak=False, dispatch_uid="start_group_memo"
+        )
+        request_finished.connect(
+            group_memo.stop, weak=False, dispatch_uid="stop_group_memo"
+        )
@@ -13,12 +13,14 @@ from faker import Faker
 from club.models import Club, Membership
 from core.models import Group, User
 from counter.models import (
+    AccountIdSequence,
     Counter,
     Customer,
     Permanency,
     Product,
     ProductType,
     Refilling,
+    SalesDailyRollup,
     Selling,
 )
 from forum.models import Forum, ForumMessage, ForumTopic
@@ -132,6 +134,9 @@ class Command(BaseCommand):
                 subscriptions.append(sub)
         Subscription.objects.bulk_create(subscriptions)
         Customer.objects.bulk_create(customers, ignore_conflicts=True)
+        AccountIdSequence.objects.update_or_create(
+            pk=1, defaults={"last_number": AccountIdSequence.compute_last_number()}
+        )
 
     def make_club(self, club: Club, members: list[User], old_members: list[User]):
         def zip_roles(users: list[User]) -> Iterator[tuple[User, int]]:
@@ -334,6 +339,7 @@ class Command(BaseCommand):
             sales.extend(this_customer_sales)
         Refilling.objects.bulk_create(reloads)
         Selling.objects.bulk_create(sales)
+        SalesDailyRollup.objects.rebuild()
         Customer.objects.update_amount()
 
     def create_permanences(self, sellers: list[User]):
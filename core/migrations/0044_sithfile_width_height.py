@@ -0,0 +1,32 @@
+# Generated by Django 4.2.17 on 2026-10-18 22:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("core", "0043_bangroup_alter_group_description_alter_user_groups_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="sithfile",
+            name="height",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Only set for images.",
+                null=True,
+                verbose_name="height",
+            ),
+        ),
+        migrations.AddField(
+            model_name="sithfile",
+            name="width",
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Only set for images.",
+                null=True,
+                verbose_name="width",
+            ),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.17 on 2026-10-18 22:55
+
+from django.db import migrations, models
+from django.db.migrations.state import StateApps
+from django.db.models import OuterRef, Subquery
+
+
+def fill_album_date(apps: StateApps, schema_editor):
+    SithFile = apps.get_model("core", "SithFile")
+    SithFile.objects.filter(is_in_sas=True, is_folder=False).update(
+        album_date=Subquery(
+            SithFile.objects.filter(id=OuterRef("parent_id")).values("date")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [("core", "0044_sithfile_width_height")]
+
+    operations = [
+        migrations.AddField(
+            model_name="sithfile",
+            name="album_date",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text="The date of the album of this file, if it is a SAS picture.",
+                null=True,
+                verbose_name="album date",
+            ),
+        ),
+        migrations.RunPython(fill_album_date, reverse_code=migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="sithfile",
+            index=models.Index(
+                fields=["-album_date", "date", "id"], name="core_sithfile_album_order"
+            ),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.17 on 2026-10-18 23:40
+
+from django.db import migrations, models
+from django.db.migrations.state import StateApps
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Concat
+
+
+def fill_tree_path(apps: StateApps, schema_editor):
+    SithFile = apps.get_model("core", "SithFile")
+    id_as_str = Cast("id", output_field=models.TextField())
+    parent_path = Subquery(
+        SithFile.objects.filter(id=OuterRef("parent_id")).values("tree_path")[:1]
+    )
+    SithFile.objects.filter(parent=None).update(
+        tree_path=Concat(
+            Value("/"), id_as_str, Value("/"), output_field=models.TextField()
+        )
+    )
+    # compute the paths one level of depth at a time
+    while (
+        SithFile.objects.filter(tree_path="", parent__isnull=False)
+        .exclude(parent__tree_path="")
+        .update(
+            tree_path=Concat(
+                parent_path, id_as_str, Value("/"), output_field=models.TextField()
+            )
+        )
+    ):
+        pass
+
+
+class Migration(migrations.Migration):
+    dependencies = [("core", "0045_sithfile_album_date")]
+
+    operations = [
+        migrations.AddField(
+            model_name="sithfile",
+            name="tree_path",
+            field=models.TextField(
+                blank=True,
+                db_index=True,
+                default="",
+                editable=False,
+                help_text=(
+                    "The ids of the ancestors of this file and of the file itself, "
+                    "separated by slashes."
+                ),
+                verbose_name="tree path",
+            ),
+        ),
+        migrations.RunPython(fill_tree_path, reverse_code=migrations.RunPython.noop),
+    ]
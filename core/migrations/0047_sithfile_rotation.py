@@ -0,0 +1,22 @@
+# Generated by Django 4.2.17 on 2026-10-19 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [("core", "0046_sithfile_tree_path")]
+
+    operations = [
+        migrations.AddField(
+            model_name="sithfile",
+            name="rotation",
+            field=models.PositiveSmallIntegerField(
+                default=0,
+                help_text=(
+                    "The angle, in degrees counter-clockwise, by which the image "
+                    "is rotated in its compressed version and its thumbnail."
+                ),
+                verbose_name="rotation",
+            ),
+        ),
+    ]
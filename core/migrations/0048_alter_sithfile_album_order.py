@@ -0,0 +1,21 @@
+# Generated by Django 4.2.17 on 2026-10-19 11:25
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+class Migration(migrations.Migration):
+    dependencies = [("core", "0047_sithfile_rotation")]
+
+    operations = [
+        migrations.RemoveIndex(model_name="sithfile", name="core_sithfile_album_order"),
+        migrations.AddIndex(
+            model_name="sithfile",
+            index=models.Index(
+                Coalesce("album_date", "date").desc(),
+                models.F("date"),
+                models.F("id"),
+                name="core_sithfile_album_order",
+            ),
+        ),
+    ]
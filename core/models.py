@@ -27,7 +27,9 @@ import importlib
 import logging
 import os
 import string
+import threading
 import unicodedata
+from dataclasses import dataclass
 from datetime import timedelta
 from pathlib import Path
 from typing import TYPE_CHECKING, Optional, Self
@@ -41,8 +43,19 @@ from django.core import validators
 from django.core.cache import cache
 from django.core.exceptions import PermissionDenied, ValidationError
 from django.core.mail import send_mail
-from django.db import models, transaction
-from django.db.models import Exists, F, OuterRef, Q
+from django.db import connection, models, transaction
+from django.db.models import (
+    Case,
+    Exists,
+    F,
+    OuterRef,
+    Q,
+    QuerySet,
+    Subquery,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast, Coalesce, Concat, Substr
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.functional import cached_property
@@ -51,7 +64,12 @@ from django.utils.timezone import localdate, now
 from django.utils.translation import gettext_lazy as _
 from phonenumber_field.modelfields import PhoneNumberField
 
+from core.permissions import PermissionResolver
+from core.utils import delete_media_files
+
 if TYPE_CHECKING:
+    from collections.abc import Iterable
+
     from pydantic import NonNegativeInt
 
     from club.models import Club
@@ -74,13 +92,59 @@ class Group(AuthGroup):
         super().save(*args, **kwargs)
         cache.set(f"sith_group_{self.id}", self)
         cache.set(f"sith_group_{self.name.replace(' ', '_')}", self)
+        group_memo.forget(self.id, self.name.replace(" ", "_"))
 
     def delete(self, *args, **kwargs) -> None:
+        group_memo.forget(self.id, self.name.replace(" ", "_"))
         super().delete(*args, **kwargs)
         cache.delete(f"sith_group_{self.id}")
         cache.delete(f"sith_group_{self.name.replace(' ', '_')}")
 
 
+class GroupMemo(threading.local):
+    """The groups fetched during the request handled by the current thread.
+
+    [get_group][core.models.get_group] and
+    [User.group_state][core.models.User.group_state] are called
+    many times during a single request.
+    The memo answers the repeated calls from the process memory,
+    instead of hitting the cache each time.
+
+    The memo is only active between the `request_started`
+    and the `request_finished` signals (see `core.apps`),
+    so that the data it holds never outlives the request.
+    It also counts the lookups which were answered from memory (`hits`)
+    and those which weren't (`misses`) ;
+    those counters are logged at the end of each request.
+    """
+
+    def __init__(self):
+        self.groups: dict[int | str, Group | None] | None = None
+        self.hits = 0
+        self.misses = 0
+
+    def start(self, **kwargs) -> None:
+        self.groups = {}
+        self.hits = 0
+        self.misses = 0
+
+    def stop(self, **kwargs) -> None:
+        logging.getLogger("django").debug(
+            "Group lookups : %d answered from memory, %d loaded",
+            self.hits,
+            self.misses,
+        )
+        self.groups = None
+
+    def forget(self, *keys: int | str) -> None:
+        if self.groups is not None:
+            for key in keys:
+                self.groups.pop(key, None)
+
+
+group_memo = GroupMemo()
+
+
 def validate_promo(value: int) -> None:
     start_year = settings.SITH_SCHOOL_START_YEAR
     delta = (localdate() + timedelta(days=180)).year - start_year
@@ -96,6 +160,8 @@ def get_group(*, pk: int | None = None, name: str | None = None) -> Group | None
     Either one of the two must be set.
 
     The result is cached for the default duration (should be 5 minutes).
+    During a request, it is also kept in memory
+    (see [GroupMemo][core.models.GroupMemo]).
 
     Args:
         pk: The primary key of the group
@@ -112,6 +178,20 @@ def get_group(*, pk: int | None = None, name: str | None = None) -> Group | None
 
     # replace space characters to hide warnings with memcached backend
     pk_or_name: str | int = pk if pk is not None else name.replace(" ", "_")
+    if group_memo.groups is not None and pk_or_name in group_memo.groups:
+        group_memo.hits += 1
+        return group_memo.groups[pk_or_name]
+    group_memo.misses += 1
+    group = _get_group(pk=pk, name=name, pk_or_name=pk_or_name)
+    if group_memo.groups is not None:
+        group_memo.groups[pk_or_name] = group
+    return group
+
+
+def _get_group(
+    *, pk: int | None, name: str | None, pk_or_name: str | int
+) -> Group | None:
+    """Fetch the group from the cache, or from the db if it isn't cached."""
     group = cache.get(f"sith_group_{pk_or_name}")
 
     if group == "not_found":
@@ -180,6 +260,16 @@ class CustomUserManager(UserManager.from_queryset(UserQuerySet)):
     pass
 
 
+@dataclass(frozen=True)
+class UserGroupState:
+    """The groups of a user and its subscription status."""
+
+    group_ids: frozenset[int]
+    """The ids of the groups the user is in, as stored in the database."""
+    is_subscribed: bool
+    was_subscribed: bool
+
+
 class User(AbstractUser):
     """Defines the base user class, useable in every app.
 
@@ -335,23 +425,78 @@ class User(AbstractUser):
             settings.BASE_DIR / f"core/static/core/img/promo_{self.promo}.png"
         ).exists()
 
-    @cached_property
+    @property
+    def group_state(self) -> UserGroupState:
+        """The groups and the subscription status of this user.
+
+        They are fetched together in a single query the first time
+        they are needed, then kept on this object ;
+        as `request.user` is created for each request,
+        they live as long as the request.
+        They are forgotten when the groups or the subscriptions
+        of the user change (see `core.signals`).
+        """
+        state = self.__dict__.get("_group_state")
+        if state is not None:
+            group_memo.hits += 1
+            return state
+        group_memo.misses += 1
+
+        from subscription.models import Subscription
+
+        today = localdate()
+        subscriptions = Subscription.objects.filter(member=OuterRef("pk"))
+        rows = list(
+            User.objects.filter(pk=self.pk)
+            .annotate(
+                subscribed_now=Exists(
+                    subscriptions.filter(
+                        subscription_start__lte=today, subscription_end__gte=today
+                    )
+                ),
+                subscribed_once=Exists(subscriptions),
+            )
+            # one row per group, with the group id set to None
+            # if the user isn't in any group
+            .values_list("groups", "subscribed_now", "subscribed_once")
+        )
+        state = UserGroupState(
+            group_ids=frozenset(row[0] for row in rows if row[0] is not None),
+            is_subscribed=bool(rows) and rows[0][1],
+            was_subscribed=bool(rows) and rows[0][2],
+        )
+        self._group_state = state
+        return state
+
+    def clear_group_state(self):
+        """Forget the groups and the subscription status kept on this object."""
+        self.__dict__.pop("_group_state", None)
+        self.__dict__.pop("permission_resolver", None)
+
+    @staticmethod
+    def clear_groups_cache(user_ids: Iterable[int]):
+        """Forget the cached groups and subscription status of those users.
+
+        The shared cache of their groups is invalidated,
+        and so is the state kept on the user of the current request.
+        Other instances of those users must be cleared
+        with [clear_group_state][core.models.User.clear_group_state].
+        """
+        from core.middleware import get_signal_request
+
+        user_ids = set(user_ids)
+        cache.delete_many([f"user_{pk}_groups" for pk in user_ids])
+        request_user = getattr(get_signal_request(), "_cached_user", None)
+        if isinstance(request_user, User) and request_user.pk in user_ids:
+            request_user.clear_group_state()
+
+    @property
     def was_subscribed(self) -> bool:
-        if "is_subscribed" in self.__dict__ and self.is_subscribed:
-            # if the user is currently subscribed, he is an old subscriber too
-            # if the property has already been cached, avoid another request
-            return True
-        return self.subscriptions.exists()
+        return self.group_state.was_subscribed
 
-    @cached_property
+    @property
     def is_subscribed(self) -> bool:
-        if "was_subscribed" in self.__dict__ and not self.was_subscribed:
-            # if the user never subscribed, he cannot be a subscriber now.
-            # if the property has already been cached, avoid another request
-            return False
-        return self.subscriptions.filter(
-            subscription_start__lte=timezone.now(), subscription_end__gte=timezone.now()
-        ).exists()
+        return self.group_state.is_subscribed
 
     @cached_property
     def account_balance(self):
@@ -365,30 +510,33 @@ class User(AbstractUser):
         Either a group id or a group name must be provided.
         If both are passed, only the id will be considered.
 
-        The group will be fetched using the given parameter.
+        If a name is given, the group will be fetched using it.
         If no group is found, return False.
-        If a group is found, check if this user is in the latter.
+        The id of the group is then checked against the
+        [group_state][core.models.User.group_state] of the user,
+        so that only the first call of the request hits the database.
 
         Returns:
              True if the user is the group, else False
         """
-        if pk is not None:
-            group: Optional[Group] = get_group(pk=pk)
-        elif name is not None:
+        if pk is None:
+            if name is None:
+                raise ValueError(
+                    "You must either provide the id or the name of the group"
+                )
             group: Optional[Group] = get_group(name=name)
-        else:
-            raise ValueError("You must either provide the id or the name of the group")
-        if group is None:
-            return False
-        if group.id == settings.SITH_GROUP_PUBLIC_ID:
+            if group is None:
+                return False
+            pk = group.id
+        if pk == settings.SITH_GROUP_PUBLIC_ID:
             return True
-        if group.id == settings.SITH_GROUP_SUBSCRIBERS_ID:
+        if pk == settings.SITH_GROUP_SUBSCRIBERS_ID:
             return self.is_subscribed
-        if group.id == settings.SITH_GROUP_OLD_SUBSCRIBERS_ID:
+        if pk == settings.SITH_GROUP_OLD_SUBSCRIBERS_ID:
             return self.was_subscribed
-        if group.id == settings.SITH_GROUP_ROOT_ID:
+        if pk == settings.SITH_GROUP_ROOT_ID:
             return self.is_root
-        return group in self.cached_groups
+        return pk in self.group_state.group_ids
 
     @property
     def cached_groups(self) -> list[Group]:
@@ -405,11 +553,15 @@ class User(AbstractUser):
         return groups
 
     @cached_property
+    def permission_resolver(self) -> PermissionResolver:
+        """The object to check the permissions of this user on lists of objects."""
+        return PermissionResolver(self)
+
+    @property
     def is_root(self) -> bool:
         if self.is_superuser:
             return True
-        root_id = settings.SITH_GROUP_ROOT_ID
-        return any(g.id == root_id for g in self.cached_groups)
+        return settings.SITH_GROUP_ROOT_ID in self.group_state.group_ids
 
     @cached_property
     def is_board_member(self) -> bool:
@@ -522,6 +674,14 @@ class User(AbstractUser):
     ) -> set[User.godfathers.through]:
         """Get the family of the user, with the given depth.
 
+        The whole family is fetched in a single query,
+        with a recursive CTE which walks the godfathers
+        and the godchildren of the user at the same time.
+        Each returned relationship has a `depth` attribute,
+        which is the number of generations between the user
+        and the godchild of the relationship
+        (or its godfather, if the relationship is a godchildren one).
+
         Args:
             godfathers_depth: The number of generations of godfathers to fetch
             godchildren_depth: The number of generations of godchildren to fetch
@@ -529,26 +689,53 @@ class User(AbstractUser):
         Returns:
             A list of family relationships in this user's family
         """
-        res = []
-        for depth, key, reverse_key in [
-            (godfathers_depth, "from_user_id", "to_user_id"),
-            (godchildren_depth, "to_user_id", "from_user_id"),
-        ]:
-            if depth == 0:
-                continue
-            links = list(User.godfathers.through.objects.filter(**{key: self.id}))
-            res.extend(links)
-            for _ in range(1, depth):  # noqa: F402 we don't care about gettext here
-                ids = [getattr(c, reverse_key) for c in links]
-                links = list(
-                    User.godfathers.through.objects.filter(
-                        **{f"{key}__in": ids}
-                    ).exclude(id__in=[r.id for r in res])
+        if godfathers_depth == 0 and godchildren_depth == 0:
+            return set()
+        through = User.godfathers.through
+        table = connection.ops.quote_name(through._meta.db_table)
+        # The `direction` column tells if the relationship was reached
+        # by walking up the godfathers (0) or down the godchildren (1).
+        # As the depth is bounded, cycles in the family are not an issue ;
+        # relationships reached through several paths are deduplicated
+        # in the final select.
+        query = f"""
+            WITH RECURSIVE family(id, from_user_id, to_user_id, depth, direction)
+            AS (
+                SELECT id, from_user_id, to_user_id, 1, 0
+                FROM {table}
+                WHERE from_user_id = %(user)s AND %(godfathers_depth)s > 0
+              UNION ALL
+                SELECT id, from_user_id, to_user_id, 1, 1
+                FROM {table}
+                WHERE to_user_id = %(user)s AND %(godchildren_depth)s > 0
+              UNION ALL
+                SELECT link.id, link.from_user_id, link.to_user_id,
+                       family.depth + 1, family.direction
+                FROM {table} link
+                INNER JOIN family ON (
+                    family.direction = 0
+                    AND link.from_user_id = family.to_user_id
+                    AND family.depth < %(godfathers_depth)s
+                ) OR (
+                    family.direction = 1
+                    AND link.to_user_id = family.from_user_id
+                    AND family.depth < %(godchildren_depth)s
                 )
-                if not links:
-                    break
-                res.extend(links)
-        return set(res)
+            )
+            SELECT id, from_user_id, to_user_id, MIN(depth) AS depth
+            FROM family
+            GROUP BY id, from_user_id, to_user_id
+        """
+        return set(
+            through.objects.raw(
+                query,
+                {
+                    "user": self.id,
+                    "godfathers_depth": godfathers_depth,
+                    "godchildren_depth": godchildren_depth,
+                },
+            )
+        )
 
     def email_user(self, subject, message, from_email=None, **kwargs):
         """Sends an email to this User."""
@@ -721,6 +908,10 @@ class AnonymousUser(AuthAnonymousUser):
     def forum_infos(self):
         raise PermissionDenied
 
+    @cached_property
+    def permission_resolver(self) -> PermissionResolver:
+        return PermissionResolver(self)
+
     @property
     def favorite_topics(self):
         raise PermissionDenied
@@ -839,6 +1030,22 @@ def get_thumbnail_directory(instance, filename):
     return "./.thumbnails/{0}/{1}".format(instance.get_parent_path(), filename)
 
 
+@dataclass(frozen=True)
+class FileDeletionReport:
+    """What has been freed by the deletion of trees of SithFiles."""
+
+    nb_rows: int
+    """The number of deleted rows, including the related objects."""
+    deleted: dict[str, int]
+    """The number of deleted rows for each model."""
+    nb_files: int
+    """The number of deleted SithFiles."""
+    nb_media: int
+    """The number of media files removed from the storage."""
+    size: int
+    """The size of the deleted files, in bytes."""
+
+
 class SithFile(models.Model):
     name = models.CharField(_("file name"), max_length=256, blank=False)
     parent = models.ForeignKey(
@@ -885,6 +1092,20 @@ class SithFile(models.Model):
     is_folder = models.BooleanField(_("is folder"), default=True, db_index=True)
     mime_type = models.CharField(_("mime type"), max_length=30)
     size = models.IntegerField(_("size"), default=0)
+    width = models.PositiveIntegerField(
+        _("width"), null=True, blank=True, help_text=_("Only set for images.")
+    )
+    height = models.PositiveIntegerField(
+        _("height"), null=True, blank=True, help_text=_("Only set for images.")
+    )
+    rotation = models.PositiveSmallIntegerField(
+        _("rotation"),
+        default=0,
+        help_text=_(
+            "The angle, in degrees counter-clockwise, by which the image "
+            "is rotated in its compressed version and its thumbnail."
+        ),
+    )  # The original file is kept untouched, so that it isn't re-encoded
     date = models.DateTimeField(_("date"), default=timezone.now)
     is_moderated = models.BooleanField(_("is moderated"), default=False)
     moderator = models.ForeignKey(
@@ -899,22 +1120,62 @@ class SithFile(models.Model):
     is_in_sas = models.BooleanField(
         _("is in the SAS"), default=False, db_index=True
     )  # Allows to query this flag, updated at each call to save()
+    album_date = models.DateTimeField(
+        _("album date"),
+        null=True,
+        blank=True,
+        editable=False,
+        help_text=_("The date of the album of this file, if it is a SAS picture."),
+    )  # Allows to sort the pictures without joining their album, updated by save()
+    tree_path = models.TextField(
+        _("tree path"),
+        blank=True,
+        default="",
+        editable=False,
+        db_index=True,
+        help_text=_(
+            "The ids of the ancestors of this file and of the file itself, "
+            "separated by slashes."
+        ),
+    )  # Allows to query a whole subtree at once, updated by save()
 
     class Meta:
         verbose_name = _("file")
+        indexes = [
+            # The ordering of the SAS pictures, see `sas.models.Picture.ALBUM_KEY`
+            models.Index(
+                Coalesce("album_date", "date").desc(),
+                "date",
+                "id",
+                name="core_sithfile_album_order",
+            )
+        ]
 
     def __str__(self):
         return self.get_parent_path() + "/" + self.name
 
     def save(self, *args, **kwargs):
-        sas = SithFile.objects.filter(id=settings.SITH_SAS_ROOT_DIR_ID).first()
-        self.is_in_sas = sas in self.get_parent_list() or self == sas
+        ancestor_ids = self.get_ancestor_ids()
+        self.is_in_sas = (
+            settings.SITH_SAS_ROOT_DIR_ID in ancestor_ids
+            or self.id == settings.SITH_SAS_ROOT_DIR_ID
+        )
+        if self.is_in_sas and not self.is_folder and self.parent is not None:
+            self.album_date = self.parent.date
+        else:
+            self.album_date = None
         copy_rights = False
         if self.id is None:
             copy_rights = True
         super().save(*args, **kwargs)
+        self._update_tree_path(ancestor_ids)
         if copy_rights:
             self.copy_rights()
+        elif self.is_in_sas and self.is_folder:
+            # the date of the album may have changed
+            SithFile.objects.filter(parent=self, is_folder=False).update(
+                album_date=self.date
+            )
         if self.is_in_sas:
             for user in User.objects.filter(
                 groups__id__in=[settings.SITH_GROUP_SAS_ADMIN_ID]
@@ -926,6 +1187,97 @@ class SithFile(models.Model):
                     param="1",
                 ).save()
 
+    def _update_tree_path(self, ancestor_ids: list[int]):
+        """Set the tree path of this file, and of its descendants if it moved.
+
+        The id of the file is part of its path,
+        so it can only be computed once the file is saved.
+        """
+        old_path = self.tree_path
+        self.tree_path = self._build_tree_path(ancestor_ids)
+        if self.tree_path == old_path:
+            return
+        SithFile.objects.filter(id=self.id).update(tree_path=self.tree_path)
+        if old_path:
+            # The file has been moved : replace the beginning
+            # of the path of all its descendants,
+            # and update the fields which depend on the SAS.
+            album_date = Value(None, output_field=models.DateTimeField())
+            if self.is_in_sas:
+                parent_date = SithFile.objects.filter(id=OuterRef("parent_id"))
+                album_date = Case(
+                    When(is_folder=False, then=Subquery(parent_date.values("date"))),
+                    default=album_date,
+                )
+            SithFile.objects.filter(tree_path__startswith=old_path).exclude(
+                id=self.id
+            ).update(
+                tree_path=Concat(
+                    Value(self.tree_path),
+                    Substr("tree_path", len(old_path) + 1),
+                    output_field=models.TextField(),
+                ),
+                is_in_sas=self.is_in_sas,
+                album_date=album_date,
+            )
+
+    @classmethod
+    def fill_tree_paths(cls) -> int:
+        """Compute the tree path of the files which don't have one.
+
+        `save()` maintains the tree paths,
+        but the files created with `bulk_create` have none.
+        Paths are computed one level of depth at a time, from the roots,
+        so this costs a single query when all the paths are known.
+
+        Returns:
+            The number of files whose path has been computed.
+        """
+        missing = SithFile.objects.filter(tree_path="")
+        nb_missing = missing.count()
+        id_as_str = Cast("id", output_field=models.TextField())
+        parent_path = Subquery(
+            SithFile.objects.filter(id=OuterRef("parent_id")).values("tree_path")[:1]
+        )
+        total = 0
+        while total < nb_missing:
+            # the roots, and the files whose parent has a path
+            nb_rows = missing.filter(
+                Q(parent=None) | Q(parent__tree_path__gt="")
+            ).update(
+                tree_path=Concat(
+                    Coalesce(parent_path, Value("/"), output_field=models.TextField()),
+                    id_as_str,
+                    Value("/"),
+                    output_field=models.TextField(),
+                )
+            )
+            if nb_rows == 0:
+                break
+            total += nb_rows
+        return total
+
+    def _build_tree_path(self, ancestor_ids: list[int]) -> str:
+        return "/" + "".join(f"{pk}/" for pk in [*ancestor_ids, self.id])
+
+    def get_tree_path(self) -> str:
+        """Get the tree path of this file, even if it hasn't been stored yet."""
+        return self.tree_path or self._build_tree_path(self.get_ancestor_ids())
+
+    def get_descendants(self, *, include_self: bool = False) -> QuerySet[SithFile]:
+        """Get all the files in the subtree of this file, with a single query.
+
+        The files created with `bulk_create` are found
+        once their path has been computed, so it is done first.
+        """
+        SithFile.fill_tree_paths()
+        descendants = SithFile.objects.filter(
+            tree_path__startswith=self.get_tree_path()
+        )
+        if not include_self:
+            descendants = descendants.exclude(id=self.id)
+        return descendants
+
     def is_owned_by(self, user: User) -> bool:
         if user.is_anonymous:
             return False
@@ -950,25 +1302,64 @@ class SithFile(models.Model):
             return user.can_view(self.scrub_of)
         return False
 
-    def delete(self, *args, **kwargs):
-        for c in self.children.all():
-            c.delete()
-        self.file.delete()
-        if self.compressed:
-            self.compressed.delete()
-        if self.thumbnail:
-            self.thumbnail.delete()
-        return super().delete()
+    def delete(self, *args, **kwargs) -> tuple[int, dict[str, int]]:
+        report = SithFile.delete_trees([self])
+        return report.nb_rows, report.deleted
+
+    @classmethod
+    def delete_trees(cls, files: Iterable[SithFile]) -> FileDeletionReport:
+        """Delete those files, all their descendants and their media.
+
+        All the files of the subtrees are fetched with a single query,
+        then deleted in bulk, in a transaction.
+        The media files (including the compressed versions
+        and the thumbnails) are removed from the storage
+        once the transaction is committed, by a background thread
+        (see [delete_media_files][core.utils.delete_media_files]).
+        If the transaction is rolled back, they are kept.
+
+        Returns:
+            What has been freed by the deletion.
+        """
+        # the files created with bulk_create have no path,
+        # but their media must be deleted too
+        SithFile.fill_tree_paths()
+        condition = Q(pk__in=[])
+        for file in files:
+            condition |= Q(tree_path__startswith=file.get_tree_path())
+        with transaction.atomic():
+            rows = list(
+                SithFile.objects.filter(condition).values_list(
+                    "id", "file", "compressed", "thumbnail", "size"
+                )
+            )
+            nb_rows, deleted = SithFile.objects.filter(
+                id__in=[row[0] for row in rows]
+            ).delete()
+            media = [name for row in rows for name in row[1:4] if name]
+            transaction.on_commit(lambda: delete_media_files(media))
+        report = FileDeletionReport(
+            nb_rows=nb_rows,
+            deleted=deleted,
+            nb_files=len(rows),
+            nb_media=len(media),
+            size=sum(row[4] for row in rows),
+        )
+        logging.getLogger("main").info(
+            "Deleted %d files (%d bytes), %d media files are being removed",
+            report.nb_files,
+            report.size,
+            report.nb_media,
+        )
+        return report
 
     def clean(self):
         """Cleans up the file."""
         super().clean()
         if "/" in self.name:
             raise ValidationError(_("Character '/' not authorized in name"))
-        if self == self.parent:
-            raise ValidationError(_("Loop in folder tree"), code="loop")
         if self == self.parent or (
-            self.parent is not None and self in self.get_parent_list()
+            self.id is not None and self.id in self.get_ancestor_ids()
         ):
             raise ValidationError(_("Loop in folder tree"), code="loop")
         if self.parent and self.parent.is_file:
@@ -1009,14 +1400,12 @@ class SithFile(models.Model):
         Args:
             only_folders: If True, only apply the rights to SithFiles that are folders.
         """
-        file_ids = []
-        explored_ids = [self.id]
-        while len(explored_ids) > 0:  # find all children recursively
-            file_ids.extend(explored_ids)
-            next_level = SithFile.objects.filter(parent_id__in=explored_ids)
-            if only_folders:
-                next_level = next_level.filter(is_folder=True)
-            explored_ids = list(next_level.values_list("id", flat=True))
+        files = self.get_descendants(include_self=True)
+        if only_folders:
+            # files can't have children, so all the folders of the subtree
+            # are reachable through folders only
+            files = files.filter(Q(is_folder=True) | Q(id=self.id))
+        file_ids = list(files.values_list("id", flat=True))
         for through in (SithFile.view_groups.through, SithFile.edit_groups.through):
             # force evaluation. Without this, the iterator yields nothing
             groups = list(
@@ -1052,8 +1441,8 @@ class SithFile(models.Model):
     def _repair_fs(self):
         """Rebuilds recursively the filesystem as it should be regarding the DB tree."""
         if self.is_folder:
-            for c in self.children.all():
-                c._repair_fs()
+            for f in self.get_descendants().filter(is_folder=False):
+                f._repair_fs()
             return
         elif not self._check_path_consistence():
             # First get future parent path and the old file name
@@ -1100,8 +1489,8 @@ class SithFile(models.Model):
 
     def _check_fs(self):
         if self.is_folder:
-            for c in self.children.all():
-                c._check_fs()
+            for f in self.get_descendants().filter(is_folder=False):
+                f._check_path_consistence()
             return
         else:
             self._check_path_consistence()
@@ -1122,13 +1511,30 @@ class SithFile(models.Model):
 
         return Album.objects.filter(id=self.id).first()
 
-    def get_parent_list(self):
-        parents = []
-        current = self.parent
-        while current is not None:
-            parents.append(current)
-            current = current.parent
-        return parents
+    def get_ancestor_ids(self) -> list[int]:
+        """Get the ids of the ancestors of this file, from the root to the parent.
+
+        The ids are read from the tree path of the parent,
+        so that they are right even if the parent has been changed
+        and the file not saved yet.
+        """
+        if self.parent_id is None:
+            return []
+        parent = self.parent
+        if not parent.tree_path:
+            # the path of the parent hasn't been computed yet
+            return [*parent.get_ancestor_ids(), parent.id]
+        return [int(pk) for pk in parent.tree_path.strip("/").split("/")]
+
+    def get_parent_list(self) -> list[SithFile]:
+        """Get the ancestors of this file, from the parent to the root."""
+        if self.parent_id is None:
+            return []
+        ancestor_ids = self.get_ancestor_ids()[::-1]
+        if len(ancestor_ids) == 1:
+            return [self.parent]
+        ancestors = SithFile.objects.in_bulk(ancestor_ids)
+        return [ancestors[pk] for pk in ancestor_ids if pk in ancestors]
 
     def get_parent_path(self):
         return "/" + "/".join([p.name for p in self.get_parent_list()[::-1]])
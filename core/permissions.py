@@ -0,0 +1,237 @@
+"""Resolution of the permissions of a user on many objects at once.
+
+[User.can_view][core.models.User.can_view] and
+[User.can_edit][core.models.User.can_edit] check the groups
+of a single object, one group at a time.
+When a whole list of objects must be checked, this costs several
+queries per object.
+
+The [PermissionResolver][core.permissions.PermissionResolver]
+computes once the ids of all the groups the user is in,
+then checks the groups of all the objects in a single query.
+There is one resolver per user object, which is accessible
+with the `permission_resolver` attribute of the user ;
+as `request.user` is created for each request, the resolver lives
+as long as the request.
+
+Example:
+    ```python
+    forums = Forum.objects.all()
+    viewable = request.user.permission_resolver.bulk_can_view(forums)
+    ```
+"""
+
+from __future__ import annotations
+
+import operator
+from functools import cached_property, reduce
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Exists, Model, OuterRef, Q, QuerySet
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
+    from core.models import AnonymousUser, User
+
+
+class PermissionResolver:
+    """Check the permissions of a user on lists of objects.
+
+    The checks give the same results as
+    [User.can_view][core.models.User.can_view] and
+    [User.can_edit][core.models.User.can_edit],
+    but the groups of all the objects are checked in a single query.
+    The rules which are specific to a model (like `is_owned_by`
+    or `can_be_viewed_by`) are still checked object by object,
+    but only for the objects that the groups of the user don't give access to.
+    """
+
+    def __init__(self, user: User | AnonymousUser):
+        self.user = user
+
+    @cached_property
+    def group_ids(self) -> frozenset[int]:
+        """The ids of all the groups the user is in.
+
+        This includes the groups which aren't stored in the database,
+        like the public group or the subscribers group.
+        """
+        ids = {settings.SITH_GROUP_PUBLIC_ID}
+        if self.user.is_anonymous:
+            return frozenset(ids)
+        implicit_groups = {
+            settings.SITH_GROUP_SUBSCRIBERS_ID: self.user.is_subscribed,
+            settings.SITH_GROUP_OLD_SUBSCRIBERS_ID: self.user.was_subscribed,
+            settings.SITH_GROUP_ROOT_ID: self.user.is_root,
+        }
+        ids |= self.user.group_state.group_ids - set(implicit_groups)
+        ids |= {pk for pk, is_in in implicit_groups.items() if is_in}
+        return frozenset(ids)
+
+    def is_in_group(self, pk: int) -> bool:
+        return pk in self.group_ids
+
+    def _groups_condition(self, model: type[Model], *, edit: bool) -> Q | None:
+        """Build the condition that the objects of the model must fulfill
+        to be viewable (or editable) thanks to the groups of the user.
+
+        The groups are checked with EXISTS subqueries on the through tables
+        of the `view_groups` and `edit_groups` fields of the model,
+        so that no join duplicates the objects.
+
+        Returns:
+            The condition, or None if the model has no group field.
+        """
+        if self.user.is_anonymous:
+            # the anonymous user can view what the public group can view,
+            # but it can't edit anything
+            fields = [] if edit else ["view_groups"]
+        else:
+            fields = ["edit_groups"] if edit else ["view_groups", "edit_groups"]
+        conditions = []
+        for name in fields:
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            through = field.remote_field.through
+            conditions.append(
+                Exists(
+                    through.objects.filter(
+                        **{
+                            field.m2m_field_name(): OuterRef("pk"),
+                            f"{field.m2m_reverse_field_name()}__in": self.group_ids,
+                        }
+                    )
+                )
+            )
+        if not self.user.is_anonymous:
+            try:
+                model._meta.get_field("owner_group")
+                conditions.append(Q(owner_group__in=self.group_ids))
+            except FieldDoesNotExist:
+                pass
+        if not conditions:
+            return None
+        return reduce(operator.or_, conditions)
+
+    def filter_viewable(self, queryset: QuerySet) -> QuerySet:
+        """Filter the objects that the user can view thanks to its groups.
+
+        Warning:
+            Only the groups are checked : the objects that the user
+            can view because of a rule specific to the model
+            (for example, because the user owns them) are filtered out.
+            If such rules matter, use
+            [bulk_can_view][core.permissions.PermissionResolver.bulk_can_view].
+        """
+        if self.user.is_root:
+            return queryset.all()
+        condition = self._groups_condition(queryset.model, edit=False)
+        if condition is None:
+            return queryset.none()
+        return queryset.filter(condition)
+
+    def filter_editable(self, queryset: QuerySet) -> QuerySet:
+        """Filter the objects that the user can edit thanks to its groups.
+
+        Warning:
+            Just like
+            [filter_viewable][core.permissions.PermissionResolver.filter_viewable],
+            only the groups are checked.
+        """
+        if self.user.is_root:
+            return queryset.all()
+        condition = self._groups_condition(queryset.model, edit=True)
+        if condition is None:
+            return queryset.none()
+        return queryset.filter(condition)
+
+    def _allowed_by_groups(self, objects: list, *, edit: bool) -> set:
+        """Return the pks of the objects that the groups of the user give access to."""
+        if not objects or not isinstance(objects[0], Model):
+            return set()
+        model = type(objects[0])
+        condition = self._groups_condition(model, edit=edit)
+        if condition is None:
+            return set()
+        pks = [o.pk for o in objects]
+        return set(
+            model._base_manager.filter(condition, pk__in=pks).values_list(
+                "pk", flat=True
+            )
+        )
+
+    def _can_edit_otherwise(self, obj) -> bool:
+        """Check the rules of User.can_edit which don't depend on the groups."""
+        user = self.user
+        if user.is_anonymous:
+            return False
+        if hasattr(obj, "can_be_edited_by") and obj.can_be_edited_by(user):
+            return True
+        if obj == user:
+            return True
+        return hasattr(obj, "is_owned_by") and obj.is_owned_by(user)
+
+    def _can_view_otherwise(self, obj) -> bool:
+        """Check the rules of User.can_view which don't depend on the groups."""
+        if hasattr(obj, "can_be_viewed_by") and obj.can_be_viewed_by(self.user):
+            return True
+        return self._can_edit_otherwise(obj)
+
+    def bulk_can_view[T](self, objects: Iterable[T]) -> list[T]:
+        """Return the objects that the user can view, in the same order.
+
+        All the objects must be instances of the same model.
+        """
+        objects = list(objects)
+        if self.user.is_root:
+            return objects
+        allowed = self._allowed_by_groups(objects, edit=False)
+        return [
+            o
+            for o in objects
+            if getattr(o, "pk", None) in allowed or self._can_view_otherwise(o)
+        ]
+
+    def bulk_can_edit[T](self, objects: Iterable[T]) -> list[T]:
+        """Return the objects that the user can edit, in the same order.
+
+        All the objects must be instances of the same model.
+        """
+        objects = list(objects)
+        if self.user.is_root:
+            return objects
+        allowed = self._allowed_by_groups(objects, edit=True)
+        return [
+            o
+            for o in objects
+            if getattr(o, "pk", None) in allowed or self._can_edit_otherwise(o)
+        ]
+
+    def can_edit(self, obj) -> bool:
+        """Same as [User.can_edit][core.models.User.can_edit]."""
+        if self.user.is_anonymous:
+            return False
+        if hasattr(obj, "can_be_edited_by") and obj.can_be_edited_by(self.user):
+            return True
+        if self.user.is_root or obj == self.user:
+            return True
+        if getattr(obj, "pk", None) in self._allowed_by_groups([obj], edit=True):
+            return True
+        return hasattr(obj, "is_owned_by") and obj.is_owned_by(self.user)
+
+    def can_view(self, obj) -> bool:
+        """Same as [User.can_view][core.models.User.can_view]."""
+        # like User.can_view, check the rules of the model first,
+        # as they are usually cheaper than the groups
+        if hasattr(obj, "can_be_viewed_by") and obj.can_be_viewed_by(self.user):
+            return True
+        if self.user.is_root:
+            return True
+        if getattr(obj, "pk", None) in self._allowed_by_groups([obj], edit=False):
+            return True
+        return self._can_edit_otherwise(obj)
@@ -1,15 +1,48 @@
 from django.core.cache import cache
-from django.db.models.signals import m2m_changed
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 
 from core.models import User
+from subscription.models import Subscription
 
 
 @receiver(m2m_changed, sender=User.groups.through, dispatch_uid="user_groups_changed")
-def user_groups_changed(sender, instance: User, **kwargs):
+def user_groups_changed(
+    sender, instance, *, reverse: bool, pk_set: set | None, **kwargs
+):
     """Clear the cached groups of the user."""
     # As a m2m relationship doesn't live within the model
     # but rather on an intermediary table, there is no
     # model method to override, meaning we must use
     # a signal to invalidate the cache when a user is removed from a group
-    cache.delete(f"user_{instance.pk}_groups")
+    if not reverse:
+        instance.clear_group_state()
+        User.clear_groups_cache([instance.pk])
+        return
+    # the users were added to (or removed from) the group `instance`
+    if pk_set is None:
+        # the group is being cleared : all its users are concerned
+        pk_set = instance.users.values_list("id", flat=True)
+    User.clear_groups_cache(pk_set)
+
+
+@receiver(post_save, sender=Subscription, dispatch_uid="subscription_saved")
+@receiver(post_delete, sender=Subscription, dispatch_uid="subscription_deleted")
+def subscription_changed(sender, instance: Subscription, **kwargs):
+    """Clear the cached subscription status of the subscriber."""
+    if Subscription.member.is_cached(instance):
+        instance.member.clear_group_state()
+    User.clear_groups_cache([instance.member_id])
+
+
+@receiver(
+    m2m_changed, sender=User.godfathers.through, dispatch_uid="user_family_changed"
+)
+@receiver(post_delete, sender=User, dispatch_uid="user_deleted")
+def family_changed(sender, **kwargs):
+    """Invalidate the cached family graphs.
+
+    Any change in a family may change the graphs of all its members,
+    so the version of all the graphs is changed at once.
+    """
+    cache.delete("family_graph_version")
@@ -14,6 +14,8 @@
 #
 
 from datetime import date, timedelta
+from io import BytesIO
+from pathlib import Path
 from smtplib import SMTPException
 
 import freezegun
@@ -28,16 +30,28 @@ from django.utils.timezone import now
 from django.views.generic import View
 from django.views.generic.base import ContextMixin
 from model_bakery import baker
+from PIL import Image
 from pytest_django.asserts import assertInHTML, assertRedirects
 
 from antispam.models import ToxicDomain
 from club.models import Club, Membership
+from core.baker_recipes import active_subscription
 from core.markdown import markdown
-from core.models import AnonymousUser, Group, Page, User
-from core.utils import get_semester_code, get_start_of_semester
+from core.models import AnonymousUser, Group, Page, User, get_group, group_memo
+from core.utils import (
+    ImageVariant,
+    get_semester_code,
+    get_start_of_semester,
+    resize_image,
+    resize_image_variants,
+)
 from core.views import AllowFragment
 from sith import settings
 
+SAMPLE_IMAGES = sorted(
+    (Path(__file__).parent.parent / "fixtures" / "images" / "sas").rglob("*.jpg")
+)
+
 
 @pytest.mark.django_db
 class TestUserRegistration:
@@ -406,18 +420,46 @@ class TestUserIsInGroup(TestCase):
 
         cache.clear()
         # Test when the user is in the group
-        with self.assertNumQueries(2):
+        with self.assertNumQueries(1):
             self.public_user.is_in_group(pk=group_in.id)
         with self.assertNumQueries(0):
             self.public_user.is_in_group(pk=group_in.id)
 
         group_not_in = baker.make(Group)
         cache.clear()
-        # Test when the user is not in the group
-        with self.assertNumQueries(2):
-            self.public_user.is_in_group(pk=group_not_in.id)
+        # Test when the user is not in the group.
+        # The groups of the user have already been fetched with the first call.
         with self.assertNumQueries(0):
             self.public_user.is_in_group(pk=group_not_in.id)
+            self.public_user.is_in_group(pk=settings.SITH_GROUP_SUBSCRIBERS_ID)
+            self.public_user.is_in_group(pk=settings.SITH_GROUP_OLD_SUBSCRIBERS_ID)
+        with self.assertNumQueries(1):
+            self.public_user.is_in_group(name=group_not_in.name)
+
+    def test_group_memo(self):
+        """Test that groups are kept in memory during a request."""
+        group_memo.start()
+        cache.clear()
+        with self.assertNumQueries(1):
+            get_group(pk=self.sas_admin.id)
+        cache.clear()
+        with self.assertNumQueries(0):
+            assert get_group(pk=self.sas_admin.id) == self.sas_admin
+        assert group_memo.hits == 1
+        assert group_memo.misses == 1
+        group_memo.stop()
+        cache.clear()
+        with self.assertNumQueries(1):
+            get_group(pk=self.sas_admin.id)
+
+    def test_cache_properly_cleared_subscription(self):
+        """Test that the subscription status is updated
+        when the user subscribes.
+        """
+        assert not self.public_user.is_in_group(pk=settings.SITH_GROUP_SUBSCRIBERS_ID)
+        active_subscription.make(member=self.public_user)
+        assert self.public_user.is_in_group(pk=settings.SITH_GROUP_SUBSCRIBERS_ID)
+        assert self.public_user.was_subscribed
 
     def test_cache_properly_cleared_membership(self):
         """Test that when the membership of a user end,
@@ -538,3 +580,47 @@ def test_allow_fragment_mixin():
     assert not TestAllowFragmentView.as_view()(request)
     request.headers = {"HX-Request": True, **base_headers}
     assert TestAllowFragmentView.as_view()(request)
+
+
+class TestResizeImage:
+    @pytest.mark.parametrize("path", SAMPLE_IMAGES, ids=lambda p: p.name)
+    def test_variants(self, path: Path):
+        """Test that the variants have the same size as separate resizes."""
+        w, h = Image.open(path).size
+        variants = [
+            ImageVariant(200, "webp"),
+            ImageVariant(None, "jpeg", optimize=False),
+            ImageVariant(1200, "webp"),
+        ]
+        res = resize_image_variants(Image.open(path), variants)
+        assert len(res) == 3
+        expected_sizes = [
+            Image.open(resize_image(Image.open(path), edge, "webp")).size
+            for edge in (200, max(w, h), 1200)
+        ]
+        for file, variant, size in zip(res, variants, expected_sizes, strict=True):
+            im = Image.open(BytesIO(file.read()))
+            assert im.format == variant.img_format.upper()
+            assert im.size == size
+
+    def test_jpeg_draft(self):
+        """Test that a big JPEG is decoded at a reduced scale."""
+        content = BytesIO()
+        Image.new("RGB", (4000, 3000)).save(content, format="JPEG")
+        im = Image.open(content)
+        thumb = resize_image(im, 200, "webp")
+        # the image only needs to be decoded at 1/8 of its size,
+        # to produce a 200px thumbnail
+        assert im.size == (500, 375)
+        assert Image.open(BytesIO(thumb.read())).size == (200, 150)
+
+    def test_png_no_draft(self):
+        """Test that the images which can't be drafted are resized normally."""
+        content = BytesIO()
+        Image.new("RGBA", (1000, 500)).save(content, format="PNG")
+        thumb, jpeg = resize_image_variants(
+            Image.open(content),
+            [ImageVariant(100, "png"), ImageVariant(400, "jpeg")],
+        )
+        assert Image.open(BytesIO(thumb.read())).size == (100, 50)
+        assert Image.open(BytesIO(jpeg.read())).size == (400, 200)
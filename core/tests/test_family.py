@@ -173,15 +173,44 @@ class TestFetchFamilyApi(TestCase):
         )
 
     def test_nb_queries(self):
-        # The number of queries should be 1 per level of existing depth.
+        # The whole family is fetched in a single query, whatever the depth.
         with self.assertNumQueries(0):
             self.main_user.get_family(godfathers_depth=0, godchildren_depth=0)
-        with self.assertNumQueries(3):
+        with self.assertNumQueries(1):
             self.main_user.get_family(godfathers_depth=3, godchildren_depth=0)
-        with self.assertNumQueries(3):
+        with self.assertNumQueries(1):
             self.main_user.get_family(godfathers_depth=0, godchildren_depth=3)
-        with self.assertNumQueries(6):
-            self.main_user.get_family(godfathers_depth=3, godchildren_depth=3)
-        with self.assertNumQueries(4):
-            # If a level is empty, the next ones should not be queried.
-            self.main_user.get_family(godfathers_depth=0, godchildren_depth=10)
+        with self.assertNumQueries(1):
+            self.main_user.get_family(godfathers_depth=10, godchildren_depth=10)
+
+    def test_family_depth(self):
+        relations = self.main_user.get_family(godfathers_depth=3, godchildren_depth=2)
+        depths = {(r.from_user_id, r.to_user_id): r.depth for r in relations}
+        assert depths == {
+            (self.main_user.id, self.users[0].id): 1,
+            (self.main_user.id, self.users[1].id): 1,
+            (self.main_user.id, self.users[2].id): 1,
+            (self.users[1].id, self.users[6].id): 2,
+            (self.users[6].id, self.users[7].id): 3,
+            (self.users[2].id, self.users[10].id): 2,
+            (self.users[3].id, self.main_user.id): 1,
+            (self.users[4].id, self.main_user.id): 1,
+            (self.users[5].id, self.main_user.id): 1,
+            (self.users[11].id, self.users[3].id): 2,
+            (self.users[12].id, self.users[3].id): 2,
+            (self.users[13].id, self.users[4].id): 2,
+            (self.users[14].id, self.users[4].id): 2,
+            (self.users[15].id, self.users[4].id): 2,
+        }
+
+    def test_cache_cleared_on_change(self):
+        """Test that the cached graph is updated when the family changes."""
+        self.client.force_login(self.main_user)
+        url = reverse("api:family_graph", args=[self.main_user.id])
+        self.client.get(url)
+        self.users[10].godfathers.add(self.users[16])
+        response = self.client.get(url)
+        assert {
+            "godfather": self.users[16].id,
+            "godchild": self.users[10].id,
+        } in response.json()["relationships"]
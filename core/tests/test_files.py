@@ -5,6 +5,8 @@ from uuid import uuid4
 
 import pytest
 from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase
 from django.urls import reverse
@@ -15,6 +17,7 @@ from pytest_django.asserts import assertNumQueries
 
 from core.baker_recipes import board_user, old_subscriber_user, subscriber_user
 from core.models import Group, SithFile, User
+from core.utils import media_unlinker
 from sas.models import Picture
 from sith import settings
 
@@ -278,8 +281,10 @@ def test_apply_rights_recursively():
     # those groups should be erased after the function call
     files[1].view_groups.set(groups[6:])
 
-    with assertNumQueries(10):
-        # 1 query for each level of depth (here 4)
+    with assertNumQueries(11):
+        # 1 query to count the files created in bulk, which have no tree path
+        # 1 query to compute their path for each level of depth (here 3)
+        # 1 query to get the whole subtree
         # 1 query to get the view_groups of the first file
         # 1 query to delete the previous view_groups
         # 1 query apply the new view_groups
@@ -290,3 +295,117 @@ def test_apply_rights_recursively():
     ):
         assert set(file.view_groups.all()) == set(groups[:3])
         assert set(file.edit_groups.all()) == set(groups[2:6])
+
+
+@pytest.mark.django_db
+class TestTreePath:
+    def test_tree_path_on_save(self):
+        root = baker.make(SithFile)
+        child = baker.make(SithFile, parent=root)
+        grandchild = baker.make(SithFile, parent=child)
+        assert root.tree_path == f"/{root.id}/"
+        assert grandchild.tree_path == f"/{root.id}/{child.id}/{grandchild.id}/"
+        grandchild.refresh_from_db()
+        assert grandchild.tree_path == f"/{root.id}/{child.id}/{grandchild.id}/"
+        assert grandchild.get_ancestor_ids() == [root.id, child.id]
+        with assertNumQueries(1):
+            assert grandchild.get_parent_list() == [child, root]
+
+    def test_move_subtree(self):
+        """Test that moving a folder updates the path of all its descendants."""
+        old_root, new_root = baker.make(SithFile, _quantity=2)
+        folder = baker.make(SithFile, parent=old_root)
+        files = baker.make(SithFile, parent=folder, _quantity=3)
+        folder.move_to(new_root)
+        for f in SithFile.objects.filter(id__in=[f.id for f in files]):
+            assert f.tree_path == f"/{new_root.id}/{folder.id}/{f.id}/"
+        assert set(new_root.get_descendants()) == {folder, *files}
+        assert not old_root.get_descendants().exists()
+
+    def test_move_to_sas(self):
+        sas = SithFile.objects.get(id=settings.SITH_SAS_ROOT_DIR_ID)
+        folder = baker.make(SithFile, is_folder=True)
+        file = baker.make(SithFile, parent=folder, is_folder=False)
+        sub_folder = baker.make(SithFile, parent=folder, is_folder=True)
+        sub_file = baker.make(SithFile, parent=sub_folder, is_folder=False)
+        assert not folder.is_in_sas
+        folder.move_to(sas)
+        file.refresh_from_db()
+        sub_file.refresh_from_db()
+        assert folder.is_in_sas
+        assert file.is_in_sas
+        assert sub_file.is_in_sas
+        assert file.album_date == folder.date
+        assert sub_file.album_date == sub_folder.date
+
+        # and the other way around
+        sub_folder.refresh_from_db()
+        sub_folder.move_to(baker.make(SithFile, is_folder=True))
+        sub_file.refresh_from_db()
+        assert not sub_file.is_in_sas
+        assert sub_file.album_date is None
+
+    def test_loop_detection(self):
+        root = baker.make(SithFile)
+        child = baker.make(SithFile, parent=root)
+        root.parent = child
+        with pytest.raises(ValidationError):
+            root.clean()
+
+    def test_descendants_created_in_bulk(self):
+        root = baker.make(SithFile)
+        children = baker.make(SithFile, parent=root, _quantity=2, _bulk_create=True)
+        assert set(root.get_descendants()) == set(children)
+
+    def test_deep_tree(self):
+        """Test that the tree path isn't limited in length."""
+        files = [baker.make(SithFile, is_folder=True)]
+        for _ in range(100):
+            files.append(baker.make(SithFile, parent=files[-1], is_folder=True))
+        files[-1].refresh_from_db()
+        assert files[-1].get_ancestor_ids() == [f.id for f in files[:-1]]
+        assert files[0].get_descendants().count() == 100
+
+    def test_fill_tree_paths(self):
+        root = baker.make(SithFile)
+        children = baker.make(SithFile, parent=root, _quantity=2, _bulk_create=True)
+        grandchildren = baker.make(
+            SithFile, parent=iter(children), _quantity=2, _bulk_create=True
+        )
+        assert SithFile.fill_tree_paths() == 4
+        for f in SithFile.objects.filter(id__in=[f.id for f in grandchildren]):
+            assert f.tree_path == f"/{root.id}/{f.parent_id}/{f.id}/"
+
+
+@pytest.mark.django_db
+def test_delete_trees(django_capture_on_commit_callbacks):
+    """Test that a whole subtree and its media are deleted."""
+    root = baker.make(SithFile)
+    folder = baker.make(SithFile, parent=root)
+    sub_folder = baker.make(SithFile, parent=folder)
+    files = [
+        baker.make(
+            SithFile,
+            parent=parent,
+            is_folder=False,
+            size=5,
+            file=SimpleUploadedFile(f"{uuid4()}.txt", b"hello"),
+        )
+        for parent in (folder, sub_folder, sub_folder)
+    ]
+    names = [f.file.name for f in files]
+    assert all(default_storage.exists(name) for name in names)
+    with django_capture_on_commit_callbacks(execute=True):
+        report = SithFile.delete_trees([folder])
+    # the media are removed by a single background thread,
+    # so this waits until the previous tasks are done
+    media_unlinker.submit(lambda: None).result()
+
+    assert report.nb_files == 5
+    assert report.nb_media == 3
+    assert report.size == 15
+    assert not SithFile.objects.filter(
+        id__in=[folder.id, sub_folder.id, *[f.id for f in files]]
+    ).exists()
+    assert SithFile.objects.filter(id=root.id).exists()
+    assert not any(default_storage.exists(name) for name in names)
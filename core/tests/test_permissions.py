@@ -0,0 +1,71 @@
+from typing import Callable
+
+import pytest
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from model_bakery import baker
+
+from core.baker_recipes import subscriber_user
+from core.models import AnonymousUser, Group, SithFile, User
+
+
+@pytest.mark.django_db
+class TestPermissionResolver:
+    @pytest.fixture
+    def groups(self) -> list[Group]:
+        return baker.make(Group, _quantity=2)
+
+    @pytest.fixture
+    def files(self, groups: list[Group]) -> list[SithFile]:
+        files = baker.make(SithFile, _quantity=5)
+        files[0].view_groups.add(groups[0])
+        files[1].edit_groups.add(groups[1])
+        files[2].view_groups.add(settings.SITH_GROUP_PUBLIC_ID)
+        files[3].view_groups.add(settings.SITH_GROUP_SUBSCRIBERS_ID)
+        return files
+
+    @pytest.mark.parametrize(
+        "user_factory",
+        [
+            AnonymousUser,
+            lambda: baker.make(User),
+            subscriber_user.make,
+            lambda: baker.make(User, groups=Group.objects.order_by("-id")[:2]),
+            lambda: baker.make(User, is_superuser=True),
+            lambda: SithFile.objects.order_by("-id").first().owner,
+        ],
+    )
+    def test_same_as_can_view(
+        self, files: list[SithFile], user_factory: Callable[[], User]
+    ):
+        """Test that the resolver gives the same results as User.can_view."""
+        user = user_factory()
+        expected = [f for f in files if user.can_view(f)]
+        assert user.permission_resolver.bulk_can_view(files) == expected
+        assert [f for f in files if user.permission_resolver.can_view(f)] == expected
+        expected = [f for f in files if user.can_edit(f)]
+        assert user.permission_resolver.bulk_can_edit(files) == expected
+
+    def test_filter_viewable(self, files: list[SithFile], groups: list[Group]):
+        user = baker.make(User, groups=groups)
+        qs = SithFile.objects.filter(id__in=[f.id for f in files])
+        assert list(user.permission_resolver.filter_viewable(qs).order_by("id")) == [
+            files[0],
+            files[1],
+            files[2],
+        ]
+        assert list(user.permission_resolver.filter_editable(qs)) == [files[1]]
+
+    def test_num_queries(self, groups: list[Group]):
+        """Test that the number of queries doesn't depend on the number of objects."""
+        user = baker.make(User, groups=groups)
+        files = baker.make(SithFile, owner=user, _quantity=10)
+        for f in files:
+            f.view_groups.add(groups[0])
+        user.permission_resolver.bulk_can_view(files[:1])  # warm up the caches
+        with CaptureQueriesContext(connection) as few:
+            user.permission_resolver.bulk_can_view(files[:2])
+        with CaptureQueriesContext(connection) as many:
+            user.permission_resolver.bulk_can_view(files)
+        assert len(few) == len(many) == 1
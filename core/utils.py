@@ -13,6 +13,12 @@
 #
 #
 
+import itertools
+import logging
+import multiprocessing
+import time
+from collections.abc import Iterable, Sequence
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import date
 
@@ -23,6 +29,8 @@ from typing import Any
 import PIL
 from django.conf import settings
 from django.core.files.base import ContentFile
+from django.core.files.storage import Storage, default_storage
+from django.db import connections
 from django.forms import BaseForm
 from django.http import HttpRequest
 from django.template.loader import render_to_string
@@ -101,6 +109,23 @@ def get_semester_code(d: date | None = None) -> str:
     return "P" + str(start.year)[-2:]
 
 
+@dataclass
+class ImageVariant:
+    """A version of an image produced by
+    [resize_image_variants][core.utils.resize_image_variants].
+
+    Attributes:
+        edge: the length that the greater side of the variant should have.
+            If None, the variant keeps the size of the original image.
+        img_format: the format of the variant ("JPEG", "PNG", "WEBP"...)
+        optimize: Should the variant be optimized ?
+    """
+
+    edge: int | None
+    img_format: str
+    optimize: bool = True
+
+
 def resize_image(
     im: Image, edge: int, img_format: str, *, optimize: bool = True
 ) -> ContentFile:
@@ -112,10 +137,60 @@ def resize_image(
         img_format: the target format of the image ("JPEG", "PNG", "WEBP"...)
         optimize: Should the resized image be optimized ?
     """
+    return resize_image_variants(im, [ImageVariant(edge, img_format, optimize)])[0]
+
+
+def resize_image_variants(
+    im: Image, variants: Sequence[ImageVariant]
+) -> list[ContentFile]:
+    """Resize an image to several sizes at once.
+
+    The image is decoded only once, at the lowest resolution
+    that is enough for the biggest variant
+    (JPEG images can be decoded at 1/2, 1/4 or 1/8 of their size).
+    Then the variants are produced in cascade, from the biggest to the smallest,
+    each one being resized from the previous one instead of the original image.
+
+    Warning:
+        If the image hasn't been loaded yet, it may be loaded at a reduced scale,
+        so its size can be changed by this function.
+
+    Args:
+        im: the image to resize
+        variants: the versions of the image to produce
+
+    Returns:
+        the resized images, in the same order as `variants`
+    """
+    logger = logging.getLogger("main")
     (w, h) = im.size
-    ratio = edge / max(w, h)
-    (width, height) = int(w * ratio), int(h * ratio)
-    return resize_image_explicit(im, (width, height), img_format, optimize=optimize)
+    sizes = []
+    for variant in variants:
+        if variant.edge is None:
+            sizes.append((w, h))
+        else:
+            ratio = variant.edge / max(w, h)
+            sizes.append((int(w * ratio), int(h * ratio)))
+    start = time.perf_counter()
+    _draft(im, max(sizes, key=lambda s: s[0] * s[1]))
+    im.load()
+    logger.debug(
+        f"Decoded a {w}x{h} image at {im.size[0]}x{im.size[1]} "
+        f"in {time.perf_counter() - start:.3f}s"
+    )
+    res: list[ContentFile | None] = [None] * len(variants)
+    for i in sorted(
+        range(len(variants)), key=lambda i: sizes[i][0] * sizes[i][1], reverse=True
+    ):
+        start = time.perf_counter()
+        if sizes[i] != im.size:
+            im = _resize(im, sizes[i])
+        res[i] = _save_image(im, variants[i].img_format, optimize=variants[i].optimize)
+        logger.debug(
+            f"Resized the image to {sizes[i][0]}x{sizes[i][1]} "
+            f"{variants[i].img_format} in {time.perf_counter() - start:.3f}s"
+        )
+    return res
 
 
 def resize_image_explicit(
@@ -129,11 +204,33 @@ def resize_image_explicit(
         img_format: the target format of the image ("JPEG", "PNG", "WEBP"...)
         optimize: Should the resized image be optimized ?
     """
+    _draft(im, size)
+    if size != im.size:
+        im = _resize(im, (size[0], size[1]))
+    return _save_image(im, img_format, optimize=optimize)
+
+
+def _draft(im: Image, size: tuple[int, int]):
+    """If the image is a JPEG that hasn't been loaded yet,
+    configure it to be decoded at the smallest scale
+    that is still at least twice as big as the given size.
+
+    The other images are left untouched.
+    """
+    im.draft(None, (max(size[0] * 2, 1), max(size[1] * 2, 1)))
+
+
+def _resize(im: Image, size: tuple[int, int]) -> Image:
+    # use the lanczos filter for antialiasing.
+    # The image is first reduced by an integer factor, which is much faster,
+    # as long as it stays thrice as big as the target size ;
+    # the result can't be told apart from a full lanczos resize.
+    return im.resize(size, Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def _save_image(im: Image, img_format: str, *, optimize: bool) -> ContentFile:
     img_format = img_format.upper()
     content = BytesIO()
-    # use the lanczos filter for antialiasing and discard the alpha channel
-    if size != im.size:
-        im = im.resize((size[0], size[1]), Resampling.LANCZOS)
     if img_format == "JPEG":
         # converting an image with an alpha channel to jpeg would cause a crash
         im = im.convert("RGB")
@@ -145,6 +242,22 @@ def resize_image_explicit(
     return ContentFile(content.getvalue())
 
 
+def get_image_size(im: Image) -> tuple[int, int]:
+    """Return the size of an image, once rotated by
+    [exif_auto_rotate][core.utils.exif_auto_rotate].
+
+    Only the headers of the image are read,
+    so this is cheap even for big images which haven't been loaded yet.
+
+    Returns:
+        The width and the height of the image
+    """
+    (w, h) = im.size
+    if im.getexif().get(ExifTags.Base.Orientation) in (6, 8):
+        return h, w
+    return w, h
+
+
 def exif_auto_rotate(image):
     for orientation in ExifTags.TAGS:
         if ExifTags.TAGS[orientation] == "Orientation":
@@ -172,3 +285,65 @@ def get_client_ip(request: HttpRequest) -> str | None:
             return ip
 
     return None
+
+
+media_unlinker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="media_unlinker")
+"""The thread which removes the media files of the deleted SithFiles."""
+
+
+def _delete_media_batch(storage: Storage, names: Sequence[str]):
+    logger = logging.getLogger("main")
+    for name in names:
+        try:
+            storage.delete(name)
+        except OSError as e:
+            logger.warning("Could not delete the media file %s : %s", name, e)
+    logger.debug("Deleted %d media files", len(names))
+
+
+def delete_media_files(
+    names: Iterable[str], *, storage: Storage = default_storage, batch_size=100
+) -> list[Future]:
+    """Remove those files from the storage, in a background thread.
+
+    The files are removed by batches of `batch_size`,
+    so that a big deletion doesn't keep the thread busy
+    for too long at once.
+
+    Returns:
+        The futures of the batches.
+    """
+    return [
+        media_unlinker.submit(_delete_media_batch, storage, batch)
+        for batch in itertools.batched(names, batch_size)
+    ]
+
+
+_inherited_connections: list[Any] = []
+
+
+def _discard_inherited_connections():
+    """Make a forked process open its own database connections.
+
+    The connections inherited from the parent process share their socket
+    with it, so they must not be used, nor closed : closing them would
+    also end the session of the parent process.
+    They are only put aside, and the process opens new ones if needed.
+    """
+    for conn in connections.all(initialized_only=True):
+        if conn.connection is not None:
+            _inherited_connections.append(conn.connection)
+            conn.connection = None
+
+
+def fork_process_pool(max_workers: int) -> ProcessPoolExecutor:
+    """Return a pool of `max_workers` forked processes.
+
+    The processes share the memory of the current process when they start,
+    but not its database connections.
+    """
+    return ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_discard_inherited_connections,
+    )
@@ -23,6 +23,7 @@
 #
 
 import types
+from collections.abc import Iterable
 from typing import Any
 
 from django.conf import settings
@@ -100,7 +101,7 @@ def can_edit(obj: Any, user: User) -> bool:
             raise PermissionDenied
         ```
     """
-    if obj is None or user.can_edit(obj):
+    if obj is None or user.permission_resolver.can_edit(obj):
         return True
     return can_edit_prop(obj, user)
 
@@ -121,9 +122,8 @@ def can_view(obj: Any, user: User) -> bool:
             raise PermissionDenied
         ```
     """
-    if obj is None or user.can_view(obj):
-        return True
-    return can_edit(obj, user)
+    # the resolver also checks the edit permissions
+    return obj is None or user.permission_resolver.can_view(obj)
 
 
 class GenericContentPermissionMixinBuilder(View):
@@ -147,6 +147,11 @@ class GenericContentPermissionMixinBuilder(View):
     def get_permission_function(cls, obj, user):
         return cls.permission_function(obj, user)
 
+    @classmethod
+    def get_permitted_objects(cls, objects: Iterable[Any], user: User) -> list[Any]:
+        """Return the objects of a list the user has the permission on."""
+        return [o for o in objects if cls.get_permission_function(o, user)]
+
     def dispatch(self, request, *arg, **kwargs):
         if hasattr(self, "get_object") and callable(self.get_object):
             self.object = self.get_object()
@@ -157,7 +162,7 @@ class GenericContentPermissionMixinBuilder(View):
         # If we get here, it's a ListView
 
         queryset = self.get_queryset()
-        l_id = [o.id for o in queryset if self.get_permission_function(o, request.user)]
+        l_id = [o.id for o in self.get_permitted_objects(queryset, request.user)]
         if not l_id and queryset.count() != 0:
             raise self.raised_error
         self._get_queryset = self.get_queryset
@@ -214,6 +219,10 @@ class CanEditMixin(GenericContentPermissionMixinBuilder):
 
     permission_function = can_edit
 
+    @classmethod
+    def get_permitted_objects(cls, objects: Iterable[Any], user: User) -> list[Any]:
+        return user.permission_resolver.bulk_can_edit(objects)
+
 
 class CanViewMixin(GenericContentPermissionMixinBuilder):
     """Ensure the user has permission to view this view's object.
@@ -224,6 +233,10 @@ class CanViewMixin(GenericContentPermissionMixinBuilder):
 
     permission_function = can_view
 
+    @classmethod
+    def get_permitted_objects(cls, objects: Iterable[Any], user: User) -> list[Any]:
+        return user.permission_resolver.bulk_can_view(objects)
+
 
 class UserIsRootMixin(GenericContentPermissionMixinBuilder):
     """Allow only root admins.
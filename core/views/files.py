@@ -194,7 +194,11 @@ class FileListView(ListView):
     context_object_name = "file_list"
 
     def get_queryset(self):
-        return SithFile.objects.filter(parent=None)
+        return self.request.user.permission_resolver.bulk_can_view(
+            SithFile.objects.filter(parent=None).select_related(
+                "profile_of", "avatar_of", "scrub_of"
+            )
+        )
 
     def get_context_data(self, **kwargs):
         kwargs = super().get_context_data(**kwargs)
@@ -303,10 +307,9 @@ class FileView(CanViewMixin, DetailView, FormMixin):
                  where you want to paste the clipboard
         """
         if "delete" in request.POST:
-            for f_id in request.POST.getlist("file_list"):
-                file = SithFile.objects.filter(id=f_id).first()
-                if file:
-                    file.delete()
+            SithFile.delete_trees(
+                SithFile.objects.filter(id__in=request.POST.getlist("file_list"))
+            )
         if "clear" in request.POST:
             request.session["clipboard"] = []
         if "cut" in request.POST:
@@ -365,6 +368,11 @@ class FileView(CanViewMixin, DetailView, FormMixin):
         kwargs["clipboard"] = SithFile.objects.filter(
             id__in=self.request.session["clipboard"]
         )
+        kwargs["children"] = self.request.user.permission_resolver.bulk_can_view(
+            self.object.children.order_by("-is_folder", "name").select_related(
+                "profile_of", "avatar_of", "scrub_of"
+            )
+        )
         return kwargs
 
 
@@ -375,7 +383,6 @@ class FileDeleteView(AllowFragment, CanEditPropMixin, DeleteView):
     context_object_name = "file"
 
     def get_success_url(self):
-        self.object.file.delete()  # Doing it here or overloading delete() is the same, so let's do it here
         if "next" in self.request.GET:
             return self.request.GET["next"]
         if self.object.parent is None:
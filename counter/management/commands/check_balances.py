@@ -0,0 +1,106 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+
+from counter.models import Customer
+
+
+class Command(BaseCommand):
+    """Check that the balance of every customer account is right.
+
+    The customers are checked in chunks, by comparing their amount
+    with their balance ledger (last checkpoint + movements registered since).
+    The pending movements are then folded into the checkpoints,
+    which keeps the next checks fast.
+
+    This command should be automated with a cron task.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-c",
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of customers checked at once",
+        )
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help=(
+                "Also compare the amounts with the sum of all refills and purchases. "
+                "This is way slower."
+            ),
+        )
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Recompute the amount of the accounts which have a drift",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        nb_checked = 0
+        drifts: list[dict] = []
+        for chunk in self._iter_chunks(options["chunk_size"]):
+            customers = Customer.objects.filter(pk__in=chunk).annotate_ledger_amount()
+            drift_filter = ~Q(amount=F("ledger_amount"))
+            if options["full"]:
+                customers = customers.annotate_computed_amount()
+                drift_filter |= ~Q(amount=F("computed_amount"))
+            chunk_drifts = list(
+                customers.filter(drift_filter).values(
+                    "pk",
+                    "account_id",
+                    "amount",
+                    "ledger_amount",
+                    *(["computed_amount"] if options["full"] else []),
+                )
+            )
+            if options["fix"] and chunk_drifts:
+                Customer.objects.filter(
+                    pk__in=[d["pk"] for d in chunk_drifts]
+                ).update_amount()
+            Customer.objects.filter(pk__in=chunk).checkpoint_balances()
+            drifts.extend(chunk_drifts)
+            nb_checked += len(chunk)
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{nb_checked} accounts checked")
+
+        for drift in drifts:
+            line = (
+                f"  - {drift['account_id']} : {drift['amount']:.2f} € "
+                f"(ledger : {drift['ledger_amount']:.2f} €"
+            )
+            if options["full"]:
+                line += f", computed : {drift['computed_amount']:.2f} €"
+            self.stdout.write(line + ")")
+        total_drift = sum(
+            (abs(d["amount"] - d["ledger_amount"]) for d in drifts), Decimal(0)
+        )
+        self.stdout.write(
+            f"{nb_checked} accounts checked in {time.perf_counter() - start:.2f}s, "
+            f"{len(drifts)} with a drift (total ledger drift : {total_drift:.2f} €)"
+        )
+        if options["fix"] and drifts:
+            self.stdout.write(f"{len(drifts)} accounts fixed")
+
+    @staticmethod
+    def _iter_chunks(chunk_size: int):
+        """Yield the primary keys of all the customers, by chunks.
+
+        Uses keyset pagination, so the cost of fetching a chunk
+        doesn't depend on its position in the table.
+        """
+        last_pk = None
+        while True:
+            qs = Customer.objects.order_by("pk").values_list("pk", flat=True)
+            if last_pk is not None:
+                qs = qs.filter(pk__gt=last_pk)
+            chunk = list(qs[:chunk_size])
+            if not chunk:
+                return
+            yield chunk
+            last_pk = chunk[-1]
@@ -1,8 +1,8 @@
-from collections.abc import Iterable
+from collections.abc import Iterator
 from operator import attrgetter
 
 from django.conf import settings
-from django.core.mail import send_mass_mail
+from django.core.mail import EmailMessage, get_connection
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.db.models import Exists, OuterRef, QuerySet
@@ -11,7 +11,14 @@ from django.utils.timezone import now
 from django.utils.translation import gettext as _
 
 from core.models import User, UserQuerySet
-from counter.models import AccountDump, Counter, Customer, Selling
+from counter.models import (
+    AccountDump,
+    BalanceMovement,
+    Counter,
+    Customer,
+    SalesDailyRollup,
+    Selling,
+)
 
 
 class Command(BaseCommand):
@@ -21,6 +28,12 @@ class Command(BaseCommand):
     have their account emptied, unless they reactivated their
     account in the meantime (e.g. by resubscribing).
 
+    The accounts are dumped by chunks, each chunk in its own transaction,
+    then the mails are sent one by one.
+    Dumped accounts and sent mails are recorded in the `AccountDump` table,
+    so if the command is interrupted, running it again
+    will resume the work where it stopped.
+
     This command should be automated with a cron task.
     """
 
@@ -30,6 +43,13 @@ class Command(BaseCommand):
             action="store_true",
             help="Don't do anything, just display the number of users concerned",
         )
+        parser.add_argument(
+            "-c",
+            "--chunk-size",
+            type=int,
+            default=500,
+            help="Number of accounts dumped in the same transaction",
+        )
 
     def handle(self, *args, **options):
         users = self._get_users()
@@ -40,13 +60,13 @@ class Command(BaseCommand):
         # as if nothing ever happened.
         # Refunding a user implies a transaction, so refunded users
         # count as reactivated users
-        users_to_dump_qs = users.filter_inactive()
-        reactivated_users = list(users.difference(users_to_dump_qs))
-        users_to_dump = list(users_to_dump_qs)
+        users_to_dump = users.filter_inactive()
+        reactivated_users = users.exclude(pk__in=users_to_dump.values("pk"))
+        nb_to_dump = users_to_dump.count()
         self.stdout.write(
-            f"{len(reactivated_users)} users have reactivated their account"
+            f"{reactivated_users.count()} users have reactivated their account"
         )
-        self.stdout.write(f"{len(users_to_dump)} users will see their account dumped")
+        self.stdout.write(f"{nb_to_dump} users will see their account dumped")
 
         if options["dry_run"]:
             return
@@ -54,12 +74,33 @@ class Command(BaseCommand):
         AccountDump.objects.ongoing().filter(
             customer__user__in=reactivated_users
         ).delete()
-        self._dump_accounts({u.customer for u in users_to_dump})
+        nb_dumped = 0
+        for chunk in self._iter_chunks(users_to_dump, options["chunk_size"]):
+            self._dump_accounts({u.customer for u in chunk})
+            nb_dumped += len(chunk)
+            if options["verbosity"] > 1:
+                self.stdout.write(f"{nb_dumped}/{nb_to_dump} accounts dumped")
         self.stdout.write("Accounts dumped")
-        nb_successful_mails = self._send_mails(users_to_dump)
+        nb_successful_mails = self._send_mails(
+            AccountDump.objects.exclude(dump_operation=None).filter(
+                dump_mail_sent_at=None
+            )
+        )
         self.stdout.write(f"{nb_successful_mails} were successfuly sent.")
         self.stdout.write("Finished !")
 
+    @staticmethod
+    def _iter_chunks(users: UserQuerySet, chunk_size: int) -> Iterator[list[User]]:
+        """Yield the given users, by chunks.
+
+        Each chunk is fetched only when the previous one has been processed,
+        so the users of a chunk are always in their current state.
+        """
+        last_pk = 0
+        while chunk := list(users.filter(pk__gt=last_pk).order_by("pk")[:chunk_size]):
+            yield chunk
+            last_pk = chunk[-1].pk
+
     @staticmethod
     def _get_users() -> UserQuerySet:
         """Fetch the users which have a pending account dump."""
@@ -123,6 +164,7 @@ class Command(BaseCommand):
                 for account in accounts
             ]
         )
+        SalesDailyRollup.objects.register_sales(sales)
         sales.sort(key=attrgetter("customer_id"))
 
         # dumps and sales are linked to the same customers
@@ -135,21 +177,42 @@ class Command(BaseCommand):
         # the account amounts haven't been updated,
         # which mean we must do it explicitly
         Customer.objects.filter(pk__in=customer_ids).update(amount=0)
+        BalanceMovement.objects.bulk_create(
+            [
+                BalanceMovement(customer=account, amount=-account.amount)
+                for account in accounts
+            ]
+        )
 
     @staticmethod
-    def _send_mails(users: Iterable[User]) -> int:
+    def _send_mails(dumps: QuerySet[AccountDump]) -> int:
         """Send the mails informing users that their account has been dumped.
 
+        The mails are rendered one at a time and sent through
+        a single connection to the mail server.
+        Each successfully sent mail is immediately recorded
+        in its `AccountDump`, so that it won't be sent again.
+
         Returns:
             The number of emails successfully sent.
         """
-        mails = [
-            (
-                _("Your AE account has been emptied"),
-                render_to_string("counter/mails/account_dump.jinja", {"user": user}),
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-            )
-            for user in users
-        ]
-        return send_mass_mail(mails, fail_silently=True)
+        nb_sent = 0
+        dumps = dumps.select_related("customer__user").order_by("pk")
+        with get_connection(fail_silently=True) as connection:
+            for dump in dumps.iterator(chunk_size=500):
+                user = dump.customer.user
+                user.warning_date = dump.warning_mail_sent_at
+                message = EmailMessage(
+                    _("Your AE account has been emptied"),
+                    render_to_string(
+                        "counter/mails/account_dump.jinja", {"user": user}
+                    ),
+                    settings.DEFAULT_FROM_EMAIL,
+                    [user.email],
+                    connection=connection,
+                )
+                if message.send() == 0:
+                    continue
+                AccountDump.objects.filter(pk=dump.pk).update(dump_mail_sent_at=now())
+                nb_sent += 1
+        return nb_sent
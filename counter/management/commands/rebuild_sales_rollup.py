@@ -0,0 +1,26 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from counter.models import SalesDailyRollup
+
+
+class Command(BaseCommand):
+    """Recompute the daily sales rollup from the sales.
+
+    The rollup is maintained each time a sale is created or deleted,
+    but operations which bypass the ORM (like raw queries or `update()` calls)
+    can make it drift from the actual sales.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            type=date.fromisoformat,
+            default=None,
+            help="Only rebuild the days starting from this one (YYYY-MM-DD)",
+        )
+
+    def handle(self, *args, **options):
+        nb_rows = SalesDailyRollup.objects.rebuild(since=options["since"])
+        self.stdout.write(f"{nb_rows} rollup rows created")
@@ -0,0 +1,47 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db.models import Min
+from django.utils import timezone
+
+from counter.models import TIMEOUT_SWEEP_CACHE_KEY, Counter, Permanency
+
+
+class Command(BaseCommand):
+    """Close the permanencies of the barmen who have been inactive for too long.
+
+    The permanencies of all counters are closed at once.
+    The metrics of the sweep are kept in the cache,
+    and the views don't handle the timeouts themselves as long as
+    the last sweep is recent enough (see `SITH_BARMAN_TIMEOUT_SWEEP_INTERVAL`).
+
+    This command should be automated with a cron task running every minute.
+    """
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        now = timezone.now()
+        timeout = timedelta(minutes=settings.SITH_BARMAN_TIMEOUT)
+        oldest_activity = Permanency.objects.filter(
+            end=None, activity__lt=now - timeout
+        ).aggregate(oldest=Min("activity"))["oldest"]
+        nb_closed = Counter.objects.handle_timeout()
+        # the lag is the time elapsed between the moment
+        # the oldest closed permanency should have been closed and now
+        lag = now - (oldest_activity + timeout) if oldest_activity else timedelta()
+        metrics = {
+            "date": now,
+            "closed": nb_closed,
+            "lag": lag,
+            "duration": time.perf_counter() - start,
+        }
+        cache.set(TIMEOUT_SWEEP_CACHE_KEY, metrics, timeout=None)
+        if options["verbosity"] > 0:
+            self.stdout.write(
+                f"{nb_closed} permanencies closed "
+                f"(lag : {lag.total_seconds():.0f}s, "
+                f"duration : {metrics['duration']:.3f}s)"
+            )
@@ -0,0 +1,94 @@
+# Generated by Django 4.2.17 on 2026-10-18 21:02
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.migrations.state import StateApps
+
+import accounting.models
+
+
+def create_checkpoints(apps: StateApps, schema_editor):
+    """Use the current balance of each customer as its first checkpoint."""
+    Customer = apps.get_model("counter", "Customer")
+    BalanceCheckpoint = apps.get_model("counter", "BalanceCheckpoint")
+    customers = Customer.objects.values_list("pk", "amount").iterator(chunk_size=2000)
+    BalanceCheckpoint.objects.bulk_create(
+        (BalanceCheckpoint(customer_id=pk, amount=amount) for pk, amount in customers),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("counter", "0029_alter_selling_label"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BalanceCheckpoint",
+            fields=[
+                (
+                    "customer",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="balance_checkpoint",
+                        serialize=False,
+                        to="counter.customer",
+                    ),
+                ),
+                (
+                    "amount",
+                    accounting.models.CurrencyField(
+                        decimal_places=2,
+                        default=0,
+                        max_digits=12,
+                        verbose_name="amount",
+                    ),
+                ),
+                ("date", models.DateTimeField(auto_now=True, verbose_name="date")),
+            ],
+            options={
+                "verbose_name": "balance checkpoint",
+            },
+        ),
+        migrations.CreateModel(
+            name="BalanceMovement",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "amount",
+                    accounting.models.CurrencyField(
+                        decimal_places=2, max_digits=12, verbose_name="amount"
+                    ),
+                ),
+                (
+                    "date",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="date"
+                    ),
+                ),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="balance_movements",
+                        to="counter.customer",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "balance movement",
+            },
+        ),
+        migrations.RunPython(create_checkpoints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,121 @@
+# Generated by Django 4.2.17 on 2026-10-18 21:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.migrations.state import StateApps
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def fill_rollup(apps: StateApps, schema_editor):
+    """Aggregate the existing sales into the rollup table."""
+    Selling = apps.get_model("counter", "Selling")
+    SalesDailyRollup = apps.get_model("counter", "SalesDailyRollup")
+    rows = (
+        Selling.objects.annotate(
+            day=TruncDate("date", tzinfo=timezone.get_default_timezone())
+        )
+        .values("day", "counter_id", "club_id", "product_id", "payment_method")
+        .annotate(
+            total_quantity=Sum("quantity"),
+            total=Sum(F("quantity") * F("unit_price")),
+            nb_sales=Count("id"),
+        )
+        .order_by()
+    )
+    SalesDailyRollup.objects.bulk_create(
+        (
+            SalesDailyRollup(
+                day=row["day"],
+                counter_id=row["counter_id"],
+                club_id=row["club_id"],
+                product_id=row["product_id"],
+                payment_method=row["payment_method"],
+                quantity=row["total_quantity"],
+                total=row["total"],
+                nb_sales=row["nb_sales"],
+            )
+            for row in rows.iterator(chunk_size=2000)
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("club", "0013_alter_club_board_group_alter_club_members_group_and_more"),
+        ("counter", "0030_balance_ledger"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SalesDailyRollup",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="date")),
+                (
+                    "payment_method",
+                    models.CharField(max_length=255, verbose_name="payment method"),
+                ),
+                ("quantity", models.IntegerField(default=0, verbose_name="quantity")),
+                (
+                    "total",
+                    models.DecimalField(
+                        decimal_places=2, default=0, max_digits=16, verbose_name="total"
+                    ),
+                ),
+                (
+                    "nb_sales",
+                    models.IntegerField(default=0, verbose_name="number of sales"),
+                ),
+                (
+                    "club",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="club.club",
+                    ),
+                ),
+                (
+                    "counter",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="counter.counter",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="counter.product",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "sales daily rollup",
+                "indexes": [
+                    models.Index(
+                        fields=["counter", "day"], name="counter_sal_counter_aef452_idx"
+                    ),
+                    models.Index(
+                        fields=["club", "day"], name="counter_sal_club_id_f665f0_idx"
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(fill_rollup, migrations.RunPython.noop),
+    ]
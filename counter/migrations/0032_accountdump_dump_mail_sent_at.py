@@ -0,0 +1,33 @@
+# Generated by Django 4.2.17 on 2026-10-18 21:34
+
+from django.db import migrations, models
+from django.db.migrations.state import StateApps
+from django.db.models import OuterRef, Subquery
+
+
+def mark_mails_as_sent(apps: StateApps, schema_editor):
+    """The mails of the already finished dumps have been sent with the dump."""
+    AccountDump = apps.get_model("counter", "AccountDump")
+    Selling = apps.get_model("counter", "Selling")
+    AccountDump.objects.exclude(dump_operation=None).update(
+        dump_mail_sent_at=Subquery(
+            Selling.objects.filter(pk=OuterRef("dump_operation_id")).values("date")
+        )
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [("counter", "0031_sales_daily_rollup")]
+
+    operations = [
+        migrations.AddField(
+            model_name="accountdump",
+            name="dump_mail_sent_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="When the mail informing that the account was dumped was sent.",
+                null=True,
+            ),
+        ),
+        migrations.RunPython(mark_mails_as_sent, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.17 on 2026-10-18 21:45
+
+from django.db import migrations, models
+from django.db.migrations.state import StateApps
+from django.db.models.functions import Length
+
+
+def init_sequence(apps: StateApps, schema_editor):
+    """Start the sequence after the biggest existing account id."""
+    Customer = apps.get_model("counter", "Customer")
+    AccountIdSequence = apps.get_model("counter", "AccountIdSequence")
+    account_id = (
+        Customer.objects.order_by(Length("account_id"), "account_id")
+        .values_list("account_id", flat=True)
+        .last()
+    )
+    last_number = int(account_id[:-1]) if account_id else 1503
+    AccountIdSequence.objects.create(pk=1, last_number=last_number)
+
+
+class Migration(migrations.Migration):
+    dependencies = [("counter", "0032_accountdump_dump_mail_sent_at")]
+
+    operations = [
+        migrations.CreateModel(
+            name="AccountIdSequence",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "last_number",
+                    models.PositiveIntegerField(verbose_name="last number"),
+                ),
+            ],
+            options={"verbose_name": "account id sequence"},
+        ),
+        migrations.RunPython(init_sequence, migrations.RunPython.noop),
+    ]
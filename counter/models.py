@@ -15,31 +15,47 @@
 from __future__ import annotations
 
 import base64
+import itertools
 import os
 import random
 import string
-from datetime import date, datetime, timedelta
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
 from datetime import timezone as tz
 from decimal import Decimal
-from typing import Self
+from typing import TYPE_CHECKING, Self
 
 from dict2xml import dict2xml
 from django.conf import settings
+from django.core.cache import cache
 from django.core.validators import MinLengthValidator
-from django.db import models
-from django.db.models import Exists, F, OuterRef, Q, QuerySet, Subquery, Sum, Value
-from django.db.models.functions import Coalesce, Concat, Length
+from django.db import models, transaction
+from django.db.models import (
+    Count,
+    Exists,
+    ExpressionWrapper,
+    F,
+    OuterRef,
+    Q,
+    QuerySet,
+    Subquery,
+    Sum,
+    Value,
+)
+from django.db.models.functions import Coalesce, Concat, Length, TruncDate
 from django.forms import ValidationError
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.functional import cached_property
+from django.utils.text import Truncator
 from django.utils.translation import gettext_lazy as _
 from django_countries.fields import CountryField
 from ordered_model.models import OrderedModel
 from phonenumber_field.modelfields import PhoneNumberField
 
 from accounting.models import CurrencyField
-from club.models import Club
+from club.models import Club, Membership
 from core.fields import ResizedImageField
 from core.models import Group, Notification, User
 from core.utils import get_start_of_semester
@@ -47,12 +63,36 @@ from counter.apps import PAYMENT_METHOD
 from sith.settings import SITH_MAIN_CLUB
 from subscription.models import Subscription
 
+if TYPE_CHECKING:
+    from collections.abc import Iterable
+
 
 class CustomerQuerySet(models.QuerySet):
+    @staticmethod
+    def _computed_amount():
+        """Expression of the balance recomputed from all refills and purchases."""
+        money_in = Subquery(
+            Refilling.objects.filter(customer=OuterRef("pk"))
+            .values("customer_id")  # group by customer
+            .annotate(res=Sum(F("amount"), default=0))
+            .values("res")
+        )
+        money_out = Subquery(
+            # purchases paid by credit card don't touch the account
+            Selling.objects.filter(
+                customer=OuterRef("pk"), payment_method="SITH_ACCOUNT"
+            )
+            .values("customer_id")
+            .annotate(res=Sum(F("unit_price") * F("quantity"), default=0))
+            .values("res")
+        )
+        return Coalesce(money_in, Decimal("0")) - Coalesce(money_out, Decimal("0"))
+
     def update_amount(self) -> int:
         """Update the amount of all customers selected by this queryset.
 
         The result is given as the sum of all refills minus the sum of all purchases.
+        The balance ledger of the customers is reset to the new amounts.
 
         Returns:
             The number of updated rows.
@@ -65,20 +105,164 @@ class CustomerQuerySet(models.QuerySet):
             Use this either on a small subset of the `Customer` table,
             or execute it inside an independent task
             (like a Celery task or a management command).
+            To only check that the balances are still right,
+            use `annotate_ledger_amount` instead.
         """
-        money_in = Subquery(
-            Refilling.objects.filter(customer=OuterRef("pk"))
-            .values("customer_id")  # group by customer
-            .annotate(res=Sum(F("amount"), default=0))
-            .values("res")
-        )
-        money_out = Subquery(
-            Selling.objects.filter(customer=OuterRef("pk"))
+        with transaction.atomic():
+            res = self.update(amount=self._computed_amount())
+            BalanceMovement.objects.filter(customer__in=self).delete()
+            BalanceCheckpoint.objects.bulk_create(
+                [
+                    BalanceCheckpoint(customer_id=pk, amount=amount)
+                    for pk, amount in self.values_list("pk", "amount")
+                ],
+                update_conflicts=True,
+                unique_fields=["customer"],
+                update_fields=["amount", "date"],
+            )
+        return res
+
+    def annotate_computed_amount(self) -> Self:
+        """Annotate the queryset with the `computed_amount` field.
+
+        This is the balance as computed by `update_amount`,
+        without modifying anything.
+        It has the same performance issues as `update_amount`.
+        """
+        return self.annotate(computed_amount=self._computed_amount())
+
+    def annotate_ledger_amount(self) -> Self:
+        """Annotate the queryset with the `ledger_amount` field.
+
+        This is the amount of the last balance checkpoint of the customer,
+        plus all the balance movements registered since.
+        As the movements are regularly folded into the checkpoints,
+        this stays cheap to compute, whatever the size of the
+        `Selling` and `Refilling` tables.
+
+        If the `amount` of a customer isn't the same as its `ledger_amount`,
+        it means that its balance has been modified without going
+        through the usual paths (which is a bug).
+        """
+        movements = Subquery(
+            BalanceMovement.objects.filter(customer=OuterRef("pk"))
             .values("customer_id")
-            .annotate(res=Sum(F("unit_price") * F("quantity"), default=0))
+            .annotate(res=Sum("amount"))
             .values("res")
         )
-        return self.update(amount=Coalesce(money_in - money_out, Decimal("0")))
+        return self.annotate(
+            ledger_amount=ExpressionWrapper(
+                Coalesce(F("balance_checkpoint__amount"), Decimal("0"))
+                + Coalesce(movements, Decimal("0")),
+                output_field=CurrencyField(),
+            )
+        )
+
+    def checkpoint_balances(self) -> int:
+        """Fold the pending balance movements into the checkpoints.
+
+        The folded movements are locked, then exactly those
+        are summed and deleted.
+        Movements created while this method runs are left untouched
+        and will be folded by the next call ;
+        if another call is already running, this one waits
+        for it to finish, and only folds the remaining movements.
+
+        Returns:
+            The number of folded movements.
+        """
+        with transaction.atomic():
+            movements = list(
+                BalanceMovement.objects.filter(customer__in=self)
+                .select_for_update()
+                .order_by("id")
+                .values_list("id", "customer_id", "amount")
+            )
+            if not movements:
+                return 0
+            deltas = defaultdict(Decimal)
+            for _id, customer_id, amount in movements:
+                deltas[customer_id] += amount
+            checkpoints = {
+                c.customer_id: c
+                for c in BalanceCheckpoint.objects.select_for_update().filter(
+                    customer_id__in=deltas.keys()
+                )
+            }
+            for customer_id, delta in deltas.items():
+                checkpoint = checkpoints.setdefault(
+                    customer_id, BalanceCheckpoint(customer_id=customer_id, amount=0)
+                )
+                checkpoint.amount += delta
+            BalanceCheckpoint.objects.bulk_create(
+                checkpoints.values(),
+                update_conflicts=True,
+                unique_fields=["customer"],
+                update_fields=["amount", "date"],
+            )
+            for batch in itertools.batched(movements, 1000):
+                BalanceMovement.objects.filter(id__in=[m[0] for m in batch]).delete()
+            return len(movements)
+
+
+class AccountIdSequence(models.Model):
+    """The number of the last account id given to a customer.
+
+    This table has a single row, which is locked each time
+    a new account id is generated, so that two customers created
+    at the same time can't get the same id.
+    """
+
+    last_number = models.PositiveIntegerField(_("last number"))
+
+    class Meta:
+        verbose_name = _("account id sequence")
+
+    def __str__(self):
+        return str(self.last_number)
+
+    @classmethod
+    def next_account_id(cls) -> str:
+        """Return a new unique account id.
+
+        Account ids are always a number with a letter appended.
+        """
+        with transaction.atomic():
+            sequence, _created = cls.objects.select_for_update().get_or_create(
+                pk=1, defaults={"last_number": cls.compute_last_number()}
+            )
+            sequence.last_number += 1
+            sequence.save()
+        return f"{sequence.last_number}{random.choice(string.ascii_lowercase)}"
+
+    @staticmethod
+    def compute_last_number() -> int:
+        """Find the biggest number used by the existing account ids.
+
+        This has to go through the whole customer table,
+        so it's used only to initialize the sequence.
+        """
+        account_id = (
+            Customer.objects.order_by(Length("account_id"), "account_id")
+            .values_list("account_id", flat=True)
+            .last()
+        )
+        if account_id is None:
+            # legacy from the old site
+            return 1503
+        return int(account_id[:-1])
+
+    @classmethod
+    def observe(cls, account_id: str):
+        """Make sure the sequence won't generate an id lower than the given one.
+
+        This is needed when an account id is given by hand instead of being
+        generated with `next_account_id`.
+        """
+        if account_id[:-1].isdigit():
+            cls.objects.filter(pk=1, last_number__lt=int(account_id[:-1])).update(
+                last_number=int(account_id[:-1])
+            )
 
 
 class Customer(models.Model):
@@ -110,6 +294,8 @@ class Customer(models.Model):
         """
         if self.amount < 0 and (is_selling and not allow_negative):
             raise ValidationError(_("Not enough money"))
+        if self._state.adding:
+            AccountIdSequence.observe(self.account_id)
         super().save(*args, **kwargs)
 
     def get_absolute_url(self):
@@ -157,32 +343,60 @@ class Customer(models.Model):
         if hasattr(user, "customer"):
             return user.customer, False
 
-        # account_id are always a number with a letter appended
-        account_id = (
-            Customer.objects.order_by(Length("account_id"), "account_id")
-            .values("account_id")
-            .last()
+        account = cls.objects.create(
+            user=user, account_id=AccountIdSequence.next_account_id()
         )
-        if account_id is None:
-            # legacy from the old site
-            account = cls.objects.create(user=user, account_id="1504a")
-            return account, True
-
-        account_id = account_id["account_id"]
-        account_num = int(account_id[:-1])
-        while Customer.objects.filter(account_id=account_id).exists():
-            # when entering the first iteration, we are using an already existing account id
-            # so the loop should always execute at least one time
-            account_num += 1
-            account_id = f"{account_num}{random.choice(string.ascii_lowercase)}"
-
-        account = cls.objects.create(user=user, account_id=account_id)
         return account, True
 
     def get_full_url(self):
         return f"https://{settings.SITH_URL}{self.get_absolute_url()}"
 
 
+class BalanceMovement(models.Model):
+    """A change of the balance of a customer account.
+
+    A movement is appended each time a purchase or a refilling
+    modifies the amount of money of a customer.
+    Movements are regularly folded into the `BalanceCheckpoint`
+    of the customer, which keeps this table small.
+    """
+
+    customer = models.ForeignKey(
+        Customer, related_name="balance_movements", on_delete=models.CASCADE
+    )
+    amount = CurrencyField(_("amount"))
+    date = models.DateTimeField(_("date"), default=timezone.now)
+
+    class Meta:
+        verbose_name = _("balance movement")
+
+    def __str__(self):
+        return f"{self.customer}: {self.amount:+.2f} €"
+
+
+class BalanceCheckpoint(models.Model):
+    """The known balance of a customer at the time of the last checkpoint.
+
+    The real balance of the customer is this amount plus all the
+    `BalanceMovement` registered since.
+    """
+
+    customer = models.OneToOneField(
+        Customer,
+        primary_key=True,
+        related_name="balance_checkpoint",
+        on_delete=models.CASCADE,
+    )
+    amount = CurrencyField(_("amount"), default=0)
+    date = models.DateTimeField(_("date"), auto_now=True)
+
+    class Meta:
+        verbose_name = _("balance checkpoint")
+
+    def __str__(self):
+        return f"{self.customer}: {self.amount:.2f} €"
+
+
 class BillingInfo(models.Model):
     """Represent the billing information of a user, which are required
     by the 3D-Secure v2 system used by the etransaction module.
@@ -265,6 +479,11 @@ class AccountDump(models.Model):
         on_delete=models.CASCADE,
         help_text=_("The operation that emptied the account."),
     )
+    dump_mail_sent_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text=_("When the mail informing that the account was dumped was sent."),
+    )
 
     objects = AccountDumpQuerySet.as_manager()
 
@@ -429,6 +648,10 @@ class Product(models.Model):
         return self.selling_price - self.purchase_price
 
 
+TIMEOUT_SWEEP_CACHE_KEY = "barman_timeout_last_sweep"
+"""Cache key of the metrics of the last run of `sweep_barman_timeouts`."""
+
+
 class CounterQuerySet(models.QuerySet):
     def annotate_has_barman(self, user: User) -> Self:
         """Annotate the queryset with the `user_is_barman` field.
@@ -474,9 +697,57 @@ class CounterQuerySet(models.QuerySet):
             The number of affected rows (ie, the number of timeouted permanences)
         """
         timeout = timezone.now() - timedelta(minutes=settings.SITH_BARMAN_TIMEOUT)
-        return Permanency.objects.filter(
+        permanencies = Permanency.objects.filter(
             counter__in=self, end=None, activity__lt=timeout
-        ).update(end=F("activity"))
+        )
+        counter_ids = set(permanencies.values_list("counter_id", flat=True))
+        if not counter_ids:
+            return 0
+        nb_rows = permanencies.update(end=F("activity"))
+        Counter.clear_shift_cache(counter_ids)
+        return nb_rows
+
+    def handle_timeout_if_needed(self) -> int:
+        """Disconnect the inactive barmen, unless it has been done recently.
+
+        If the `sweep_barman_timeouts` command has been run
+        less than `SITH_BARMAN_TIMEOUT_SWEEP_INTERVAL` seconds ago,
+        the timeouts are already handled and nothing is done.
+
+        Returns:
+            The number of timeouted permanences
+        """
+        last_sweep = cache.get(TIMEOUT_SWEEP_CACHE_KEY)
+        interval = timedelta(seconds=settings.SITH_BARMAN_TIMEOUT_SWEEP_INTERVAL)
+        if last_sweep is not None and last_sweep["date"] > timezone.now() - interval:
+            return 0
+        return self.handle_timeout()
+
+
+@dataclass
+class CounterShift:
+    """The barmen currently logged in a counter.
+
+    This is a snapshot of the open permanencies of the counter,
+    which is kept in the cache until a barman logs in or out
+    (see `Counter.get_shift`).
+    """
+
+    activity: dict[int, datetime]
+    """The last activity date of each barman, by user id"""
+    main_club_member_ids: frozenset[int]
+    """The barmen who are members of the main club"""
+
+    @property
+    def barman_ids(self) -> list[int]:
+        """The ids of the barmen who haven't timed out yet.
+
+        Barmen who have been inactive for too long are excluded,
+        even if their permanency hasn't been closed by
+        `CounterQuerySet.handle_timeout` yet.
+        """
+        timeout = timezone.now() - timedelta(minutes=settings.SITH_BARMAN_TIMEOUT)
+        return [i for i, activity in self.activity.items() if activity >= timeout]
 
 
 class Counter(models.Model):
@@ -546,28 +817,86 @@ class Counter(models.Model):
         )
         self.save()
 
+    def get_shift(self) -> CounterShift:
+        """Return the barmen currently logged in this counter.
+
+        The result is cached until a permanency of this counter
+        starts or ends (see `counter.signals`).
+        If some barmen have timed out since the last sweep,
+        their permanencies are closed right away,
+        so that the counter isn't left open without any barman.
+        """
+        shift = self._get_shift()
+        if len(shift.barman_ids) < len(shift.activity):
+            Counter.objects.filter(id=self.id).handle_timeout()
+            # the cached activity may be outdated, so the snapshot
+            # is computed again even if no permanency has been closed
+            Counter.clear_shift_cache([self.id])
+            shift = self._get_shift()
+        return shift
+
+    def _get_shift(self) -> CounterShift:
+        cache_key = f"counter_{self.id}_shift"
+        shift = cache.get(cache_key)
+        if shift is not None:
+            return shift
+        activity = dict(
+            self.permanencies.filter(end=None)
+            .order_by("start")
+            .values_list("user_id", "activity")
+        )
+        members = Membership.objects.filter(
+            club__unix_name=SITH_MAIN_CLUB["unix_name"],
+            end_date=None,
+            user_id__in=activity.keys(),
+        ).values_list("user_id", flat=True)
+        shift = CounterShift(
+            activity=activity,
+            main_club_member_ids=frozenset(members) if activity else frozenset(),
+        )
+        cache.set(cache_key, shift)
+        return shift
+
+    @staticmethod
+    def clear_shift_cache(counter_ids: Iterable[int]) -> None:
+        """Invalidate the cached shift of the given counters."""
+        cache.delete_many([f"counter_{i}_shift" for i in counter_ids])
+
     @cached_property
     def barmen_list(self) -> list[User]:
         """Returns the barman list as list of User."""
-        return [
-            p.user for p in self.permanencies.filter(end=None).select_related("user")
-        ]
+        barman_ids = self.get_shift().barman_ids
+        if not barman_ids:
+            return []
+        users = User.objects.in_bulk(barman_ids)
+        return [users[i] for i in barman_ids if i in users]
 
     def get_random_barman(self) -> User:
-        """Return a random user being currently a barman."""
+        """Return a random user being currently a barman.
+
+        Raises:
+            ValidationError: if no barman is logged in this counter
+        """
+        if not self.barmen_list:
+            raise ValidationError(_("No barman is logged in this counter"))
         return random.choice(self.barmen_list)
 
     def update_activity(self) -> None:
         """Update the barman activity to prevent timeout."""
-        self.permanencies.filter(end=None).update(activity=timezone.now())
+        now = timezone.now()
+        self.permanencies.filter(end=None).update(activity=now)
+        shift = cache.get(f"counter_{self.id}_shift")
+        if shift is not None:
+            shift.activity = dict.fromkeys(shift.activity, now)
+            cache.set(f"counter_{self.id}_shift", shift)
 
     def can_refill(self) -> bool:
         """Show if the counter authorize the refilling with physic money."""
         if self.type != "BAR":
             return False
         # at least one of the barmen is in the AE board
-        ae = Club.objects.get(unix_name=SITH_MAIN_CLUB["unix_name"])
-        return any(ae.get_membership_for(barman) for barman in self.barmen_list)
+        shift = self.get_shift()
+        return any(i in shift.main_club_member_ids for i in shift.barman_ids)
 
     def get_top_barmen(self) -> QuerySet:
         """Return a QuerySet querying the office hours stats of all the barmen of all time
@@ -635,6 +964,9 @@ class Counter(models.Model):
         """Compute and return the total turnover of this counter since the given date.
 
         By default, the date is the start of the current semester.
+        A date is counted from its local midnight.
+        When the bound is at local midnight, the result is read
+        from the `SalesDailyRollup` table.
 
         Args:
             since: timestamp from which to perform the calculation
@@ -644,8 +976,12 @@ class Counter(models.Model):
         """
         if since is None:
             since = get_start_of_semester()
-        if isinstance(since, date):
-            since = datetime(since.year, since.month, since.day, tzinfo=tz.utc)
+        if not isinstance(since, datetime):
+            since = SalesDailyRollup.start_of_day(since)
+        if SalesDailyRollup.is_day_aligned(since):
+            return SalesDailyRollup.objects.filter(
+                counter=self, day__gte=SalesDailyRollup.day_of(since)
+            ).summary()["total"]
         return self.sellings.filter(date__gte=since).aggregate(
             total=Sum(
                 F("quantity") * F("unit_price"),
@@ -660,35 +996,66 @@ class Counter(models.Model):
 
         # Customer and User are two different tables,
         # but they share the same primary key
-        return self.type == "BAR" and any(b.pk == customer.pk for b in self.barmen_list)
+        return self.type == "BAR" and customer.pk in self.get_shift().barman_ids
+
+    def get_catalogue(self) -> list[Product]:
+        """Return all the products sold on this counter.
+
+        The result is cached until the products of this counter are modified
+        (see `counter.signals`).
+        Each product has a `buying_group_ids` attribute, which is
+        the set of the ids of its buying groups.
+        """
+        cache_key = f"counter_{self.id}_catalogue"
+        products = cache.get(cache_key)
+        if products is not None:
+            return products
+        products = list(self.products.select_related("product_type"))
+        buying_groups = Product.buying_groups.through.objects.filter(
+            product__in=products
+        ).values_list("product_id", "group_id")
+        group_ids = {}
+        for product_id, group_id in buying_groups:
+            group_ids.setdefault(product_id, set()).add(group_id)
+        for product in products:
+            product.buying_group_ids = frozenset(group_ids.get(product.id, ()))
+        cache.set(cache_key, products)
+        return products
+
+    @staticmethod
+    def clear_catalogue_cache(counter_ids: Iterable[int]) -> None:
+        """Invalidate the cached catalogue of the given counters."""
+        cache.delete_many([f"counter_{i}_catalogue" for i in counter_ids])
 
     def get_products_for(self, customer: Customer) -> list[Product]:
         """
         Get all allowed products for the provided customer on this counter
         Prices will be annotated
         """
-
-        products = self.products.select_related("product_type").prefetch_related(
-            "buying_groups"
-        )
-
+        user = customer.user
         # Only include age appropriate products
-        age = customer.user.age
-        if customer.user.is_banned_alcohol:
+        age = user.age
+        if user.is_banned_alcohol:
             age = min(age, 17)
-        products = products.filter(limit_age__lte=age)
+        products = [p for p in self.get_catalogue() if p.limit_age <= age]
+
+        # Check the membership of each buying group only once,
+        # instead of once per product
+        group_ids = set().union(*(p.buying_group_ids for p in products))
+        user_group_ids = {i for i in group_ids if user.is_in_group(pk=i)}
+        products = [
+            p
+            for p in products
+            if not p.buying_group_ids or p.buying_group_ids & user_group_ids
+        ]
 
         # Compute special price for customer if he is a barmen on that bar
-        if self.customer_is_barman(customer):
-            products = products.annotate(price=F("special_selling_price"))
-        else:
-            products = products.annotate(price=F("selling_price"))
-
-        return [
-            product
-            for product in products.all()
-            if product.can_be_sold_to(customer.user)
-        ]
+        is_barman = self.customer_is_barman(customer)
+        for product in products:
+            product.price = (
+                product.special_selling_price if is_barman else product.selling_price
+            )
+        return products
 
 
 class RefillingQuerySet(models.QuerySet):
@@ -754,6 +1121,7 @@ class Refilling(models.Model):
         if not self.is_validated:
             self.customer.amount += self.amount
             self.customer.save()
+            BalanceMovement.objects.create(customer=self.customer, amount=self.amount)
             self.is_validated = True
         if self.customer.user.preferences.notify_on_refill:
             Notification(
@@ -779,6 +1147,7 @@ class Refilling(models.Model):
     def delete(self, *args, **kwargs):
         self.customer.amount -= self.amount
         self.customer.save()
+        BalanceMovement.objects.create(customer=self.customer, amount=-self.amount)
         super().delete(*args, **kwargs)
 
 
@@ -790,6 +1159,110 @@ class SellingQuerySet(models.QuerySet):
         """
         return self.annotate(total=Sum(F("unit_price") * F("quantity")))
 
+    def delete(self):
+        """Delete the sales and remove them from the daily rollup."""
+        with transaction.atomic():
+            SalesDailyRollup.objects.unregister_queryset(self)
+            return super().delete()
+
+    def bulk_checkout(
+        self,
+        customer: Customer,
+        lines: list[Selling],
+        *,
+        allow_negative: bool = False,
+    ) -> list[Selling]:
+        """Register all the sales of a basket at once.
+
+        This does the same work as calling `Selling.save()` on each line,
+        but with a number of queries that doesn't depend on the size
+        of the basket :
+
+        - the lines are validated together, without any db query
+        - the sales are inserted with a single `bulk_create`,
+          and added to the `SalesDailyRollup` with a constant number of queries
+        - the customer balance is updated with a single atomic `UPDATE`,
+          and a single `BalanceMovement` is registered
+        - at most one notification is sent for the whole basket
+
+        Args:
+            customer: the customer who buys the basket.
+            lines: the unsaved sales of the basket.
+                Tray bonus lines (sold at 0 €) must be included.
+            allow_negative: allow the basket to cost more money than
+                what is available on the customer account.
+
+        Returns:
+            The created sales.
+
+        Raises:
+            ValidationError: if one of the lines is invalid
+                or if the customer hasn't enough money.
+        """
+        if len(lines) == 0:
+            return []
+        now = timezone.now()
+        for line in lines:
+            line.customer = customer
+            line.date = line.date or now
+            line.is_validated = True
+            # the related objects are given by the caller,
+            # checking their existence would cost one query per line
+            line.full_clean(
+                exclude=["product", "counter", "club", "seller", "customer"],
+                validate_unique=False,
+            )
+        total = sum(line.quantity * line.unit_price for line in lines)
+
+        with transaction.atomic():
+            customers = Customer.objects.filter(pk=customer.pk)
+            if not allow_negative:
+                customers = customers.filter(amount__gte=total)
+            if customers.update(amount=F("amount") - total) == 0:
+                raise ValidationError(_("Not enough money"))
+            BalanceMovement.objects.create(customer=customer, amount=-total)
+            sales = self.bulk_create(lines)
+            SalesDailyRollup.objects.register_sales(sales)
+            customer.refresh_from_db(fields=["amount"])
+
+            user = customer.user
+            subscription_ids = {
+                settings.SITH_PRODUCT_SUBSCRIPTION_ONE_SEMESTER,
+                settings.SITH_PRODUCT_SUBSCRIPTION_TWO_SEMESTERS,
+            }
+            subscription_sales = [s for s in sales if s.product_id in subscription_ids]
+            if subscription_sales and user.was_subscribed:
+                for sale in subscription_sales:
+                    sale._create_subscription(user)
+            if user.preferences.notify_on_click:
+                Notification(
+                    user=user,
+                    url=reverse(
+                        "core:user_account_detail",
+                        kwargs={
+                            "user_id": user.id,
+                            "year": now.year,
+                            "month": now.month,
+                        },
+                    ),
+                    param=Truncator(
+                        ", ".join(f"{s.quantity} x {s.label}" for s in sales)
+                    ).chars(128),
+                    type="SELLING",
+                ).save()
+
+        etickets = {
+            eticket.product_id: eticket
+            for eticket in Eticket.objects.filter(
+                product_id__in={s.product_id for s in sales}
+            )
+        }
+        for sale in sales:
+            if sale.product_id in etickets:
+                sale.product.eticket = etickets[sale.product_id]
+                sale.send_mail_customer()
+        return sales
+
 
 class Selling(models.Model):
     """Handle the sellings."""
@@ -859,55 +1332,13 @@ class Selling(models.Model):
         if not self.is_validated:
             self.customer.amount -= self.quantity * self.unit_price
             self.customer.save(allow_negative=allow_negative, is_selling=True)
+            BalanceMovement.objects.create(
+                customer=self.customer, amount=-self.quantity * self.unit_price
+            )
             self.is_validated = True
         user = self.customer.user
         if user.was_subscribed:
-            if (
-                self.product
-                and self.product.id == settings.SITH_PRODUCT_SUBSCRIPTION_ONE_SEMESTER
-            ):
-                sub = Subscription(
-                    member=user,
-                    subscription_type="un-semestre",
-                    payment_method="EBOUTIC",
-                    location="EBOUTIC",
-                )
-                sub.subscription_start = Subscription.compute_start()
-                sub.subscription_start = Subscription.compute_start(
-                    duration=settings.SITH_SUBSCRIPTIONS[sub.subscription_type][
-                        "duration"
-                    ]
-                )
-                sub.subscription_end = Subscription.compute_end(
-                    duration=settings.SITH_SUBSCRIPTIONS[sub.subscription_type][
-                        "duration"
-                    ],
-                    start=sub.subscription_start,
-                )
-                sub.save()
-            elif (
-                self.product
-                and self.product.id == settings.SITH_PRODUCT_SUBSCRIPTION_TWO_SEMESTERS
-            ):
-                sub = Subscription(
-                    member=user,
-                    subscription_type="deux-semestres",
-                    payment_method="EBOUTIC",
-                    location="EBOUTIC",
-                )
-                sub.subscription_start = Subscription.compute_start()
-                sub.subscription_start = Subscription.compute_start(
-                    duration=settings.SITH_SUBSCRIPTIONS[sub.subscription_type][
-                        "duration"
-                    ]
-                )
-                sub.subscription_end = Subscription.compute_end(
-                    duration=settings.SITH_SUBSCRIPTIONS[sub.subscription_type][
-                        "duration"
-                    ],
-                    start=sub.subscription_start,
-                )
-                sub.save()
+            self._create_subscription(user)
         if user.preferences.notify_on_click:
             Notification(
                 user=user,
@@ -922,10 +1353,37 @@ class Selling(models.Model):
                 param="%d x %s" % (self.quantity, self.label),
                 type="SELLING",
             ).save()
+        previous = None
+        if not self._state.adding:
+            previous = Selling.objects.filter(pk=self.pk).first()
         super().save(*args, **kwargs)
+        if previous is not None:
+            SalesDailyRollup.objects.register_sales([previous], cancel=True)
+        SalesDailyRollup.objects.register_sales([self])
         if hasattr(self.product, "eticket"):
             self.send_mail_customer()
 
+    def _create_subscription(self, user: User) -> None:
+        """Subscribe the user if the sold product is a subscription."""
+        subscription_types = {
+            settings.SITH_PRODUCT_SUBSCRIPTION_ONE_SEMESTER: "un-semestre",
+            settings.SITH_PRODUCT_SUBSCRIPTION_TWO_SEMESTERS: "deux-semestres",
+        }
+        if self.product is None or self.product.id not in subscription_types:
+            return
+        sub = Subscription(
+            member=user,
+            subscription_type=subscription_types[self.product.id],
+            payment_method="EBOUTIC",
+            location="EBOUTIC",
+        )
+        duration = settings.SITH_SUBSCRIPTIONS[sub.subscription_type]["duration"]
+        sub.subscription_start = Subscription.compute_start(duration=duration)
+        sub.subscription_end = Subscription.compute_end(
+            duration=duration, start=sub.subscription_start
+        )
+        sub.save()
+
     def is_owned_by(self, user: User) -> bool:
         if user.is_anonymous:
             return False
@@ -942,7 +1400,11 @@ class Selling(models.Model):
         if self.payment_method == "SITH_ACCOUNT":
             self.customer.amount += self.quantity * self.unit_price
             self.customer.save()
+            BalanceMovement.objects.create(
+                customer=self.customer, amount=self.quantity * self.unit_price
+            )
         super().delete(*args, **kwargs)
+        SalesDailyRollup.objects.register_sales([self], cancel=True)
 
     def send_mail_customer(self):
         event = self.product.eticket.event_title or _("Unknown event")
@@ -978,6 +1440,212 @@ class Selling(models.Model):
         return f"https://{settings.SITH_URL}{eticket_url}"
 
 
+class SalesDailyRollupQuerySet(models.QuerySet):
+    KEY_FIELDS = ("day", "counter_id", "club_id", "product_id", "payment_method")
+
+    def register_sales(self, sales: Iterable[Selling], *, cancel: bool = False):
+        """Add the given sales to the rollup.
+
+        If `cancel` is True, the sales are removed from the rollup instead.
+        The number of queries doesn't depend on the number of sales.
+        """
+        sign = -1 if cancel else 1
+        deltas: dict[tuple, list] = {}
+        for sale in sales:
+            key = (
+                SalesDailyRollup.day_of(sale.date),
+                sale.counter_id,
+                sale.club_id,
+                sale.product_id,
+                sale.payment_method,
+            )
+            delta = deltas.setdefault(key, [0, Decimal(0), 0])
+            delta[0] += sign * sale.quantity
+            delta[1] += sign * sale.quantity * sale.unit_price
+            delta[2] += sign
+        self._apply(deltas)
+
+    def unregister_queryset(self, sales: QuerySet[Selling]):
+        """Remove from the rollup the sales of the given queryset.
+
+        The sales are aggregated by the db, so this is efficient
+        even on a very large queryset.
+        """
+        rows = (
+            sales.annotate(
+                day=TruncDate("date", tzinfo=timezone.get_default_timezone())
+            )
+            .values(*self.KEY_FIELDS)
+            .annotate(
+                total_quantity=Sum("quantity"),
+                total=Sum(F("quantity") * F("unit_price")),
+                nb_sales=Count("id"),
+            )
+            .order_by()
+        )
+        self._apply(
+            {
+                tuple(row[f] for f in self.KEY_FIELDS): [
+                    -row["total_quantity"],
+                    -row["total"],
+                    -row["nb_sales"],
+                ]
+                for row in rows
+            }
+        )
+
+    def _apply(self, deltas: dict[tuple, list]):
+        if not deltas:
+            return
+        with transaction.atomic():
+            existing_filter = Q()
+            for key in deltas:
+                existing_filter |= Q(**dict(zip(self.KEY_FIELDS, key, strict=True)))
+            existing = {}
+            for row in self.filter(existing_filter).select_for_update():
+                existing.setdefault(
+                    tuple(getattr(row, f) for f in self.KEY_FIELDS), row
+                )
+            to_update, to_create = [], []
+            for key, (quantity, total, nb_sales) in deltas.items():
+                if key in existing:
+                    row = existing[key]
+                    row.quantity = F("quantity") + quantity
+                    row.total = F("total") + total
+                    row.nb_sales = F("nb_sales") + nb_sales
+                    to_update.append(row)
+                else:
+                    to_create.append(
+                        SalesDailyRollup(
+                            **dict(zip(self.KEY_FIELDS, key, strict=True)),
+                            quantity=quantity,
+                            total=total,
+                            nb_sales=nb_sales,
+                        )
+                    )
+            self.bulk_update(to_update, ["quantity", "total", "nb_sales"])
+            self.bulk_create(to_create)
+
+    def rebuild(self, since: date | None = None) -> int:
+        """Recompute the rollup from the sales.
+
+        Args:
+            since: if given, only the days starting from this one are rebuilt.
+
+        Returns:
+            The number of rollup rows created.
+        """
+        sales = Selling.objects.all()
+        rollups = SalesDailyRollup.objects.all()
+        if since is not None:
+            sales = sales.filter(date__gte=SalesDailyRollup.start_of_day(since))
+            rollups = rollups.filter(day__gte=since)
+        rows = (
+            sales.annotate(
+                day=TruncDate("date", tzinfo=timezone.get_default_timezone())
+            )
+            .values(*self.KEY_FIELDS)
+            .annotate(
+                total_quantity=Sum("quantity"),
+                total=Sum(F("quantity") * F("unit_price")),
+                nb_sales=Count("id"),
+            )
+            .order_by()
+        )
+        with transaction.atomic():
+            rollups.delete()
+            created = self.bulk_create(
+                (
+                    SalesDailyRollup(
+                        **{f: row[f] for f in self.KEY_FIELDS},
+                        quantity=row["total_quantity"],
+                        total=row["total"],
+                        nb_sales=row["nb_sales"],
+                    )
+                    for row in rows.iterator(chunk_size=2000)
+                ),
+                batch_size=2000,
+            )
+        return len(created)
+
+    def summary(self) -> dict[str, Decimal | int]:
+        """Aggregate the rollup rows.
+
+        Returns:
+            A dict with the total turnover (`total`), the number
+            of sold items (`quantity`) and the sum of the purchase prices
+            of the sold products (`purchase_price`).
+        """
+        return self.aggregate(
+            total=Sum("total", default=0),
+            quantity=Sum("quantity", default=0),
+            purchase_price=Sum(
+                F("product__purchase_price") * F("nb_sales"),
+                default=0,
+                output_field=CurrencyField(),
+            ),
+        )
+
+
+class SalesDailyRollup(models.Model):
+    """The sales of a day, grouped by counter, club, product and payment method.
+
+    This table is maintained incrementally each time a sale is created or deleted,
+    so that turnover computations don't have to go through the whole `Selling` table.
+    It can be fully recomputed with the `rebuild_sales_rollup` command.
+
+    Days are computed in the timezone of the site (`settings.TIME_ZONE`),
+    which means that the rollup can only be used to answer a query
+    whose bounds are at local midnight.
+    """
+
+    day = models.DateField(_("date"))
+    counter = models.ForeignKey(
+        Counter, related_name="+", null=True, on_delete=models.SET_NULL
+    )
+    club = models.ForeignKey(
+        Club, related_name="+", null=True, on_delete=models.SET_NULL
+    )
+    product = models.ForeignKey(
+        Product, related_name="+", null=True, on_delete=models.SET_NULL
+    )
+    payment_method = models.CharField(_("payment method"), max_length=255)
+    quantity = models.IntegerField(_("quantity"), default=0)
+    # the sum of a day of sales may not fit in a CurrencyField
+    total = models.DecimalField(_("total"), max_digits=16, decimal_places=2, default=0)
+    nb_sales = models.IntegerField(_("number of sales"), default=0)
+
+    objects = SalesDailyRollupQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _("sales daily rollup")
+        indexes = [
+            models.Index(fields=["counter", "day"]),
+            models.Index(fields=["club", "day"]),
+        ]
+
+    def __str__(self):
+        return f"{self.day} - {self.counter}: {self.product} x {self.quantity}"
+
+    @staticmethod
+    def day_of(value: datetime) -> date:
+        """Return the day of the rollup in which this datetime is."""
+        return timezone.localdate(value, timezone.get_default_timezone())
+
+    @staticmethod
+    def start_of_day(day: date) -> datetime:
+        """Return the datetime at which the given day of the rollup starts."""
+        return datetime.combine(day, time(0), tzinfo=timezone.get_default_timezone())
+
+    @staticmethod
+    def is_day_aligned(value: datetime | None) -> bool:
+        """Check if the rollup can be used for a window bound by this datetime."""
+        if value is None:
+            return True
+        local_value = timezone.localtime(value, timezone.get_default_timezone())
+        return local_value.time() == time(0)
+
+
 class Permanency(models.Model):
     """A permanency of a barman, on a counter.
 
@@ -1,9 +1,10 @@
+from decimal import Decimal
 from typing import Annotated, Self
 
 from annotated_types import MinLen
 from django.urls import reverse
 from ninja import Field, FilterSchema, ModelSchema, Schema
-from pydantic import model_validator
+from pydantic import NonNegativeInt, PositiveInt, model_validator
 
 from club.schemas import ClubSchema
 from core.schemas import GroupSchema, SimpleUserSchema
@@ -98,3 +99,20 @@ class ProductFilterSchema(FilterSchema):
     is_archived: bool | None = Field(None, q="archived")
     buying_groups: set[int] | None = Field(None, q="buying_groups__in")
     product_type: set[int] | None = Field(None, q="product_type__in")
+
+
+class BasketItemSchema(Schema):
+    id: NonNegativeInt
+    quantity: PositiveInt
+
+
+class BasketSchema(Schema):
+    items: Annotated[list[BasketItemSchema], MinLen(1)]
+
+
+class CheckoutResultSchema(Schema):
+    total: Decimal
+    """The amount of money debited from the customer account"""
+    customer_amount: Decimal
+    """The amount of money left on the customer account"""
+    recorded_products: int
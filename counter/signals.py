@@ -21,12 +21,21 @@
 #
 #
 
-from django.db.models.signals import pre_delete
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
 
+from club.models import Membership
 from core.middleware import get_signal_request
 from core.models import OperationLog
-from counter.models import Counter, Refilling, Selling
+from counter.models import (
+    Counter,
+    Permanency,
+    Product,
+    ProductType,
+    Refilling,
+    Selling,
+)
 
 
 def write_log(instance, operation_type):
@@ -66,3 +75,76 @@ def write_log_refilling_deletion(sender, instance, **kwargs):
 @receiver(pre_delete, sender=Selling, dispatch_uid="write_log_refilling_deletion")
 def write_log_selling_deletion(sender, instance, **kwargs):
     write_log(instance, "SELLING_DELETION")
+
+
+@receiver(post_save, sender=Product, dispatch_uid="product_catalogue_changed")
+@receiver(pre_delete, sender=Product, dispatch_uid="product_catalogue_deleted")
+def product_catalogue_changed(sender, instance: Product, **kwargs):
+    """Clear the catalogue of the counters selling the product."""
+    Counter.clear_catalogue_cache(instance.counters.values_list("id", flat=True))
+
+
+@receiver(
+    m2m_changed,
+    sender=Product.buying_groups.through,
+    dispatch_uid="product_buying_groups_changed",
+)
+def product_buying_groups_changed(sender, instance, action: str, **kwargs):
+    """Clear the catalogue of the counters selling the modified products."""
+    if not action.startswith("post_"):
+        return
+    if isinstance(instance, Product):
+        counters = instance.counters.all()
+    else:  # the m2m has been modified from the group side
+        counters = Counter.objects.filter(products__buying_groups=instance)
+    Counter.clear_catalogue_cache(counters.values_list("id", flat=True))
+
+
+@receiver(m2m_changed, sender=Counter.products.through, dispatch_uid="counter_products")
+def counter_products_changed(
+    sender,
+    instance,
+    action: str,
+    *,
+    reverse: bool,
+    pk_set: set[int] | None,
+    **kwargs,
+):
+    """Clear the catalogue of the counters whose products changed."""
+    if not reverse:
+        Counter.clear_catalogue_cache([instance.id])
+    elif action == "pre_clear":
+        # the counters are still linked to the product at this point
+        Counter.clear_catalogue_cache(instance.counters.values_list("id", flat=True))
+    elif pk_set:
+        Counter.clear_catalogue_cache(pk_set)
+
+
+@receiver(post_save, sender=ProductType, dispatch_uid="product_type_changed")
+@receiver(post_delete, sender=ProductType, dispatch_uid="product_type_deleted")
+def product_type_changed(sender, instance: ProductType, **kwargs):
+    """Clear the catalogue of all counters.
+
+    Product types are rarely modified, but they are used
+    in the catalogue of any counter.
+    """
+    Counter.clear_catalogue_cache(Counter.objects.values_list("id", flat=True))
+
+
+@receiver(post_save, sender=Permanency, dispatch_uid="permanency_changed")
+@receiver(post_delete, sender=Permanency, dispatch_uid="permanency_deleted")
+def permanency_changed(sender, instance: Permanency, **kwargs):
+    """Clear the cached shift of the counter of the permanency."""
+    Counter.clear_shift_cache([instance.counter_id])
+
+
+@receiver(post_save, sender=Membership, dispatch_uid="main_club_membership_changed")
+@receiver(post_delete, sender=Membership, dispatch_uid="main_club_membership_deleted")
+def main_club_membership_changed(sender, instance: Membership, **kwargs):
+    """Clear the cached shift of all counters.
+
+    Only the barmen who are members of the main club can refill accounts,
+    so the shifts must be recomputed when such a membership changes.
+    """
+    if instance.club_id == settings.SITH_MAIN_CLUB_ID:
+        Counter.clear_shift_cache(Counter.objects.values_list("id", flat=True))
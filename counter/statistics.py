@@ -0,0 +1,127 @@
+"""Statistics of the counters.
+
+The stats page of a counter shows leaderboards computed over
+all the sales and permanencies of the counter.
+On the biggest counters, this means aggregating hundreds of thousands
+of rows, so the results of the aggregations are cached for a short time.
+"""
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+from datetime import timezone as tz
+from decimal import Decimal
+from typing import TYPE_CHECKING, Any, Self
+
+from django.core.cache import cache
+from django.db.models import F, Sum
+from django.db.models.functions import ExtractHour
+
+from accounting.models import CurrencyField
+from core.utils import get_start_of_semester
+
+if TYPE_CHECKING:
+    from counter.models import Counter
+
+STATS_CACHE_DURATION = 10 * 60
+"""Duration (in seconds) during which the computed statistics are kept."""
+
+LEADERBOARD_SIZE = 100
+
+
+@dataclass
+class CounterStatistics:
+    """The statistics of a counter since a given date.
+
+    The leaderboards have the same format as the result
+    of `Counter.get_top_customers` and `Counter.get_top_barmen`.
+    """
+
+    total_sales: Decimal
+    top_customers: list[dict[str, Any]]
+    top_barmen: list[dict[str, Any]]
+    top_barmen_semester: list[dict[str, Any]]
+    sales_per_hour: list[Decimal]
+    """The turnover of each hour of the day (from 0h to 23h)."""
+    sales_per_product: list[dict[str, Any]]
+    """The quantity sold and the turnover of each sold item,
+    by descending turnover."""
+
+    @classmethod
+    def compute(cls, counter: Counter, since: datetime) -> Self:
+        """Compute the statistics of the counter.
+
+        Only the sales and the permanencies started after `since`
+        are taken into account, except for `top_barmen`,
+        which spans all the history of the counter.
+
+        The grouping and the ranking are done by the database ;
+        equal values are ranked by user id, so that the order
+        of the leaderboards is stable.
+        The sales are grouped by item and by hour in a single query,
+        from which the total, the sales per hour and per item are computed.
+        """
+        per_hour = [Decimal(0)] * 24
+        per_product: dict[str, dict[str, Any]] = {}
+        sales = (
+            counter.sellings.filter(date__gte=since)
+            .annotate(hour=ExtractHour("date"))
+            .values("label", "hour")
+            .annotate(
+                quantity=Sum("quantity"),
+                total=Sum(
+                    F("unit_price") * F("quantity"), output_field=CurrencyField()
+                ),
+            )
+            .values_list("label", "hour", "quantity", "total")
+            .order_by()
+        )
+        for label, hour, quantity, total in sales:
+            per_hour[hour] += total
+            product = per_product.setdefault(
+                label, {"label": label, "quantity": 0, "total": Decimal(0)}
+            )
+            product["quantity"] += quantity
+            product["total"] += total
+        top_customers = counter.get_top_customers(since=since).order_by(
+            "-selling_sum", "user"
+        )
+        top_barmen = counter.get_top_barmen().order_by("-perm_sum", "user")
+        return cls(
+            total_sales=sum(per_hour, Decimal(0)),
+            top_customers=list(top_customers[:LEADERBOARD_SIZE]),
+            top_barmen=list(top_barmen[:LEADERBOARD_SIZE]),
+            top_barmen_semester=list(
+                top_barmen.filter(start__gt=since)[:LEADERBOARD_SIZE]
+            ),
+            sales_per_hour=per_hour,
+            sales_per_product=sorted(
+                per_product.values(), key=lambda p: (-p["total"], p["label"])
+            ),
+        )
+
+
+def get_counter_statistics(
+    counter: Counter, since: datetime | date | None = None
+) -> CounterStatistics:
+    """Return the statistics of the counter since the given date.
+
+    By default, the date is the start of the current semester.
+
+    The statistics are cached by time buckets of `STATS_CACHE_DURATION` seconds :
+    all the requests made during the same bucket get the same result,
+    and the statistics are computed again for the next bucket.
+    """
+    if since is None:
+        since = get_start_of_semester()
+    if not isinstance(since, datetime):
+        since = datetime(since.year, since.month, since.day, tzinfo=tz.utc)
+    bucket = int(time.time()) // STATS_CACHE_DURATION
+    cache_key = f"counter_{counter.id}_stats_{since.timestamp():.0f}_{bucket}"
+    stats = cache.get(cache_key)
+    if stats is None:
+        stats = CounterStatistics.compute(counter, since)
+        cache.set(cache_key, stats, timeout=STATS_CACHE_DURATION)
+    return stats
@@ -166,3 +166,21 @@ class TestAccountDumpCommand(TestAccountDump):
         for sent in sent_mails:
             assert len(sent.to) == 1
             assert sent.to[0] in target_emails
+
+    def test_command_resume(self):
+        """Test that running the command again doesn't repeat the work done."""
+        call_command("dump_accounts", chunk_size=1)
+        assert len(mail.outbox) == 2
+        dumped_users = self.notified_users[1:]
+        self.assert_accounts_dumped([u.customer for u in dumped_users])
+
+        # pretend the command crashed before sending the last mail
+        last_dump = AccountDump.objects.filter(customer=dumped_users[-1].customer).get()
+        last_dump.dump_mail_sent_at = None
+        last_dump.save()
+        call_command("dump_accounts")
+        assert len(mail.outbox) == 3
+        assert mail.outbox[-1].to == [dumped_users[-1].email]
+        assert Selling.objects.filter(
+            customer__in=[u.customer for u in dumped_users]
+        ).count() == len(dumped_users)
@@ -13,34 +13,44 @@
 #
 #
 from dataclasses import asdict, dataclass
-from datetime import timedelta
+from datetime import date, datetime, timedelta
+from datetime import timezone as tz
 from decimal import Decimal
 
 import pytest
 from django.conf import settings
 from django.contrib.auth.models import make_password
 from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
 from django.http import HttpResponse
 from django.shortcuts import resolve_url
 from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.timezone import localdate, now
 from freezegun import freeze_time
 from model_bakery import baker
+from pytest_django.asserts import assertNumQueries, assertRedirects
 
 from club.models import Club, Membership
 from core.baker_recipes import board_user, subscriber_user, very_old_subscriber_user
 from core.models import BanGroup, User
-from counter.baker_recipes import product_recipe
+from core.utils import get_start_of_semester
+from counter.baker_recipes import product_recipe, sale_recipe
 from counter.models import (
+    TIMEOUT_SWEEP_CACHE_KEY,
     Counter,
     Customer,
     Permanency,
     Product,
     Refilling,
+    SalesDailyRollup,
     Selling,
 )
+from counter.statistics import get_counter_statistics
 
 
 class TestFullClickBase(TestCase):
@@ -79,6 +89,11 @@ class TestFullClickBase(TestCase):
             user=cls.club_admin,
         )
 
+    def setUp(self):
+        # the shifts of the counters are cached,
+        # but the permanencies of the previous test have been rolled back
+        cache.clear()
+
     def updated_amount(self, user: User) -> Decimal:
         user.refresh_from_db()
         user.customer.refresh_from_db()
@@ -585,6 +600,38 @@ class TestCounterClick(TestFullClickBase):
 
         assert self.updated_amount(self.customer) == Decimal("10")
 
+    def test_click_query_count_does_not_depend_on_basket_size(self):
+        self.refill_user(self.customer, 100)
+        self.login_in_bar()
+        # a first sale of each product creates its row in the daily sales rollup
+        self.submit_basket(
+            self.customer,
+            [
+                BasketItem(self.beer.id, 1),
+                BasketItem(self.beer_tap.id, 1),
+                BasketItem(self.snack.id, 1),
+            ],
+        )
+
+        with CaptureQueriesContext(connection) as small_basket:
+            res = self.submit_basket(self.customer, [BasketItem(self.snack.id, 1)])
+            assert res.status_code == 302
+        with CaptureQueriesContext(connection) as big_basket:
+            res = self.submit_basket(
+                self.customer,
+                [
+                    BasketItem(self.beer.id, 3),
+                    BasketItem(self.beer_tap.id, 7),
+                    BasketItem(self.snack.id, 2),
+                ],
+            )
+            assert res.status_code == 302
+        assert len(big_basket) == len(small_basket)
+        # 1 beer, 1 beer tap and 2 snacks,
+        # then 3 beers, 7 beer taps (one of them free) and 2 snacks
+        assert self.updated_amount(self.customer) == Decimal("77.5")
+        assert self.customer.customer.buyings.filter(unit_price=0).count() == 1
+
     def test_annotate_has_barman_queryset(self):
         """Test if the custom queryset method `annotate_has_barman` works as intended."""
         counters = Counter.objects.annotate_has_barman(self.barmen)
@@ -594,6 +641,168 @@ class TestCounterClick(TestFullClickBase):
             else:
                 assert not counter.has_annotated_barman
 
+    def checkout_api(
+        self, user: User, basket: list[BasketItem], counter: Counter | None = None
+    ) -> HttpResponse:
+        used_counter = counter if counter is not None else self.counter
+        return self.client.post(
+            reverse("api:counter_checkout", args=[used_counter.id, user.id]),
+            {"items": [asdict(item) for item in basket]},
+            content_type="application/json",
+        )
+
+    def test_checkout_api(self):
+        self.refill_user(self.customer, 20)
+        self.login_in_bar()
+        res = self.checkout_api(
+            self.customer,
+            [BasketItem(self.beer.id, 2), BasketItem(self.beer_tap.id, 6)],
+        )
+        assert res.status_code == 200
+        assert res.json() == {
+            "total": "10.50",
+            "customer_amount": "9.50",
+            "recorded_products": 0,
+        }
+
+    def test_checkout_api_not_enough_money(self):
+        self.refill_user(self.customer, 10)
+        self.login_in_bar()
+        res = self.checkout_api(self.customer, [BasketItem(self.beer.id, 7)])
+        assert res.status_code == 400
+        assert self.updated_amount(self.customer) == 10
+
+    def test_checkout_api_forbidden_product(self):
+        self.refill_user(self.underage_customer, 10)
+        self.login_in_bar()
+        res = self.checkout_api(self.underage_customer, [BasketItem(self.beer.id, 1)])
+        assert res.status_code == 400
+        assert self.updated_amount(self.underage_customer) == 10
+
+    def test_checkout_api_not_logged_in_counter(self):
+        self.refill_user(self.customer, 10)
+        res = self.checkout_api(self.customer, [BasketItem(self.beer.id, 1)])
+        assert res.status_code == 403
+        assert self.updated_amount(self.customer) == 10
+
+
+@pytest.mark.django_db
+class TestBulkCheckout:
+    @pytest.fixture
+    def customer(self) -> Customer:
+        customer = subscriber_user.make().customer
+        customer.amount = 10
+        customer.save()
+        return customer
+
+    def test_checkout(self, customer: Customer):
+        customer.user.preferences.notify_on_click = True
+        customer.user.preferences.save()
+        product = product_recipe.make(selling_price=2)
+        sales = Selling.objects.bulk_checkout(
+            customer,
+            [
+                Selling(label=product.name, product=product, unit_price=2, quantity=3),
+                Selling(label=product.name, product=product, unit_price=0, quantity=1),
+            ],
+        )
+        assert len(sales) == 2
+        assert customer.amount == 4
+        customer.refresh_from_db()
+        assert customer.amount == 4
+        assert list(customer.buyings.values_list("quantity", flat=True)) == [3, 1]
+        assert all(sale.is_validated for sale in customer.buyings.all())
+        assert customer.user.notifications.filter(type="SELLING").count() == 1
+
+    def test_not_enough_money(self, customer: Customer):
+        product = product_recipe.make(selling_price=6)
+        with pytest.raises(ValidationError):
+            Selling.objects.bulk_checkout(
+                customer,
+                [
+                    Selling(
+                        label=product.name, product=product, unit_price=6, quantity=2
+                    )
+                ],
+            )
+        customer.refresh_from_db()
+        assert customer.amount == 10
+        assert not customer.buyings.exists()
+
+    def test_allow_negative(self, customer: Customer):
+        product = product_recipe.make(selling_price=6)
+        Selling.objects.bulk_checkout(
+            customer,
+            [Selling(label=product.name, product=product, unit_price=6, quantity=2)],
+            allow_negative=True,
+        )
+        customer.refresh_from_db()
+        assert customer.amount == -2
+
+
+@pytest.mark.django_db
+class TestSalesDailyRollup:
+    @pytest.fixture
+    def counter(self) -> Counter:
+        counter = baker.make(Counter)
+        customer = subscriber_user.make().customer
+        product = product_recipe.make(purchase_price=1)
+        for day, quantity in ((1, 2), (1, 3), (2, 1), (3, 4)):
+            sale_recipe.make(
+                counter=counter,
+                product=product,
+                club=product.club,
+                customer=customer,
+                is_validated=True,
+                quantity=quantity,
+                unit_price=2,
+                date=datetime(2024, 5, day, 12, tzinfo=tz.utc),
+            )
+        return counter
+
+    def test_incremental_rollup(self, counter: Counter):
+        rollups = SalesDailyRollup.objects.filter(counter=counter).order_by("day")
+        assert list(rollups.values_list("day", "quantity", "total", "nb_sales")) == [
+            (date(2024, 5, 1), 5, 10, 2),
+            (date(2024, 5, 2), 1, 2, 1),
+            (date(2024, 5, 3), 4, 8, 1),
+        ]
+        counter.sellings.filter(date__day=3).get().delete()
+        counter.sellings.filter(date__day=2).delete()
+        sale = counter.sellings.filter(quantity=2).get()
+        sale.quantity = 5
+        sale.save()
+        assert list(rollups.values_list("day", "quantity", "total", "nb_sales")) == [
+            (date(2024, 5, 1), 8, 16, 2),
+            (date(2024, 5, 2), 0, 0, 0),
+            (date(2024, 5, 3), 0, 0, 0),
+        ]
+
+    def test_rebuild(self, counter: Counter):
+        expected = list(
+            SalesDailyRollup.objects.filter(counter=counter)
+            .order_by("day")
+            .values("day", "product", "quantity", "total", "nb_sales")
+        )
+        SalesDailyRollup.objects.all().delete()
+        call_command("rebuild_sales_rollup")
+        assert (
+            list(
+                SalesDailyRollup.objects.filter(counter=counter)
+                .order_by("day")
+                .values("day", "product", "quantity", "total", "nb_sales")
+            )
+            == expected
+        )
+
+    def test_get_total_sales(self, counter: Counter):
+        since = datetime(2024, 5, 2, tzinfo=timezone.get_default_timezone())
+        assert counter.get_total_sales(since) == 10
+        assert counter.get_total_sales(date(2024, 5, 2)) == 10
+        # the result is read from the rollup, not from the sales
+        SalesDailyRollup.objects.filter(counter=counter).delete()
+        assert counter.get_total_sales(since) == 0
+
 
 class TestCounterStats(TestCase):
     @classmethod
@@ -744,6 +953,45 @@ class TestCounterStats(TestCase):
             for user, sale_amount in zip(users, sale_amounts, strict=False)
         ]
 
+    def test_statistics(self):
+        """Test that the cached statistics are the same as the db aggregations."""
+        cache.clear()
+        with self.assertNumQueries(4):
+            # the sales, the top customers and the two barmen leaderboards
+            stats = get_counter_statistics(self.counter)
+        assert stats.total_sales == self.counter.get_total_sales()
+
+        def as_set(leaderboard):
+            return {tuple(sorted(row.items())) for row in leaderboard}
+
+        # some values are equal, so compare the leaderboards regardless of
+        # the order of the ties, then check that the ties are ranked by user id
+        assert as_set(stats.top_customers) == as_set(self.counter.get_top_customers())
+        assert as_set(stats.top_barmen) == as_set(self.counter.get_top_barmen())
+        assert as_set(stats.top_barmen_semester) == as_set(
+            self.counter.get_top_barmen().filter(start__gt=get_start_of_semester())
+        )
+        for leaderboard, key in [
+            (stats.top_customers, "selling_sum"),
+            (stats.top_barmen, "perm_sum"),
+            (stats.top_barmen_semester, "perm_sum"),
+        ]:
+            assert leaderboard == sorted(
+                leaderboard, key=lambda row, key=key: (-row[key], row["user"])
+            )
+        assert sum(stats.sales_per_hour) == 3102
+        assert stats.sales_per_product == [
+            {"label": "Barbar", "quantity": 1551, "total": 3102}
+        ]
+        with self.assertNumQueries(0):
+            get_counter_statistics(self.counter)
+
+    def test_stats_page(self):
+        self.client.force_login(self.root)
+        response = self.client.get(reverse("counter:stats", args=[self.counter.id]))
+        assert response.status_code == 200
+        assert "Barbar" in response.content.decode()
+
 
 class TestBarmanConnection(TestCase):
     @classmethod
@@ -756,6 +1004,9 @@ class TestBarmanConnection(TestCase):
 
         cls.counter = Counter.objects.get(id=2)
 
+    def setUp(self):
+        cache.clear()
+
     def test_barman_granted(self):
         self.client.post(
             reverse("counter:login", args=[self.counter.id]),
@@ -818,6 +1069,111 @@ def test_barman_timeout():
         assert bar.barmen_list == []
 
 
+@pytest.mark.django_db
+def test_sweep_barman_timeouts():
+    """Test that the sweeper command closes the timed out permanencies."""
+    cache.clear()
+    bars = baker.make(Counter, type="BAR", _quantity=2)
+    start = now()
+    for bar in bars:
+        baker.make(Permanency, counter=bar, start=start)
+    with freeze_time() as frozen_time:
+        frozen_time.tick(timedelta(minutes=settings.SITH_BARMAN_TIMEOUT + 2))
+        with assertNumQueries(3):
+            call_command("sweep_barman_timeouts", verbosity=0)
+        assert not Permanency.objects.filter(counter__in=bars, end=None).exists()
+        metrics = cache.get(TIMEOUT_SWEEP_CACHE_KEY)
+        assert metrics["closed"] == 2
+        assert metrics["lag"] >= timedelta(minutes=2)
+
+        # the views don't handle the timeouts if a sweep has just been done
+        baker.make(Permanency, counter=bars[0], start=start)
+        Permanency.objects.filter(counter=bars[0], end=None).update(activity=start)
+        assert Counter.objects.handle_timeout_if_needed() == 0
+        frozen_time.tick(
+            timedelta(seconds=settings.SITH_BARMAN_TIMEOUT_SWEEP_INTERVAL + 1)
+        )
+        assert Counter.objects.handle_timeout_if_needed() == 1
+
+
+@pytest.mark.django_db
+def test_barman_shift_cache(client: Client):
+    """Test that the barmen of a counter are cached and invalidated."""
+    cache.clear()
+    bar = baker.make(Counter, type="BAR")
+    barman = subscriber_user.make(password=make_password("plop"))
+    ae_member = board_user.make(password=make_password("plop"))
+    bar.sellers.add(barman, ae_member)
+    client.post(
+        reverse("counter:login", args=[bar.id]),
+        {"username": barman.username, "password": "plop"},
+    )
+    bar = Counter.objects.get(pk=bar.pk)
+    assert bar.get_shift().barman_ids == [barman.id]
+    with assertNumQueries(0):
+        assert bar.customer_is_barman(barman.customer)
+        assert not bar.can_refill()
+
+    client.post(
+        reverse("counter:login", args=[bar.id]),
+        {"username": ae_member.username, "password": "plop"},
+    )
+    bar = Counter.objects.get(pk=bar.pk)
+    assert bar.get_shift().barman_ids == [barman.id, ae_member.id]
+    assert bar.can_refill()
+
+    client.post(reverse("counter:logout", args=[bar.id]), {"user_id": ae_member.id})
+    bar = Counter.objects.get(pk=bar.pk)
+    assert bar.barmen_list == [barman]
+    assert not bar.can_refill()
+
+    with freeze_time() as frozen_time:
+        # a barman who timed out isn't a barman anymore,
+        # even if his permanency hasn't been closed by a sweep yet
+        frozen_time.tick(timedelta(minutes=settings.SITH_BARMAN_TIMEOUT + 1))
+        assert bar.get_shift().barman_ids == []
+        bar.update_activity()
+        assert bar.get_shift().barman_ids == []
+
+
+@pytest.mark.django_db
+def test_barman_timeout_before_sweep(client: Client):
+    """Test the counters between the timeout of a barman and the next sweep."""
+    cache.clear()
+    bar = baker.make(Counter, type="BAR")
+    barman = subscriber_user.make(password=make_password("plop"))
+    customer = subscriber_user.make()
+    bar.sellers.add(barman)
+    client.post(
+        reverse("counter:login", args=[bar.id]),
+        {"username": barman.username, "password": "plop"},
+    )
+    with freeze_time() as frozen_time:
+        frozen_time.tick(timedelta(minutes=settings.SITH_BARMAN_TIMEOUT + 1))
+        # a sweep has just been done, but the barman wasn't timed out yet
+        cache.set(TIMEOUT_SWEEP_CACHE_KEY, {"date": now()})
+        assert Counter.objects.handle_timeout_if_needed() == 0
+        assert Permanency.objects.filter(counter=bar, end=None).exists()
+
+        # the snapshot of the shift closes the permanency of the timed out barman
+        bar = Counter.objects.get(id=bar.id)
+        assert bar.barmen_list == []
+        assert not Counter.objects.annotate_is_open().get(id=bar.id).is_open
+        with pytest.raises(ValidationError):
+            bar.get_random_barman()
+        response = client.get(reverse("counter:click", args=[bar.id, customer.id]))
+        assertRedirects(response, bar.get_absolute_url())
+
+        # the barman can log in again, without his old permanency coming back
+        client.post(
+            reverse("counter:login", args=[bar.id]),
+            {"username": barman.username, "password": "plop"},
+        )
+        assert Permanency.objects.filter(counter=bar, end=None).count() == 1
+        frozen_time.tick(timedelta(minutes=1))
+        assert Counter.objects.get(id=bar.id).barmen_list == [barman]
+
+
 class TestClubCounterClickAccess(TestCase):
     @classmethod
     def setUpTestData(cls):
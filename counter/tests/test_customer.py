@@ -1,11 +1,15 @@
 import itertools
 import json
 import string
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
+from io import StringIO
 
 import pytest
 from django.conf import settings
 from django.contrib.auth.base_user import make_password
+from django.core.management import call_command
+from django.db import connection
 from django.test import Client, TestCase
 from django.urls import reverse
 from django.utils.timezone import now
@@ -16,6 +20,8 @@ from core.baker_recipes import board_user, subscriber_user
 from core.models import User
 from counter.baker_recipes import refill_recipe, sale_recipe
 from counter.models import (
+    AccountIdSequence,
+    BalanceMovement,
     BillingInfo,
     Counter,
     Customer,
@@ -465,3 +471,110 @@ def test_update_balance():
     for customer, amount in zip(customers, [40, 10, 20, 40, 0], strict=False):
         customer.refresh_from_db()
         assert customer.amount == amount
+
+
+@pytest.mark.django_db
+def test_balance_ledger():
+    customer = baker.make(Customer)
+    refill = refill_recipe.make(customer=customer, amount=30)
+    sale = sale_recipe.make(customer=customer, unit_price=5, quantity=2)
+    sale_recipe.make(customer=customer, unit_price=2, quantity=1)
+    sale.delete()
+    assert list(customer.balance_movements.values_list("amount", flat=True)) == [
+        30,
+        -10,
+        -2,
+        10,
+    ]
+    customer.refresh_from_db()
+    assert customer.amount == 28
+    qs = Customer.objects.filter(pk=customer.pk)
+    assert qs.annotate_ledger_amount().get().ledger_amount == 28
+
+    assert qs.checkpoint_balances() == 4
+    assert not customer.balance_movements.exists()
+    assert customer.balance_checkpoint.amount == 28
+    refill.delete()
+    assert qs.annotate_ledger_amount().get().ledger_amount == -2
+    assert qs.checkpoint_balances() == 1
+    customer.balance_checkpoint.refresh_from_db()
+    assert customer.balance_checkpoint.amount == -2
+
+
+@pytest.mark.django_db
+def test_update_balance_resets_ledger():
+    customer = baker.make(Customer)
+    refill_recipe.make(customer=customer, amount=30)
+    qs = Customer.objects.filter(pk=customer.pk)
+    qs.update(amount=50)
+    assert qs.annotate_ledger_amount().get().ledger_amount == 30
+    qs.update_amount()
+    assert not customer.balance_movements.exists()
+    customer = qs.annotate_ledger_amount().get()
+    assert customer.amount == customer.ledger_amount == 30
+
+
+@pytest.mark.django_db
+def test_check_balances_command():
+    customers = baker.make(Customer, _quantity=3)
+    for customer in customers:
+        refill_recipe.make(customer=customer, amount=20)
+    # the amount of this customer is modified without going through the ledger
+    Customer.objects.filter(pk=customers[1].pk).update(amount=12)
+    out = StringIO()
+    call_command("check_balances", "--chunk-size", "2", "--fix", stdout=out)
+    output = out.getvalue()
+    assert f"{customers[1].account_id} : 12.00 € (ledger : 20.00 €)" in output
+    assert "1 with a drift (total ledger drift : 8.00 €)" in output
+    customers[1].refresh_from_db()
+    assert customers[1].amount == 20
+    assert not BalanceMovement.objects.filter(customer__in=customers).exists()
+
+    out = StringIO()
+    call_command("check_balances", "--full", stdout=out)
+    assert "0 with a drift" in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_account_id_sequence():
+    """Test that the account ids are generated in sequence."""
+    AccountIdSequence.objects.all().delete()
+    last_number = AccountIdSequence.compute_last_number()
+    users = baker.make(User, _quantity=3)
+    account_ids = [Customer.get_or_create(user)[0].account_id for user in users]
+    assert [int(i[:-1]) for i in account_ids] == [
+        last_number + 1,
+        last_number + 2,
+        last_number + 3,
+    ]
+    assert AccountIdSequence.objects.get().last_number == last_number + 3
+
+    # an account id given by hand moves the sequence forward
+    baker.make(Customer, account_id=f"{last_number + 10}a")
+    assert AccountIdSequence.objects.get().last_number == last_number + 10
+    assert AccountIdSequence.next_account_id()[:-1] == str(last_number + 11)
+    # but it never moves it backward
+    baker.make(Customer, account_id=f"{last_number + 5}a")
+    assert AccountIdSequence.next_account_id()[:-1] == str(last_number + 12)
+
+
+@pytest.mark.skipif(
+    connection.vendor != "postgresql",
+    reason="SQLite can't lock rows, so concurrent writes fail instead of waiting",
+)
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_account_id_creation():
+    """Test that customers created at the same time get different account ids."""
+    users = baker.make(User, _quantity=10)
+
+    def create_customer(user: User) -> str:
+        try:
+            return Customer.get_or_create(user)[0].account_id
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=5) as executor:
+        account_ids = list(executor.map(create_customer, users))
+    assert len(set(account_ids)) == len(users)
+    numbers = sorted(int(i[:-1]) for i in account_ids)
+    assert numbers == list(range(numbers[0], numbers[0] + len(users)))
@@ -8,13 +8,15 @@ from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client
 from django.urls import reverse
+from django.utils.timezone import localdate
 from model_bakery import baker
 from PIL import Image
 from pytest_django.asserts import assertNumQueries
 
 from core.baker_recipes import board_user, subscriber_user
 from core.models import Group, User
-from counter.models import Product, ProductType
+from counter.baker_recipes import product_recipe
+from counter.models import Counter, Product, ProductType
 
 
 @pytest.mark.django_db
@@ -84,3 +86,60 @@ def test_fetch_product_nb_queries(client: Client):
         # - 1 for the actual request
         # - 1 to prefetch the related buying_groups
         client.get(reverse("api:search_products_detailed"))
+
+
+@pytest.mark.django_db
+class TestCounterCatalogue:
+    @pytest.fixture
+    def counter(self) -> Counter:
+        counter = baker.make(Counter)
+        counter.products.add(*product_recipe.make(_quantity=3))
+        cache.clear()
+        return counter
+
+    def test_catalogue_is_cached(self, counter: Counter):
+        with assertNumQueries(2):
+            assert len(counter.get_catalogue()) == 3
+        with assertNumQueries(0):
+            assert len(counter.get_catalogue()) == 3
+
+    def test_cache_invalidation(self, counter: Counter):
+        counter.get_catalogue()
+        new_product = product_recipe.make()
+        counter.products.add(new_product)
+        assert new_product in counter.get_catalogue()
+
+        new_product.name = "new name"
+        new_product.save()
+        catalogue = {p.id: p for p in counter.get_catalogue()}
+        assert catalogue[new_product.id].name == "new name"
+
+        group = baker.make(Group)
+        new_product.buying_groups.add(group)
+        catalogue = {p.id: p for p in counter.get_catalogue()}
+        assert catalogue[new_product.id].buying_group_ids == {group.id}
+
+        new_product.counters.clear()
+        assert new_product not in counter.get_catalogue()
+
+    def test_products_for_customer(self, counter: Counter):
+        group = baker.make(Group)
+        restricted, alcohol = counter.products.all()[:2]
+        restricted.buying_groups.add(group)
+        alcohol.limit_age = 18
+        alcohol.save()
+        customer = subscriber_user.make(date_of_birth=localdate().replace(year=2000))
+        counter.get_catalogue()
+
+        products = counter.get_products_for(customer.customer)
+        assert restricted not in products
+        assert alcohol in products
+
+        customer.groups.add(group)
+        customer.date_of_birth = localdate()
+        customer.save()
+        customer = User.objects.get(pk=customer.pk)
+        products = counter.get_products_for(customer.customer)
+        assert restricted in products
+        assert alcohol not in products
+        assert all(p.price == p.selling_price for p in products)
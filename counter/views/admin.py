@@ -28,6 +28,7 @@ from core.utils import get_semester_code, get_start_of_semester
 from core.views import CanEditMixin, CanViewMixin
 from counter.forms import CounterEditForm, ProductEditForm
 from counter.models import Counter, Product, ProductType, Refilling, Selling
+from counter.statistics import get_counter_statistics
 from counter.utils import is_logged_in_counter
 from counter.views.mixins import CounterAdminMixin, CounterAdminTabsMixin
 
@@ -206,19 +207,18 @@ class CounterStatView(DetailView, CounterAdminMixin):
     def get_context_data(self, **kwargs):
         """Add stats to the context."""
         counter: Counter = self.object
-        semester_start = get_start_of_semester()
-        office_hours = counter.get_top_barmen()
+        stats = get_counter_statistics(counter, since=get_start_of_semester())
         kwargs = super().get_context_data(**kwargs)
         kwargs.update(
             {
                 "counter": counter,
                 "current_semester": get_semester_code(),
-                "total_sellings": counter.get_total_sales(since=semester_start),
-                "top_customers": counter.get_top_customers(since=semester_start)[:100],
-                "top_barman": office_hours[:100],
-                "top_barman_semester": (
-                    office_hours.filter(start__gt=semester_start)[:100]
-                ),
+                "total_sellings": stats.total_sales,
+                "top_customers": stats.top_customers,
+                "top_barman": stats.top_barmen,
+                "top_barman_semester": stats.top_barmen_semester,
+                "sales_per_hour": stats.sales_per_hour,
+                "sales_per_product": stats.sales_per_product,
             }
         )
         return kwargs
@@ -50,4 +50,5 @@ def counter_logout(request: HttpRequest, counter_id: int) -> HttpResponseRedirec
     Permanency.objects.filter(counter=counter_id, user=request.POST["user_id"]).update(
         end=F("activity")
     )
+    Counter.clear_shift_cache([counter_id])
     return redirect("counter:details", counter_id=counter_id)
@@ -16,6 +16,7 @@ import math
 
 from django.core.exceptions import PermissionDenied
 from django.db import transaction
+from django.db.models import F
 from django.forms import (
     BaseFormSet,
     Form,
@@ -129,6 +130,57 @@ class BaseBasketForm(BaseFormSet):
         if not customer.can_record_more(self.total_recordings):
             raise ValidationError(_("This user have reached his recording limit"))
 
+    def get_sales(self, counter: Counter, seller: User) -> list[Selling]:
+        """Return the unsaved sales of the basket.
+
+        The tray bonus of each product is a separate sale, sold at 0 €.
+        """
+        lines = []
+        for form in self:
+            lines.append(
+                Selling(
+                    label=form.product.name,
+                    product=form.product,
+                    club_id=form.product.club_id,
+                    counter=counter,
+                    unit_price=form.product.price,
+                    quantity=form.cleaned_data["quantity"]
+                    - form.cleaned_data["bonus_quantity"],
+                    seller=seller,
+                )
+            )
+            if form.cleaned_data["bonus_quantity"] > 0:
+                lines.append(
+                    Selling(
+                        label=f"{form.product.name} (Plateau)",
+                        product=form.product,
+                        club_id=form.product.club_id,
+                        counter=counter,
+                        unit_price=0,
+                        quantity=form.cleaned_data["bonus_quantity"],
+                        seller=seller,
+                    )
+                )
+        return lines
+
+    def checkout(self, counter: Counter, seller: User) -> list[Selling]:
+        """Register the sales of the validated basket.
+
+        Raises:
+            ValidationError: if the customer has been debited by someone else
+                in the meantime and hasn't enough money anymore.
+        """
+        customer = self[0].customer
+        with transaction.atomic():
+            sales = Selling.objects.bulk_checkout(
+                customer, self.get_sales(counter, seller)
+            )
+            if self.total_recordings != 0:
+                Customer.objects.filter(pk=customer.pk).update(
+                    recorded_products=F("recorded_products") - self.total_recordings
+                )
+        return sales
+
 
 BasketForm = formset_factory(
     ProductForm, formset=BaseBasketForm, absolute_max=None, min_num=1
@@ -175,6 +227,7 @@ class CounterClick(CounterTabsMixin, CanViewMixin, SingleObjectMixin, FormView):
 
         if obj.type == "BAR" and (
             not obj.is_open
+            or not obj.barmen_list
             or "counter_token" not in request.session
             or request.session["counter_token"] != obj.token
         ):
@@ -191,39 +244,10 @@ class CounterClick(CounterTabsMixin, CanViewMixin, SingleObjectMixin, FormView):
             return ret
 
         operator = get_operator(self.request, self.object, self.customer)
-        with transaction.atomic():
-            self.request.session["last_basket"] = []
-
-            for form in formset:
-                self.request.session["last_basket"].append(
-                    f"{form.cleaned_data['quantity']} x {form.product.name}"
-                )
-
-                Selling(
-                    label=form.product.name,
-                    product=form.product,
-                    club=form.product.club,
-                    counter=self.object,
-                    unit_price=form.product.price,
-                    quantity=form.cleaned_data["quantity"]
-                    - form.cleaned_data["bonus_quantity"],
-                    seller=operator,
-                    customer=self.customer,
-                ).save()
-                if form.cleaned_data["bonus_quantity"] > 0:
-                    Selling(
-                        label=f"{form.product.name} (Plateau)",
-                        product=form.product,
-                        club=form.product.club,
-                        counter=self.object,
-                        unit_price=0,
-                        quantity=form.cleaned_data["bonus_quantity"],
-                        seller=operator,
-                        customer=self.customer,
-                    ).save()
-
-            self.customer.recorded_products -= formset.total_recordings
-            self.customer.save()
+        self.request.session["last_basket"] = [
+            f"{form.cleaned_data['quantity']} x {form.product.name}" for form in formset
+        ]
+        formset.checkout(self.object, operator)
 
         # Add some info for the main counter view to display
         self.request.session["last_customer"] = self.customer.user.get_display_name()
@@ -21,6 +21,7 @@
 # Place - Suite 330, Boston, MA 02111-1307, USA.
 #
 #
+import itertools
 import logging
 import math
 from functools import partial
@@ -48,7 +49,6 @@ from core.views import (
     CanEditMixin,
     CanEditPropMixin,
     CanViewMixin,
-    can_view,
 )
 from core.views.widgets.markdown import MarkdownInput
 from core.views.widgets.select import (
@@ -80,25 +80,39 @@ class ForumSearchView(ListView):
         queryset = queryset.load_all()
         queryset = queryset.load_all_queryset(
             ForumMessage,
-            ForumMessage.objects.all()
-            .prefetch_related("topic__forum__edit_groups")
-            .prefetch_related("topic__forum__view_groups")
-            .prefetch_related("topic__forum__owner_club"),
+            ForumMessage.objects.select_related("topic__forum__owner_club"),
         )
 
-        # Filter unauthorized responses
+        # Filter unauthorized responses.
+        # A topic can be viewed by the users who can view its forum,
+        # so the permissions are checked once for all the forums of the results.
+        resolver = self.request.user.permission_resolver
         resp = []
-        count = 0
         max_count = 30
-        for r in queryset:
-            if count >= max_count:
+        chunk_size = 100
+        viewable_forums: dict[int, bool] = {}
+        for start in itertools.count(step=chunk_size):
+            messages = [r.object for r in queryset[start : start + chunk_size]]
+            if not messages:
                 return resp
-            if can_view(r.object, self.request.user) and can_view(
-                r.object.topic, self.request.user
-            ):
-                resp.append(r.object)
-                count += 1
-        return resp
+            forums = {
+                m.topic.forum_id: m.topic.forum
+                for m in messages
+                if m.topic.forum_id not in viewable_forums
+            }
+            viewable_forums |= dict.fromkeys(forums, False)
+            viewable_forums |= {
+                f.id: True for f in resolver.bulk_can_view(forums.values())
+            }
+            for message in messages:
+                if not viewable_forums[message.topic.forum_id]:
+                    continue
+                # deleted messages can only be viewed by the forum moderators
+                if message._deleted and not resolver.can_view(message):
+                    continue
+                resp.append(message)
+                if len(resp) >= max_count:
+                    return resp
 
 
 class ForumMainView(ListView):
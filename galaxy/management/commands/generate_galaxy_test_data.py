@@ -302,6 +302,7 @@ class Command(BaseCommand):
             self.picts[i].compressed.name = self.picts[i].name
             self.picts[i].thumbnail.name = self.picts[i].name
         Picture.objects.bulk_create(self.picts)
+        SithFile.fill_tree_paths()
         self.picts = list(Picture.objects.filter(name__startswith="galaxy-").all())
 
     def make_pictures_memberships(self):
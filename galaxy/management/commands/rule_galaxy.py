@@ -38,6 +38,34 @@ class Command(BaseCommand):
         "environment."
     )
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes computing the lanes",
+        )
+        parser.add_argument(
+            "--shard-size",
+            type=int,
+            default=500,
+            help="Number of citizen whose lanes are computed and saved at once",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help=(
+                "Only update the current galaxy with the users "
+                "whose relations changed since it was ruled"
+            ),
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Resume the ruling of the last galaxy which hasn't been published yet",
+        )
+
     def handle(self, *args, **options):
         logger = logging.getLogger("main")
         if not 0 <= options["verbosity"] <= 2:
@@ -52,9 +80,18 @@ class Command(BaseCommand):
         else:
             logger.setLevel(logging.ERROR)
 
+        if options["incremental"] and (galaxy := Galaxy.get_current_galaxy()):
+            logger.info("The Galaxy is being refreshed by the Sith.")
+            galaxy.refresh()
+            return
+
         logger.info("The Galaxy is being ruled by the Sith.")
-        galaxy = Galaxy.objects.create()
-        galaxy.rule()
+        galaxy = None
+        if options["resume"]:
+            galaxy = Galaxy.objects.filter(state__isnull=True).last()
+        if galaxy is None:
+            galaxy = Galaxy.objects.create()
+        galaxy.rule(workers=options["workers"], shard_size=options["shard_size"])
         logger.info("Sending old galaxies' remains to garbage.")
         Galaxy.objects.filter(state__isnull=True).delete()
 
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.17 on 2026-10-18 21:46
+
+from django.db import migrations, models
+from django.db.migrations.state import StateApps
+
+
+def mark_published_stars(apps: StateApps, schema_editor):
+    """The stars of the published galaxies have all their lanes."""
+    GalaxyStar = apps.get_model("galaxy", "GalaxyStar")
+    GalaxyStar.objects.filter(galaxy__state__isnull=False).update(ruled=True)
+
+
+class Migration(migrations.Migration):
+    dependencies = [("galaxy", "0002_auto_20230412_1130")]
+
+    operations = [
+        migrations.AddField(
+            model_name="galaxystar",
+            name="ruled",
+            field=models.BooleanField(
+                default=False,
+                help_text="Whether the lanes of this star have all been created",
+                verbose_name="ruled",
+            ),
+        ),
+        migrations.RunPython(mark_published_stars, migrations.RunPython.noop),
+    ]
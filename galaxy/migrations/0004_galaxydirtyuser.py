@@ -0,0 +1,33 @@
+# Generated by Django 4.2.17 on 2026-10-18 21:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("galaxy", "0003_galaxystar_ruled"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GalaxyDirtyUser",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="+",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="user",
+                    ),
+                ),
+                ("date", models.DateTimeField(verbose_name="date")),
+            ],
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 4.2.17 on 2026-10-18 21:52
+
+import gzip
+import hashlib
+import json
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.migrations.state import StateApps
+
+
+def compact_published_states(apps: StateApps, schema_editor):
+    """Convert the states of the published galaxies to the compact format,
+    and build the neighbours of their stars.
+    """
+    Galaxy = apps.get_model("galaxy", "Galaxy")
+    GalaxyStar = apps.get_model("galaxy", "GalaxyStar")
+    GalaxyLane = apps.get_model("galaxy", "GalaxyLane")
+    for galaxy in Galaxy.objects.filter(state__isnull=False):
+        nodes = [[n["id"], n["name"], n["mass"]] for n in galaxy.state["nodes"]]
+        positions = {node[0]: i for i, node in enumerate(nodes)}
+        galaxy.state = {
+            "nodes": nodes,
+            "links": [
+                [positions[link["source"]], positions[link["target"]], link["value"]]
+                for link in galaxy.state["links"]
+            ],
+        }
+        galaxy.compressed_state = gzip.compress(
+            json.dumps(galaxy.state, separators=(",", ":")).encode(), mtime=0
+        )
+        galaxy.state_etag = hashlib.sha256(galaxy.compressed_state).hexdigest()
+        galaxy.save()
+
+        neighbours = defaultdict(list)
+        lanes = GalaxyLane.objects.filter(star1__galaxy=galaxy).values_list(
+            "star1__owner_id",
+            "star2__owner_id",
+            "distance",
+            "family",
+            "pictures",
+            "clubs",
+        )
+        for owner1_id, owner2_id, distance, family, pictures, clubs in lanes:
+            for owner_id, other_id in (owner1_id, owner2_id), (owner2_id, owner1_id):
+                _, name, mass = nodes[positions[other_id]]
+                neighbours[owner_id].append(
+                    {
+                        "id": other_id,
+                        "name": name,
+                        "mass": mass,
+                        "distance": distance,
+                        "family": family,
+                        "pictures": pictures,
+                        "clubs": clubs,
+                    }
+                )
+        stars = list(GalaxyStar.objects.filter(galaxy=galaxy))
+        for star in stars:
+            star.neighbours = sorted(
+                neighbours[star.owner_id], key=lambda n: n["distance"]
+            )
+        GalaxyStar.objects.bulk_update(stars, fields=["neighbours"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [("galaxy", "0004_galaxydirtyuser")]
+
+    operations = [
+        migrations.AddField(
+            model_name="galaxy",
+            name="compressed_state",
+            field=models.BinaryField(null=True, verbose_name="compressed state"),
+        ),
+        migrations.AddField(
+            model_name="galaxy",
+            name="state_etag",
+            field=models.CharField(
+                default="", max_length=64, verbose_name="state ETag"
+            ),
+        ),
+        migrations.AddField(
+            model_name="galaxystar",
+            name="neighbours",
+            field=models.JSONField(
+                default=list,
+                help_text="The citizen linked to this star, by ascending distance",
+                verbose_name="neighbours",
+            ),
+        ),
+        migrations.RunPython(compact_published_states, migrations.RunPython.noop),
+    ]
@@ -23,20 +23,33 @@
 
 from __future__ import annotations
 
+import gzip
+import hashlib
+import json
 import logging
 import math
 import time
-from typing import NamedTuple, TypedDict
-
-from django.db import models
-from django.db.models import Case, Count, F, Q, Value, When
+from collections import Counter, defaultdict
+from concurrent.futures import as_completed
+from dataclasses import dataclass
+from itertools import chain, combinations
+from typing import TYPE_CHECKING, Any, NamedTuple, Self, TypedDict
+
+from django.db import models, transaction
+from django.db.models import Case, Count, F, Q, QuerySet, Value, When
 from django.db.models.functions import Concat
+from django.utils import timezone
 from django.utils.timezone import localdate
 from django.utils.translation import gettext_lazy as _
 
-from club.models import Club
+from club.models import Club, Membership
 from core.models import User
-from sas.models import Picture
+from core.utils import fork_process_pool
+from sas.models import PeoplePictureRelation, Picture
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+    from datetime import date
 
 
 class GalaxyStar(models.Model):
@@ -68,6 +81,16 @@ class GalaxyStar(models.Model):
         on_delete=models.CASCADE,
         null=True,
     )
+    ruled = models.BooleanField(
+        _("ruled"),
+        default=False,
+        help_text=_("Whether the lanes of this star have all been created"),
+    )
+    neighbours = models.JSONField(
+        _("neighbours"),
+        default=list,
+        help_text=_("The citizen linked to this star, by ascending distance"),
+    )
 
     def __str__(self):
         return str(self.owner)
@@ -83,7 +106,9 @@ def current_star(self) -> GalaxyStar | None:
         The star of this user if there is an active Galaxy
         and this user is a citizen of it, else `None`
     """
-    return self.stars.filter(galaxy=Galaxy.get_current_galaxy()).last()
+    # the state of the galaxy can weigh several megabytes, so it isn't loaded
+    galaxy = Galaxy.objects.filter(state__isnull=False).only("id").last()
+    return self.stars.filter(galaxy=galaxy).last()
 
 
 # Adding a shortcut to User class for getting its star belonging to the latest ruled Galaxy
@@ -131,15 +156,63 @@ class GalaxyLane(models.Model):
         return f"{self.star1} -> {self.star2} ({self.distance})"
 
 
-class StarDict(TypedDict):
-    id: int
-    name: str
-    mass: int
+class GalaxyDirtyUser(models.Model):
+    """A user whose relations changed since the galaxy was ruled.
+
+    The users are marked by signals each time one of their
+    pictures, memberships, subscriptions or family links changes.
+    Those marks are used to update the galaxy incrementally
+    (see :meth:`Galaxy.refresh`).
+    """
+
+    # Users may be marked while they are being deleted,
+    # so there is no foreign key constraint to enforce.
+    user = models.OneToOneField(
+        User,
+        verbose_name=_("user"),
+        related_name="+",
+        primary_key=True,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+    )
+    date = models.DateTimeField(_("date"))
+
+    def __str__(self):
+        return f"{self.user_id} ({self.date})"
+
+    @classmethod
+    def mark(cls, user_ids: Iterable[int]) -> None:
+        """Mark the given users as changed."""
+        now = timezone.now()
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, date=now) for user_id in set(user_ids)],
+            update_conflicts=True,
+            unique_fields=["user"],
+            update_fields=["date"],
+        )
 
 
 class GalaxyDict(TypedDict):
-    nodes: list[StarDict]
-    links: list
+    """The compact state of a galaxy, sent to the 3d graph.
+
+    Each node is a `[user id, name, mass]` triplet,
+    and each link a `[source node index, target node index, distance]` triplet.
+    """
+
+    nodes: list[list[int | str]]
+    links: list[list[int]]
+
+
+class NeighbourDict(TypedDict):
+    """A citizen linked to a star, as stored in :attr:`GalaxyStar.neighbours`."""
+
+    id: int
+    name: str
+    mass: int
+    distance: int
+    family: int
+    pictures: int
+    clubs: int
 
 
 class RelationScore(NamedTuple):
@@ -148,6 +221,253 @@ class RelationScore(NamedTuple):
     clubs: int
 
 
+@dataclass
+class RelationGraph:
+    """The relations between a set of users, loaded all at once.
+
+    Computing the relation score of each pair of users with
+    :meth:`Galaxy.compute_users_score` means several queries per pair,
+    which becomes millions of queries on the real data.
+    Instead, this graph loads the godfather links, the pictures
+    and the memberships of all the users in a few queries,
+    then computes the scores in memory.
+
+    Only the pairs of users sharing at least one relation are stored,
+    every other pair having a score of zero.
+    """
+
+    family: Counter[tuple[int, int]]
+    """Number of godfather links between two users."""
+    pictures: Counter[tuple[int, int]]
+    """Number of pictures on which two users are both identified."""
+    memberships: dict[int, dict[int, list[tuple[date, date | None]]]]
+    """The (start, end) of the memberships of each user, grouped by club."""
+    neighbours: dict[int, set[int]]
+    """The users sharing at least one relation with each user."""
+    today: date
+
+    @classmethod
+    def load(cls, users: QuerySet[User], around: QuerySet[User] | None = None) -> Self:
+        """Load the relations between the given users.
+
+        Relations with users outside the `users` queryset are ignored.
+        If `around` is given, only the relations of the users
+        of this queryset are loaded.
+        """
+        user_ids = users.values("id")
+        if around is None:
+            center_ids, center = user_ids, None
+            family_filter = Q(from_user__in=user_ids, to_user__in=user_ids)
+            pictures_filter = Q(user_id__lt=F("picture__people__user_id"))
+            memberships = Membership.objects.filter(user__in=user_ids)
+        else:
+            center_ids, center = (
+                around.values("id"),
+                set(around.values_list("id", flat=True)),
+            )
+            family_filter = Q(from_user__in=center_ids, to_user__in=user_ids) | Q(
+                from_user__in=user_ids, to_user__in=center_ids
+            )
+            pictures_filter = Q(user_id__lt=F("picture__people__user_id")) | Q(
+                user_id__gt=F("picture__people__user_id")
+            )
+            memberships = Membership.objects.filter(
+                user__in=user_ids,
+                club__in=Membership.objects.filter(user__in=center_ids).values("club"),
+            )
+
+        family = Counter(
+            _pair(from_id, to_id)
+            for from_id, to_id in User.godfathers.through.objects.filter(
+                family_filter
+            ).values_list("from_user_id", "to_user_id")
+        )
+        # When the relations are loaded around some users, the pairs of two
+        # of those users are fetched in both orders, with the same count.
+        pictures = Counter(
+            {
+                _pair(user1_id, user2_id): count
+                for user1_id, user2_id, count in PeoplePictureRelation.objects.filter(
+                    pictures_filter,
+                    user__in=center_ids,
+                    picture__in=Picture.objects.all(),
+                    picture__people__user__in=user_ids,
+                )
+                .values("user_id", "picture__people__user_id")
+                .annotate(count=Count("picture_id"))
+                .values_list("user_id", "picture__people__user_id", "count")
+            }
+        )
+        user_memberships = defaultdict(lambda: defaultdict(list))
+        club_members = defaultdict(set)
+        for club_id, user_id, start, end in memberships.values_list(
+            "club_id", "user_id", "start_date", "end_date"
+        ):
+            user_memberships[user_id][club_id].append((start, end))
+            club_members[club_id].add(user_id)
+
+        neighbours = defaultdict(set)
+        if center is None:
+            club_pairs = (combinations(members, 2) for members in club_members.values())
+        else:
+            club_pairs = (
+                (
+                    (user1_id, user2_id)
+                    for user1_id in members & center
+                    for user2_id in members
+                    if user2_id != user1_id
+                )
+                for members in club_members.values()
+            )
+        for user1_id, user2_id in chain(family.keys(), pictures.keys(), *club_pairs):
+            neighbours[user1_id].add(user2_id)
+            neighbours[user2_id].add(user1_id)
+        return cls(
+            family=family,
+            pictures=pictures,
+            memberships=user_memberships,
+            neighbours=neighbours,
+            today=localdate(),
+        )
+
+    def score(self, user1_id: int, user2_id: int) -> RelationScore:
+        """Compute the relationship scores of the two given users.
+
+        The result is the same as the one of :meth:`Galaxy.compute_users_score`.
+        """
+        pair = _pair(user1_id, user2_id)
+        return RelationScore(
+            family=self.family[pair] * Galaxy.FAMILY_LINK_POINTS,
+            pictures=self.pictures[pair] * Galaxy.PICTURE_POINTS,
+            clubs=self.clubs_score(user1_id, user2_id),
+        )
+
+    def clubs_score(self, user1_id: int, user2_id: int) -> int:
+        """Same as :meth:`Galaxy.compute_users_clubs_score`, without any query."""
+        memberships1 = self.memberships.get(user1_id, {})
+        memberships2 = self.memberships.get(user2_id, {})
+        score = 0
+        for club_id in memberships1.keys() & memberships2.keys():
+            for start1, end1 in memberships1[club_id]:
+                until1 = end1 or self.today
+                for start2, end2 in memberships2[club_id]:
+                    overlap = (
+                        start2 <= start1 and (end2 is None or end2 >= start1)
+                    ) or (start1 <= start2 <= until1)
+                    if not overlap:
+                        continue
+                    earliest_end = min(until1, end2 or self.today)
+                    latest_start = max(start1, start2)
+                    score += Galaxy.CLUBS_POINTS * (earliest_end - latest_start).days
+        return score
+
+    def compute_lanes(
+        self, user_ids: list[int], positions: dict[int, int]
+    ) -> list[tuple[int, int, int, RelationScore]]:
+        """Compute the lanes between the given users and the ones before them.
+
+        Args:
+            user_ids: the ids of the users at the first end of the lanes
+            positions: the position of each user in the galaxy.
+                Each user is linked only to the users with a lower position.
+
+        Returns:
+            The (user1_id, user2_id, distance, score) of each lane,
+            ordered like `user_ids`, then by the position of user2.
+        """
+        lanes = []
+        for user1_id in user_ids:
+            neighbours = sorted(
+                (
+                    user2_id
+                    for user2_id in self.neighbours.get(user1_id, ())
+                    if positions[user2_id] < positions[user1_id]
+                ),
+                key=positions.__getitem__,
+            )
+            for user2_id in neighbours:
+                lane = self.compute_lane(user1_id, user2_id)
+                if lane is not None:
+                    lanes.append(lane)
+        return lanes
+
+    def compute_lanes_around(
+        self, user_ids: set[int], positions: dict[int, int]
+    ) -> list[tuple[int, int, int, RelationScore]]:
+        """Compute all the lanes of the given users.
+
+        Each lane goes from the user with the highest position to the other one,
+        like in :meth:`compute_lanes`.
+        """
+        lanes = []
+        for user_id in user_ids:
+            for other_id in self.neighbours.get(user_id, ()):
+                if other_id in user_ids and other_id < user_id:
+                    continue  # this pair is examined from the other side
+                user1_id, user2_id = sorted(
+                    (user_id, other_id), key=positions.__getitem__, reverse=True
+                )
+                lane = self.compute_lane(user1_id, user2_id)
+                if lane is not None:
+                    lanes.append(lane)
+        return lanes
+
+    def compute_lane(
+        self, user1_id: int, user2_id: int
+    ) -> tuple[int, int, int, RelationScore] | None:
+        """Return the lane between the two users, if they are close enough."""
+        score = self.score(user1_id, user2_id)
+        distance = Galaxy.scale_distance(sum(score))
+        if distance >= 30:  # TODO: this needs tuning with real-world data
+            return None
+        return user1_id, user2_id, distance, score
+
+
+_shared_relations: dict[str, Any] = {}
+"""The relation graph and the positions of the citizen,
+inherited by the worker processes when they are forked."""
+
+
+def _compute_shard_lanes(
+    shard: list[int],
+) -> tuple[list[int], list[tuple[int, int, int, RelationScore]]]:
+    graph, positions = _shared_relations["graph"], _shared_relations["positions"]
+    return shard, graph.compute_lanes(shard, positions)
+
+
+def _compute_shards_lanes(
+    graph: RelationGraph,
+    positions: dict[int, int],
+    shards: list[list[int]],
+    workers: int,
+) -> Iterator[tuple[list[int], list[tuple[int, int, int, RelationScore]]]]:
+    """Yield each shard with its lanes, as soon as they are computed.
+
+    When there are several workers, the shards are computed
+    by a pool of forked processes, which share the graph with
+    the main process instead of receiving a copy of it.
+    Those processes don't touch the database : all the lanes
+    are saved by the main process.
+    """
+    if workers <= 1:
+        for shard in shards:
+            yield shard, graph.compute_lanes(shard, positions)
+        return
+    _shared_relations.update(graph=graph, positions=positions)
+    executor = fork_process_pool(workers)
+    try:
+        futures = [executor.submit(_compute_shard_lanes, shard) for shard in shards]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        executor.shutdown(cancel_futures=True)
+        _shared_relations.clear()
+
+
+def _pair(user1_id: int, user2_id: int) -> tuple[int, int]:
+    return (user1_id, user2_id) if user1_id < user2_id else (user2_id, user1_id)
+
+
 class Galaxy(models.Model):
     """The Galaxy, a graph linking the active users between each others.
 
@@ -177,8 +497,13 @@ class Galaxy(models.Model):
     FAMILY_LINK_POINTS = 366  # Equivalent to a leap year together in a club, because.
     PICTURE_POINTS = 2  # Equivalent to two days as random members of a club.
     CLUBS_POINTS = 1  # One day together as random members in a club is one point.
+    LANES_BATCH_SIZE = 10_000  # Number of lanes saved in a single query.
 
     state = models.JSONField(_("The galaxy current state"), null=True)
+    compressed_state = models.BinaryField(
+        _("compressed state"), null=True, editable=False
+    )
+    state_etag = models.CharField(_("state ETag"), max_length=64, default="")
 
     class Meta:
         ordering = ["pk"]
@@ -229,6 +554,37 @@ class Galaxy(models.Model):
 
         return user_score
 
+    @classmethod
+    def compute_users_masses(cls, users: QuerySet[User]) -> dict[int, int]:
+        """Compute the individual score of all the given users at once.
+
+        The result is the same as the one of :meth:`compute_user_score`,
+        but it takes a constant number of queries, whatever the number of users.
+
+        Returns:
+            The score of each user having at least one relation.
+            The score of the other users is 0.
+        """
+        user_ids = users.values("id")
+        godfathers = User.godfathers.through.objects
+        relations = [
+            (godfathers, "to_user", cls.FAMILY_LINK_POINTS),  # godchildren
+            (godfathers, "from_user", cls.FAMILY_LINK_POINTS),  # godfathers
+            (PeoplePictureRelation.objects, "user", cls.PICTURE_POINTS),
+            (Membership.objects, "user", cls.CLUBS_POINTS),
+        ]
+        scores = Counter()
+        for queryset, user_field, points in relations:
+            counts = (
+                queryset.filter(**{f"{user_field}__in": user_ids})
+                .values(user_field)
+                .annotate(count=Count("id"))
+                .values_list(user_field, "count")
+            )
+            for user_id, count in counts:
+                scores[user_id] += count * points
+        return {user_id: int(math.log2(1 + score)) for user_id, score in scores.items()}
+
     @classmethod
     def query_user_score(cls, user: User) -> int:
         """Get the individual score of the given user in the galaxy."""
@@ -406,7 +762,12 @@ class Galaxy(models.Model):
         cls.logger.debug(f"\t\t> Scaled distance: {value}")
         return int(value)
 
-    def rule(self, picture_count_threshold=10) -> None:
+    def rule(
+        self,
+        picture_count_threshold: int = 10,
+        workers: int = 1,
+        shard_size: int = 500,
+    ) -> None:
         """Main function of the Galaxy.
 
         Iterate over all the rulable users to promote them to citizens.
@@ -419,125 +780,122 @@ class Galaxy(models.Model):
         This does very effectively limit the quantity of computing to do
         and only includes users who have had a minimum of activity.
 
-        This method still remains very expensive, so think thoroughly before
+        The citizen are split in shards of `shard_size` stars,
+        whose lanes are computed by `workers` processes.
+        The lanes of each shard are saved as soon as they are computed,
+        so if the ruling is interrupted, calling this method again
+        on the same galaxy resumes it where it stopped
+        (in this case, the citizen are not listed again and
+        `picture_count_threshold` is ignored).
+
+        This method still remains expensive, so think thoroughly before
         you call it, especially in production.
 
         :param picture_count_threshold: the minimum number of picture to have to be
                                         included in the galaxy
+        :param workers: the number of processes computing the lanes
+        :param shard_size: the number of citizen whose lanes are computed at once
         """
         total_time = time.time()
-        self.logger.info("Listing rulable citizen.")
-        rulable_users = (
+        started_at = timezone.now()
+        resumed = self.stars.exists()
+        if resumed:
+            self.logger.info(f"Resuming the ruling of {self}.")
+        else:
+            self.create_stars(picture_count_threshold)
+        self.create_lanes(workers=workers, shard_size=shard_size)
+        self.publish()
+        if not resumed:
+            # the changes made before the ruling started are all in this galaxy
+            GalaxyDirtyUser.objects.filter(date__lte=started_at).delete()
+
+        total_time = time.time() - total_time
+        total_time_hours = int(total_time // 3600)
+        total_time_minutes = int(total_time // 60 % 60)
+        total_time_seconds = int(total_time % 60)
+        self.logger.info(
+            f"{self} ruled in {total_time:.2f} seconds ({total_time_hours} hours, {total_time_minutes} minutes, {total_time_seconds} seconds)"
+        )
+
+    @classmethod
+    def rulable_users(cls, picture_count_threshold: int) -> QuerySet[User]:
+        """The users who can become citizen of a galaxy."""
+        return (
             User.objects.filter(subscriptions__isnull=False)
             .annotate(pictures_count=Count("pictures"))
             .filter(pictures_count__gt=picture_count_threshold)
             .distinct()
         )
 
-        # force fetch of the whole query to make sure there won't
-        # be any more db hits
-        # this is memory expensive but prevents a lot of db hits, therefore
-        # is far more time efficient
+    def create_stars(self, picture_count_threshold: int) -> None:
+        """Promote the rulable users to citizen of this galaxy."""
+        self.logger.info("Listing rulable citizen.")
+        rulable_users = self.rulable_users(picture_count_threshold)
+        user_ids = list(rulable_users.values_list("id", flat=True))
+        self.logger.info(f"{len(user_ids)} citizen have been listed. Starting to rule.")
 
-        rulable_users = list(rulable_users)
-        rulable_users_count = len(rulable_users)
-        user1_count = 0
-        self.logger.info(
-            f"{rulable_users_count} citizen have been listed. Starting to rule."
+        self.logger.info("Creating stars for all citizen")
+        masses = self.compute_users_masses(rulable_users)
+        GalaxyStar.objects.bulk_create(
+            [
+                GalaxyStar(owner_id=user_id, galaxy=self, mass=masses.get(user_id, 0))
+                for user_id in user_ids
+            ]
         )
 
-        stars = []
-        self.logger.info("Creating stars for all citizen")
-        for user in rulable_users:
-            star = GalaxyStar(
-                owner=user, galaxy=self, mass=self.compute_user_score(user)
-            )
-            stars.append(star)
-        GalaxyStar.objects.bulk_create(stars)
-
-        stars = {}
-        for star in GalaxyStar.objects.filter(galaxy=self):
-            stars[star.owner.id] = star
-
-        self.logger.info("Creating lanes between stars")
-        # Display current speed every $speed_count_frequency users
-        speed_count_frequency = max(rulable_users_count // 10, 1)  # ten time at most
-        global_avg_speed_accumulator = 0
-        global_avg_speed_count = 0
-        t_global_start = time.time()
-        while len(rulable_users) > 0:
-            user1 = rulable_users.pop()
-            user1_count += 1
-            rulable_users_count2 = len(rulable_users)
-
-            star1 = stars[user1.id]
-
-            user_avg_speed = 0
-            user_avg_speed_count = 0
-
-            tstart = time.time()
-            lanes = []
-            for user2_count, user2 in enumerate(rulable_users, start=1):
-                self.logger.debug("")
-                self.logger.debug(
-                    f"\t> Examining '{user1}' ({user1_count}/{rulable_users_count}) with '{user2}' ({user2_count}/{rulable_users_count2})"
-                )
+    def create_lanes(self, workers: int = 1, shard_size: int = 500) -> None:
+        """Create the lanes between the stars which are not ruled yet.
 
-                star2 = stars[user2.id]
+        Each pair of citizen is examined once, the star created last being star1.
+        When all the lanes of a star have been created, the star is marked as ruled.
+        """
+        # Lanes of stars which are not ruled can only be remains
+        # of a ruling interrupted before this checkpoint existed.
+        GalaxyLane.objects.filter(star1__galaxy=self, star1__ruled=False).delete()
+        self.logger.info("Loading the relations between citizen")
+        citizen = list(self.stars.order_by("pk").values_list("id", "owner_id", "ruled"))
+        star_ids = {owner_id: star_id for star_id, owner_id, _ in citizen}
+        positions = {owner_id: i for i, (_, owner_id, _) in enumerate(citizen)}
+        remaining = [owner_id for _, owner_id, ruled in reversed(citizen) if not ruled]
+        shards = [
+            remaining[i : i + shard_size] for i in range(0, len(remaining), shard_size)
+        ]
+        graph = RelationGraph.load(User.objects.filter(stars__galaxy=self))
 
-                score = Galaxy.compute_users_score(user1, user2)
-                distance = self.scale_distance(sum(score))
-                if distance < 30:  # TODO: this needs tuning with real-world data
-                    lanes.append(
+        self.logger.info(
+            f"Creating lanes between stars ({len(remaining)}/{len(citizen)} "
+            f"stars to rule in {len(shards)} shards, with {workers} workers)"
+        )
+        start = time.time()
+        for shard_count, (shard, lanes) in enumerate(
+            _compute_shards_lanes(graph, positions, shards, workers), start=1
+        ):
+            with transaction.atomic():
+                GalaxyLane.objects.bulk_create(
+                    [
                         GalaxyLane(
-                            star1=star1,
-                            star2=star2,
+                            star1_id=star_ids[user1_id],
+                            star2_id=star_ids[user2_id],
                             distance=distance,
                             family=score.family,
                             pictures=score.pictures,
                             clubs=score.clubs,
                         )
-                    )
-
-                if user2_count % speed_count_frequency == 0:
-                    tend = time.time()
-                    delta = tend - tstart
-                    speed = float(speed_count_frequency) / delta
-                    user_avg_speed += speed
-                    user_avg_speed_count += 1
-                    self.logger.debug(
-                        f"\tSpeed: {speed:.2f} users per second (time for last {speed_count_frequency} citizens: {delta:.2f} second)"
-                    )
-                    tstart = time.time()
-
-            GalaxyLane.objects.bulk_create(lanes)
-
-            self.logger.info("")
-
-            t_global_end = time.time()
-            global_delta = t_global_end - t_global_start
-            speed = 1.0 / global_delta
-            global_avg_speed_accumulator += speed
-            global_avg_speed_count += 1
-            global_avg_speed = global_avg_speed_accumulator / global_avg_speed_count
-
-            self.logger.info(f" Ruling of {self} ".center(60, "#"))
-            self.logger.info(
-                f"Progression: {user1_count}/{rulable_users_count} citizen -- {rulable_users_count - user1_count} remaining"
-            )
-            self.logger.info(f"Speed: {60.0*global_avg_speed:.2f} citizen per minute")
-
-            # We can divide the computed ETA by 2 because each loop, there is one citizen less to check, and maths tell
-            # us that this averages to a division by two
-            eta = rulable_users_count2 / global_avg_speed / 2
-            eta_hours = int(eta // 3600)
-            eta_minutes = int(eta // 60 % 60)
+                        for user1_id, user2_id, distance, score in lanes
+                    ],
+                    batch_size=self.LANES_BATCH_SIZE,
+                )
+                GalaxyStar.objects.filter(
+                    id__in=[star_ids[user_id] for user_id in shard]
+                ).update(ruled=True)
+            eta = (time.time() - start) / shard_count * (len(shards) - shard_count)
             self.logger.info(
-                f"ETA: {eta_hours} hours {eta_minutes} minutes ({eta / 3600 / 24:.2f} days)"
+                f"Progression: {shard_count}/{len(shards)} shards "
+                f"-- ETA: {int(eta // 3600)} hours {int(eta // 60 % 60)} minutes"
             )
-            self.logger.info("#" * 60)
-            t_global_start = time.time()
 
+    def publish(self) -> None:
+        """Make this galaxy the one shown to the world, and delete the former ones."""
         # Here, we get the IDs of the old galaxies that we'll need to delete. In normal operation, only one galaxy
         # should be returned, and we can't delete it yet, as it's the one still displayed by the Sith.
         old_galaxies_pks = list(
@@ -547,24 +905,101 @@ class Galaxy(models.Model):
             f"These old galaxies will be deleted once the new one is ready: {old_galaxies_pks}"
         )
 
-        # Making the state sets this new galaxy as being ready. From now on, the Sith will show us to the world.
-        self.make_state()
+        with transaction.atomic():
+            # Making the state sets this new galaxy as being ready. From now on, the Sith will show us to the world.
+            self.make_state()
 
-        # Avoid accident if there is nothing to delete
-        if len(old_galaxies_pks) > 0:
-            # Former galaxies can now be deleted.
-            Galaxy.objects.filter(pk__in=old_galaxies_pks).delete()
+            # Avoid accident if there is nothing to delete
+            if len(old_galaxies_pks) > 0:
+                # Former galaxies can now be deleted.
+                Galaxy.objects.filter(pk__in=old_galaxies_pks).delete()
 
-        total_time = time.time() - total_time
-        total_time_hours = int(total_time // 3600)
-        total_time_minutes = int(total_time // 60 % 60)
-        total_time_seconds = int(total_time % 60)
-        self.logger.info(
-            f"{self} ruled in {total_time:.2f} seconds ({total_time_hours} hours, {total_time_minutes} minutes, {total_time_seconds} seconds)"
+    def refresh(self, picture_count_threshold: int = 10) -> None:
+        """Update this galaxy with the users whose relations changed since its ruling.
+
+        Those users are the ones marked by :class:`GalaxyDirtyUser`.
+        Their stars are created, updated or deleted,
+        and all their lanes are computed again, then the state is regenerated.
+        This is way faster than ruling a new galaxy,
+        as the cost only depends on the number of users who changed.
+
+        However, the club scores of the other users keep the value
+        they had when their lanes were computed, even when their
+        memberships are still ongoing.
+        A full ruling should thus still be done from time to time.
+
+        :param picture_count_threshold: the minimum number of picture to have to be
+                                        included in the galaxy. It should be
+                                        the one used to rule this galaxy.
+        """
+        started_at = timezone.now()
+        dirty_ids = set(GalaxyDirtyUser.objects.values_list("user_id", flat=True))
+        self.logger.info(f"{len(dirty_ids)} users changed since the last ruling.")
+        rulable_users = {
+            user.id: user
+            for user in self.rulable_users(picture_count_threshold).filter(
+                id__in=dirty_ids
+            )
+        }
+        masses = self.compute_users_masses(
+            User.objects.filter(id__in=rulable_users.keys())
         )
+        with transaction.atomic():
+            self.stars.filter(owner_id__in=dirty_ids - rulable_users.keys()).delete()
+            stars = {
+                star.owner_id: star
+                for star in self.stars.filter(owner_id__in=rulable_users.keys())
+            }
+            for user in rulable_users.values():
+                star = stars.setdefault(
+                    user.id, GalaxyStar(owner=user, galaxy=self, ruled=True)
+                )
+                star.mass = masses.get(user.id, 0)
+            GalaxyStar.objects.bulk_update(
+                [s for s in stars.values() if s.pk is not None], fields=["mass"]
+            )
+            GalaxyStar.objects.bulk_create([s for s in stars.values() if s.pk is None])
+            GalaxyLane.objects.filter(
+                Q(star1__in=stars.values()) | Q(star2__in=stars.values())
+            ).delete()
+
+            citizen = list(self.stars.order_by("pk").values_list("id", "owner_id"))
+            star_ids = {owner_id: star_id for star_id, owner_id in citizen}
+            positions = {owner_id: i for i, (_, owner_id) in enumerate(citizen)}
+            graph = RelationGraph.load(
+                User.objects.filter(stars__galaxy=self),
+                around=User.objects.filter(id__in=rulable_users.keys()),
+            )
+            lanes = graph.compute_lanes_around(set(rulable_users), positions)
+            GalaxyLane.objects.bulk_create(
+                [
+                    GalaxyLane(
+                        star1_id=star_ids[user1_id],
+                        star2_id=star_ids[user2_id],
+                        distance=distance,
+                        family=score.family,
+                        pictures=score.pictures,
+                        clubs=score.clubs,
+                    )
+                    for user1_id, user2_id, distance, score in lanes
+                ],
+                batch_size=self.LANES_BATCH_SIZE,
+            )
+            self.logger.info(
+                f"{len(stars)} stars and {len(lanes)} lanes have been updated."
+            )
+            self.make_state()
+            GalaxyDirtyUser.objects.filter(
+                user_id__in=dirty_ids, date__lte=started_at
+            ).delete()
 
     def make_state(self) -> None:
-        """Compute JSON structure to send to 3d-force-graph: https://github.com/vasturiano/3d-force-graph/."""
+        """Compute the state of the galaxy, in the format of :class:`GalaxyDict`.
+
+        The state is also stored gzipped, with its ETag,
+        in order to be served without any further processing.
+        The neighbours of each star are computed at the same time.
+        """
         self.logger.info(
             "Caching current Galaxy state for a quicker display of the Empire's power."
         )
@@ -580,7 +1015,7 @@ class Galaxy(models.Model):
             F("owner__nick_name"),
             Value(")"),
         )
-        stars = (
+        stars = list(
             GalaxyStar.objects.filter(galaxy=self)
             .order_by(
                 "owner"
@@ -595,32 +1030,39 @@ class Galaxy(models.Model):
         lanes = (
             GalaxyLane.objects.filter(star1__galaxy=self)
             .order_by(
-                "star1"
+                "star1", "pk"
             )  # This helps determinism for the tests and doesn't cost much
-            .annotate(
-                star1_owner=F("star1__owner__id"),
-                star2_owner=F("star2__owner__id"),
+            .values_list(
+                "star1_id", "star2_id", "distance", "family", "pictures", "clubs"
             )
         )
-        json = GalaxyDict(
-            nodes=[
-                StarDict(
-                    id=star.owner_id,
-                    name=star.owner_name,
-                    mass=star.mass,
+        positions = {star.id: i for i, star in enumerate(stars)}
+        nodes = [[star.owner_id, star.owner_name, star.mass] for star in stars]
+        links = []
+        neighbours = defaultdict(list)
+        for star1_id, star2_id, distance, family, pictures, clubs in lanes:
+            links.append([positions[star1_id], positions[star2_id], distance])
+            for star_id, other_star_id in (star1_id, star2_id), (star2_id, star1_id):
+                owner_id, name, mass = nodes[positions[other_star_id]]
+                neighbours[star_id].append(
+                    NeighbourDict(
+                        id=owner_id,
+                        name=name,
+                        mass=mass,
+                        distance=distance,
+                        family=family,
+                        pictures=pictures,
+                        clubs=clubs,
+                    )
                 )
-                for star in stars
-            ],
-            links=[],
+        for star in stars:
+            star.neighbours = sorted(neighbours[star.id], key=lambda n: n["distance"])
+        GalaxyStar.objects.bulk_update(stars, fields=["neighbours"], batch_size=1000)
+
+        self.state = GalaxyDict(nodes=nodes, links=links)
+        self.compressed_state = gzip.compress(
+            json.dumps(self.state, separators=(",", ":")).encode(), mtime=0
         )
-        for path in lanes:
-            json["links"].append(
-                {
-                    "source": path.star1_owner,
-                    "target": path.star2_owner,
-                    "value": path.distance,
-                }
-            )
-        self.state = json
+        self.state_etag = hashlib.sha256(self.compressed_state).hexdigest()
         self.save()
         self.logger.info(f"{self} is now ready!")
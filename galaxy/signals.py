@@ -0,0 +1,45 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from club.models import Membership
+from core.models import User
+from galaxy.models import GalaxyDirtyUser
+from sas.models import PeoplePictureRelation
+from subscription.models import Subscription
+
+
+@receiver(post_save, sender=PeoplePictureRelation, dispatch_uid="galaxy_picture")
+@receiver(post_delete, sender=PeoplePictureRelation, dispatch_uid="galaxy_picture_del")
+@receiver(post_save, sender=Membership, dispatch_uid="galaxy_membership")
+@receiver(post_delete, sender=Membership, dispatch_uid="galaxy_membership_del")
+def user_relation_changed(
+    sender, instance: PeoplePictureRelation | Membership, **kwargs
+):
+    """Mark the user of the picture identification or membership as changed."""
+    GalaxyDirtyUser.mark([instance.user_id])
+
+
+@receiver(post_save, sender=Subscription, dispatch_uid="galaxy_subscription")
+@receiver(post_delete, sender=Subscription, dispatch_uid="galaxy_subscription_del")
+def subscription_changed(sender, instance: Subscription, **kwargs):
+    """Mark the subscriber as changed, as only subscribers can be citizen."""
+    GalaxyDirtyUser.mark([instance.member_id])
+
+
+@receiver(m2m_changed, sender=User.godfathers.through, dispatch_uid="galaxy_family")
+def family_changed(
+    sender,
+    instance: User,
+    action: str,
+    *,
+    reverse: bool,
+    pk_set: set[int] | None,
+    **kwargs,
+):
+    """Mark the users whose godfathers or godchildren changed."""
+    if action == "pre_clear":
+        # the users are still linked at this point
+        related = instance.godchildren if reverse else instance.godfathers
+        GalaxyDirtyUser.mark([instance.id, *related.values_list("id", flat=True)])
+    elif action in ("post_add", "post_remove"):
+        GalaxyDirtyUser.mark([instance.id, *pk_set])
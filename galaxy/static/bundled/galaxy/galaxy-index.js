@@ -10,6 +10,22 @@ import SpriteText from "three-spritetext";
  * @property {string} dataUrl url to fetch the galaxy data from
  **/
 
+/**
+ * Convert the compact galaxy state sent by the server
+ * (node triplets and link triplets referencing the nodes by index)
+ * to the format used by 3d-force-graph
+ * @param {{nodes: [number, string, number][], links: [number, number, number][]}} state
+ **/
+const decodeGalaxyState = (state) => {
+  const nodes = state.nodes.map(([id, name, mass]) => ({ id, name, mass }));
+  const links = state.links.map(([source, target, value]) => ({
+    source: nodes[source].id,
+    target: nodes[target].id,
+    value,
+  }));
+  return { nodes, links };
+};
+
 /**
  * Load the galaxy of an user
  * @param {GalaxyConfig} config
@@ -67,12 +83,14 @@ window.loadGalaxy = (config) => {
   const grpahDiv = document.getElementById("3d-graph");
   const Graph = ForceGraph3D();
   Graph(grpahDiv);
-  Graph.jsonUrl(config.dataUrl)
-    .width(
-      grpahDiv.parentElement.clientWidth > 1200
-        ? 1200
-        : grpahDiv.parentElement.clientWidth,
-    ) // Not perfect at all. JS-fu master from the future, please fix this :-)
+  fetch(config.dataUrl)
+    .then((res) => res.json())
+    .then((state) => Graph.graphData(decodeGalaxyState(state)));
+  Graph.width(
+    grpahDiv.parentElement.clientWidth > 1200
+      ? 1200
+      : grpahDiv.parentElement.clientWidth,
+  ) // Not perfect at all. JS-fu master from the future, please fix this :-)
     .height(1000)
     .enableNodeDrag(false) // allow easier navigation
     .onNodeClick((node) => {
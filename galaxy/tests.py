@@ -21,16 +21,29 @@
 #
 #
 
+import gzip
+import itertools
 import json
+from datetime import timedelta
 from pathlib import Path
+from unittest import mock
 
 import pytest
 from django.core.management import call_command
 from django.test import TestCase
 from django.urls import reverse
+from django.utils.timezone import localdate
 
+from club.models import Membership
 from core.models import User
-from galaxy.models import Galaxy
+from galaxy.models import (
+    Galaxy,
+    GalaxyDirtyUser,
+    GalaxyLane,
+    RelationGraph,
+    _compute_shards_lanes,
+)
+from sas.models import PeoplePictureRelation, Picture
 
 
 class TestGalaxyModel(TestCase):
@@ -57,6 +70,18 @@ class TestGalaxyModel(TestCase):
             assert Galaxy.compute_user_score(self.public) == 8
             assert Galaxy.compute_user_score(self.com) == 1
 
+    def test_users_masses(self):
+        """Test that the masses computed all at once are the individual scores."""
+        users = User.objects.filter(
+            id__in=[
+                u.id for u in (self.root, self.skia, self.sli, self.krophil, self.com)
+            ]
+        )
+        with self.assertNumQueries(4):
+            masses = Galaxy.compute_users_masses(users)
+        for user in users:
+            assert masses.get(user.id, 0) == Galaxy.compute_user_score(user)
+
     def test_users_score(self):
         """Test on the default dataset generated by the `populate` command
         that the relation scores are correct.
@@ -134,14 +159,112 @@ class TestGalaxyModel(TestCase):
         self.maxDiff = None  # Yes, we want to see the diff if any
         self.assertDictEqual(expected_scores, computed_scores)
 
+    def test_relation_graph(self):
+        """Test that the scores computed in memory are the same
+        as the ones computed by the db.
+        """
+        users = [
+            self.root,
+            self.skia,
+            self.sli,
+            self.krophil,
+            self.richard,
+            self.subscriber,
+            self.public,
+            self.com,
+        ]
+        with self.assertNumQueries(3):
+            graph = RelationGraph.load(
+                User.objects.filter(id__in=[u.id for u in users])
+            )
+        for user1, user2 in itertools.permutations(users, 2):
+            assert graph.score(user1.id, user2.id) == Galaxy.compute_users_score(
+                user1, user2
+            )
+
     def test_rule(self):
         """Test on the default dataset generated by the `populate` command
         that the number of queries to rule the galaxy is stable.
         """
         galaxy = Galaxy.objects.create()
-        with self.assertNumQueries(58):
+        with self.assertNumQueries(26):
             galaxy.rule(0)  # We want everybody here
 
+    def test_rule_resume(self):
+        """Test that an interrupted ruling can be resumed by several workers."""
+        galaxy = Galaxy.objects.create()
+        galaxy.rule(0)
+        state = galaxy.state
+
+        def interrupted_ruling(*args, **kwargs):
+            yield next(_compute_shards_lanes(*args, **kwargs))
+            raise RuntimeError
+
+        resumed = Galaxy.objects.create()
+        resumed.create_stars(0)
+        with (
+            mock.patch("galaxy.models._compute_shards_lanes", interrupted_ruling),
+            pytest.raises(RuntimeError),
+        ):
+            resumed.create_lanes(shard_size=1)
+        assert resumed.stars.filter(ruled=True).count() == 1
+        assert resumed.state is None
+
+        resumed.rule(workers=2, shard_size=1)
+        assert not resumed.stars.filter(ruled=False).exists()
+        assert resumed.state == state
+        assert not Galaxy.objects.filter(id=galaxy.id).exists()
+
+    def test_refresh(self):
+        """Test that refreshing a galaxy gives the same result as ruling it again."""
+
+        def galaxy_content(galaxy: Galaxy):
+            lanes = GalaxyLane.objects.filter(star1__galaxy=galaxy).select_related(
+                "star1", "star2"
+            )
+            return (
+                dict(galaxy.stars.values_list("owner_id", "mass")),
+                {
+                    frozenset((lane.star1.owner_id, lane.star2.owner_id)): (
+                        lane.distance,
+                        lane.family,
+                        lane.pictures,
+                        lane.clubs,
+                    )
+                    for lane in lanes
+                },
+            )
+
+        galaxy = Galaxy.objects.create()
+        galaxy.rule(0)
+        assert not GalaxyDirtyUser.objects.exists()
+
+        PeoplePictureRelation.objects.create(
+            user=self.subscriber,
+            picture=Picture.objects.filter(people__user=self.skia).first(),
+        )
+        self.sli.godfathers.add(self.krophil)
+        Membership.objects.create(
+            user=self.subscriber,
+            club=self.skia.memberships.first().club,
+            start_date=localdate() - timedelta(days=30),
+        )
+        assert set(GalaxyDirtyUser.objects.values_list("user_id", flat=True)) == {
+            self.subscriber.id,
+            self.sli.id,
+            self.krophil.id,
+        }
+
+        galaxy.refresh(0)
+        assert not GalaxyDirtyUser.objects.exists()
+        refreshed = galaxy_content(galaxy)
+        assert self.subscriber.id in refreshed[0]
+        assert {node[0] for node in galaxy.state["nodes"]} == refreshed[0].keys()
+
+        expected = Galaxy.objects.create()
+        expected.rule(0)
+        assert refreshed == galaxy_content(expected)
+
 
 @pytest.mark.slow
 class TestGalaxyView(TestCase):
@@ -189,3 +312,34 @@ class TestGalaxyView(TestCase):
         (galaxy_dir / "test_galaxy_state.json").write_text(json.dumps(state))
 
         assert state == json.loads((galaxy_dir / "ref_galaxy_state.json").read_text())
+
+    def test_gzipped_state(self):
+        """Test that the state is sent gzipped, with an ETag."""
+        self.client.force_login(self.root)
+        url = reverse("galaxy:data")
+        response = self.client.get(url, headers={"Accept-Encoding": "gzip"})
+        assert response["Content-Encoding"] == "gzip"
+        assert (
+            json.loads(gzip.decompress(response.content)) == self.client.get(url).json()
+        )
+
+        response = self.client.get(url, headers={"If-None-Match": response["ETag"]})
+        assert response.status_code == 304
+
+    def test_user_data(self):
+        """Test that the neighbours of a citizen are the ones of the galaxy state."""
+        self.client.force_login(self.root)
+        user = User.objects.get(last_name="n°500")
+        response = self.client.get(reverse("galaxy:user_data", args=[user.id]))
+        assert response.status_code == 200
+        neighbours = response.json()["neighbours"]
+
+        state = Galaxy.get_current_galaxy().state
+        ids = [node[0] for node in state["nodes"]]
+        expected = [
+            (ids[target] if ids[source] == user.id else ids[source], distance)
+            for source, target, distance in state["links"]
+            if user.id in (ids[source], ids[target])
+        ]
+        assert sorted((n["id"], n["distance"]) for n in neighbours) == sorted(expected)
+        assert neighbours == sorted(neighbours, key=lambda n: n["distance"])
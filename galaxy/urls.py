@@ -23,9 +23,10 @@
 
 from django.urls import path
 
-from galaxy.views import GalaxyDataView, GalaxyUserView
+from galaxy.views import GalaxyDataView, GalaxyUserDataView, GalaxyUserView
 
 urlpatterns = [
     path("<int:user_id>/", GalaxyUserView.as_view(), name="user"),
+    path("<int:user_id>/data.json", GalaxyUserDataView.as_view(), name="user_data"),
     path("data.json", GalaxyDataView.as_view(), name="data"),
 ]
@@ -21,10 +21,13 @@
 #
 #
 
-from django.db.models import Case, F, Q, Value, When
-from django.db.models.functions import Concat
-from django.http import Http404, JsonResponse
+import gzip
+
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import method_decorator
 from django.utils.translation import gettext_lazy as _
+from django.views.decorators.http import condition
 from django.views.generic import DetailView, View
 
 from core.models import User
@@ -33,68 +36,79 @@ from core.views import (
     FormerSubscriberMixin,
     UserTabsMixin,
 )
-from galaxy.models import Galaxy, GalaxyLane
+from galaxy.models import Galaxy, GalaxyStar
+
+
+class CitizenMixin:
+    """Give access to the star of the user in the current galaxy.
 
+    If the user is not a citizen of the current galaxy, raise a 404.
+    """
 
-class GalaxyUserView(CanViewMixin, UserTabsMixin, DetailView):
     model = User
     pk_url_kwarg = "user_id"
-    template_name = "galaxy/user.jinja"
-    current_tab = "galaxy"
 
     def get_object(self, *args, **kwargs):
         user: User = super().get_object(*args, **kwargs)
-        if user.current_star is None:
+        self.star: GalaxyStar | None = user.current_star
+        if self.star is None:
             raise Http404(_("This citizen has not yet joined the galaxy"))
         return user
 
+
+class GalaxyUserView(CitizenMixin, CanViewMixin, UserTabsMixin, DetailView):
+    template_name = "galaxy/user.jinja"
+    current_tab = "galaxy"
+
     def get_context_data(self, **kwargs):
-        kwargs = super().get_context_data(**kwargs)
-        kwargs["lanes"] = (
-            GalaxyLane.objects.filter(
-                Q(star1=self.object.current_star) | Q(star2=self.object.current_star)
-            )
-            .order_by("distance")
-            .annotate(
-                other_star_id=Case(
-                    When(star1=self.object.current_star, then=F("star2__owner__id")),
-                    default=F("star1__owner__id"),
-                ),
-                other_star_mass=Case(
-                    When(star1=self.object.current_star, then=F("star2__mass")),
-                    default=F("star1__mass"),
-                ),
-                other_star_name=Case(
-                    When(
-                        star1=self.object.current_star,
-                        then=Case(
-                            When(
-                                star2__owner__nick_name=None,
-                                then=Concat(
-                                    F("star2__owner__first_name"),
-                                    Value(" "),
-                                    F("star2__owner__last_name"),
-                                ),
-                            )
-                        ),
-                    ),
-                    default=Case(
-                        When(
-                            star1__owner__nick_name=None,
-                            then=Concat(
-                                F("star1__owner__first_name"),
-                                Value(" "),
-                                F("star1__owner__last_name"),
-                            ),
-                        )
-                    ),
-                ),
-            )
-            .select_related("star1", "star2")
+        return super().get_context_data(**kwargs) | {"star": self.star}
+
+
+class GalaxyUserDataView(CitizenMixin, CanViewMixin, DetailView):
+    """The neighbours of a citizen in the current galaxy."""
+
+    def render_to_response(self, context, **response_kwargs):
+        return JsonResponse(
+            {
+                "id": self.object.id,
+                "mass": self.star.mass,
+                "neighbours": self.star.neighbours,
+            }
         )
-        return kwargs
+
+
+def current_state_etag(request, *args, **kwargs) -> str | None:
+    return (
+        Galaxy.objects.filter(state__isnull=False)
+        .values_list("state_etag", flat=True)
+        .last()
+    )
 
 
 class GalaxyDataView(FormerSubscriberMixin, View):
+    """The state of the current galaxy, in the format of `GalaxyDict`.
+
+    The state is gzipped once and for all when the galaxy is published,
+    so it is sent as is to the clients which accept gzip.
+    """
+
+    @method_decorator(condition(etag_func=current_state_etag))
     def get(self, request, *args, **kwargs):
-        return JsonResponse(Galaxy.get_current_galaxy().state)
+        galaxy = (
+            Galaxy.objects.filter(state__isnull=False).only("compressed_state").last()
+        )
+        if galaxy is None:
+            raise Http404
+        compressed_state = bytes(galaxy.compressed_state)
+        if "gzip" in request.headers.get("Accept-Encoding", ""):
+            response = HttpResponse(
+                compressed_state,
+                content_type="application/json",
+                headers={"Content-Encoding": "gzip"},
+            )
+        else:
+            response = HttpResponse(
+                gzip.decompress(compressed_state), content_type="application/json"
+            )
+        patch_vary_headers(response, ["Accept-Encoding"])
+        return response
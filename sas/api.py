@@ -1,12 +1,12 @@
 from typing import Annotated
 
-from annotated_types import MinLen
+from annotated_types import Ge, Le, MinLen
 from django.conf import settings
 from django.db.models import F
 from django.urls import reverse
 from ninja import Query
 from ninja_extra import ControllerBase, api_controller, paginate, route
-from ninja_extra.exceptions import NotFound, PermissionDenied
+from ninja_extra.exceptions import NotFound, PermissionDenied, ValidationError
 from ninja_extra.pagination import PageNumberPaginationExtra
 from ninja_extra.permissions import IsAuthenticated
 from ninja_extra.schemas import PaginatedResponseSchema
@@ -19,7 +19,9 @@ from sas.schemas import (
     AlbumSchema,
     IdentifiedUserSchema,
     ModerationRequestSchema,
+    PictureCursorSchema,
     PictureFilterSchema,
+    PictureKeysetPageSchema,
     PictureSchema,
 )
 
@@ -70,10 +72,53 @@ class PicturesController(ControllerBase):
             filters.filter(Picture.objects.viewable_by(user))
             .distinct()
             .order_by("-parent__date", "date")
-            .select_related("owner")
+            .select_related("owner", "thumbnail_job")
             .annotate(album=F("parent__name"))
         )
 
+    @route.get(
+        "/keyset",
+        response=PictureKeysetPageSchema,
+        permissions=[IsAuthenticated],
+        url_name="pictures_keyset",
+    )
+    def fetch_pictures_keyset(
+        self,
+        filters: Query[PictureFilterSchema],
+        cursor: str | None = None,
+        page_size: Annotated[int, Ge(1), Le(200)] = 100,
+    ):
+        """Find pictures viewable by the user, with a keyset pagination.
+
+        This returns the same pictures as the `fetch_pictures` route.
+        However, instead of a page number, the client gives the cursor
+        returned with the previous page, so the pictures of any page
+        can be fetched without going through the ones of the previous pages.
+        Thus, this is the route to use to go through large sets of pictures.
+
+        Notes:
+            The returned count is only an estimation.
+        """
+        user: User = self.context.request.user
+        pictures = filters.filter(Picture.objects.viewable_by(user)).distinct()
+        count = pictures.count_estimate()
+        if cursor is not None:
+            try:
+                position = PictureCursorSchema.decode(cursor)
+            except ValueError as e:
+                raise ValidationError({"cursor": "Invalid cursor"}) from e
+            pictures = pictures.after(position.album_date, position.date, position.id)
+        results = list(
+            pictures.order_by(*Picture.KEYSET_ORDERING)
+            .select_related("owner", "thumbnail_job")
+            .annotate(album=F("parent__name"))[: page_size + 1]
+        )
+        next_cursor = None
+        if len(results) > page_size:
+            results = results[:page_size]
+            next_cursor = PictureCursorSchema.from_picture(results[-1]).encode()
+        return {"count": count, "next_cursor": next_cursor, "results": results}
+
     @route.get(
         "/{picture_id}/identified",
         permissions=[IsAuthenticated, CanView],
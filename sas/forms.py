@@ -1,13 +1,16 @@
+import contextlib
 from typing import Any
 
 from django import forms
 from django.utils.translation import gettext_lazy as _
+from PIL import Image
 
 from core.models import User
+from core.utils import get_image_size
 from core.views import MultipleImageField
 from core.views.forms import SelectDate
 from core.views.widgets.select import AutoCompleteSelectMultipleGroup
-from sas.models import Album, Picture, PictureModerationRequest
+from sas.models import Album, Picture, PictureModerationRequest, ThumbnailJob
 from sas.widgets.select import AutoCompleteSelectAlbum
 
 
@@ -50,10 +53,16 @@ class SASForm(forms.Form):
             )
             if automodere:
                 new_file.moderator = owner
+            # if the file isn't a valid image, the thumbnail job will tell it
+            with contextlib.suppress(Exception):
+                new_file.width, new_file.height = get_image_size(Image.open(f))
+            f.seek(0)
             try:
                 new_file.clean()
-                new_file.generate_thumbnails()
                 new_file.save()
+                # the thumbnails will be generated later by a worker,
+                # because it is too slow to do it for each picture of a big upload
+                ThumbnailJob.objects.create(picture=new_file)
             except Exception as e:
                 self.add_error(
                     None,
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.utils import fork_process_pool
+from sas.models import Picture, read_dimensions
+
+
+class Command(BaseCommand):
+    """Store the dimensions of the pictures of the SAS which don't have them yet.
+
+    The dimensions of the pictures are stored when they are uploaded ;
+    this command only needs to be run once, for the pictures
+    that were uploaded before.
+    """
+
+    help = "Compute the width and the height of the SAS pictures"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes reading the pictures",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of pictures read and saved at once",
+        )
+
+    def handle(self, *args, **options):
+        pictures = Picture.objects.filter(width=None).only("id", "file", "rotation").order_by("id")
+        nb_done, nb_failed = 0, 0
+        last_id = 0
+        with fork_process_pool(options["workers"]) as executor:
+            # Each batch is fetched entirely before being sent to the workers,
+            # so that no cursor is left open while they are working.
+            while batch := list(
+                pictures.filter(id__gt=last_id)[: options["batch_size"]]
+            ):
+                last_id = batch[-1].id
+                paths = [settings.MEDIA_ROOT / p.file.name for p in batch]
+                for picture, dimensions in zip(
+                    batch,
+                    executor.map(read_dimensions, paths, chunksize=50),
+                    strict=True,
+                ):
+                    if dimensions is None:
+                        nb_failed += 1
+                        continue
+                    if picture.rotation % 180 == 90:
+                        dimensions = dimensions[::-1]
+                    picture.width, picture.height = dimensions
+                    nb_done += 1
+                Picture.objects.bulk_update(
+                    [p for p in batch if p.width is not None], ["width", "height"]
+                )
+        self.stdout.write(f"Computed the dimensions of {nb_done} pictures")
+        if nb_failed:
+            self.stderr.write(f"{nb_failed} pictures couldn't be read")
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from sas.models import ThumbnailJob
+
+
+class Command(BaseCommand):
+    """Generate the thumbnails of the pictures uploaded in the SAS.
+
+    Uploading a picture only stores its original file,
+    the compressed version and the thumbnail are generated by this command.
+    It should be run regularly (for example, every minute by a cron job).
+    """
+
+    help = "Generate the thumbnails of the newly uploaded pictures"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "-w",
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes rendering the pictures",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of pictures rendered and saved at once",
+        )
+        parser.add_argument(
+            "--retry",
+            action="store_true",
+            help="Also retry the jobs which failed",
+        )
+
+    def handle(self, *args, **options):
+        if options["retry"]:
+            ThumbnailJob.objects.filter(status=ThumbnailJob.Status.FAILED).update(
+                status=ThumbnailJob.Status.PENDING, error=""
+            )
+        nb_pictures = ThumbnailJob.process_pending(
+            workers=options["workers"], batch_size=options["batch_size"]
+        )
+        self.stdout.write(f"Generated the thumbnails of {nb_pictures} pictures")
+        if failed := ThumbnailJob.objects.filter(
+            status=ThumbnailJob.Status.FAILED
+        ).count():
+            self.stderr.write(f"{failed} pictures couldn't be processed")
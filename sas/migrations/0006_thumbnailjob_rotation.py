@@ -0,0 +1,24 @@
+# Generated by Django 4.2.17 on 2026-10-18 22:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sas", "0005_thumbnailjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="thumbnailjob",
+            name="rotation",
+            field=models.PositiveSmallIntegerField(
+                default=0,
+                help_text=(
+                    "The angle, in degrees counter-clockwise, "
+                    "by which the picture must be rotated."
+                ),
+                verbose_name="rotation",
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.17 on 2026-10-18 23:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sas", "0006_thumbnailjob_rotation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="thumbnailjob",
+            name="claim_token",
+            field=models.UUIDField(
+                blank=True, editable=False, null=True, verbose_name="claim token"
+            ),
+        ),
+    ]
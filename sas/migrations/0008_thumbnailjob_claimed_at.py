@@ -0,0 +1,19 @@
+# Generated by Django 4.2.17 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sas", "0007_thumbnailjob_claim_token"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="thumbnailjob",
+            name="claimed_at",
+            field=models.DateTimeField(
+                blank=True, editable=False, null=True, verbose_name="claimed at"
+            ),
+        ),
+    ]
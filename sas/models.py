@@ -16,21 +16,41 @@
 from __future__ import annotations
 
 import contextlib
+import json
+import logging
+import uuid
+from concurrent.futures import as_completed
+from datetime import timedelta
 from io import BytesIO
 from pathlib import Path
-from typing import ClassVar, Self
+from typing import TYPE_CHECKING, ClassVar, Self
 
 from django.conf import settings
 from django.core.cache import cache
-from django.db import models
-from django.db.models import Exists, OuterRef
+from django.core.files.base import ContentFile
+from django.db import connections, models, transaction
+from django.db.models import Case, Exists, F, OuterRef, Q, Value, When
+from django.db.models.functions import Coalesce, Mod
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from PIL import Image
 
 from core.models import SithFile, User
-from core.utils import exif_auto_rotate, resize_image
+from core.utils import (
+    ImageVariant,
+    exif_auto_rotate,
+    fork_process_pool,
+    get_image_size,
+    resize_image,
+    resize_image_variants,
+)
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+    from datetime import datetime
+
+    from django.db.models import OrderBy
 
 
 class SasFile(SithFile):
@@ -76,6 +96,131 @@ class PictureQuerySet(models.QuerySet):
             return self.filter(is_moderated=True)
         return self.filter(people__user_id=user.id, is_moderated=True)
 
+    def after(self, album_date: datetime, date: datetime, pk: int) -> Self:
+        """Filter the pictures which come after the given one,
+        in the order defined by `Picture.KEYSET_ORDERING`.
+
+        Args:
+            album_date: the album key of the given picture,
+                as defined by `Picture.ALBUM_KEY`
+            date: the date of the given picture
+            pk: the id of the given picture
+        """
+        return self.alias(album_key=Picture.ALBUM_KEY).filter(
+            # redundant, but allows the db to start right at the given picture
+            # in the index, instead of scanning all the previous ones
+            Q(album_key__lte=album_date),
+            Q(album_key__lt=album_date) | Q(date__gt=date) | Q(date=date, id__gt=pk),
+        )
+
+    def count_estimate(self) -> int:
+        """Estimate the number of pictures of this queryset.
+
+        On PostgreSQL, the estimation of the query planner is used,
+        which doesn't need to go through the pictures.
+        On other databases, the pictures are really counted.
+        """
+        connection = connections[self.db]
+        if connection.vendor != "postgresql":
+            return self.count()
+        sql, params = self.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return plan[0]["Plan"]["Plan Rows"]
+
+
+_ROTATIONS = {
+    90: Image.Transpose.ROTATE_90,
+    180: Image.Transpose.ROTATE_180,
+    270: Image.Transpose.ROTATE_270,
+}
+
+
+def render_thumbnails(content: bytes, rotation: int = 0) -> tuple[bytes, bytes]:
+    """Render the thumbnail and the compressed version of a picture.
+
+    This is the expensive part of the generation of the thumbnails
+    and doesn't touch the database, so that it can be done
+    by another process.
+    The original file isn't rendered again : it's kept as it was uploaded,
+    and the rotation is only applied to its variants.
+
+    Args:
+        content: the content of the original file
+        rotation: the angle, in degrees counter-clockwise,
+            by which the picture must be rotated (0, 90, 180 or 270)
+    """
+    im = Image.open(BytesIO(content))
+    with contextlib.suppress(Exception):
+        im = exif_auto_rotate(im)
+    if rotation in _ROTATIONS:
+        # transposing only moves the pixels around, unlike Image.rotate
+        im = im.transpose(_ROTATIONS[rotation])
+    # convert the compressed image and the thumbnail into webp
+    compressed, thumb = resize_image_variants(
+        im, [ImageVariant(1200, "webp"), ImageVariant(200, "webp")]
+    )
+    return thumb.read(), compressed.read()
+
+
+def _render_jobs(
+    jobs: list[ThumbnailJob], workers: int
+) -> Iterator[tuple[ThumbnailJob, tuple[bytes, bytes] | Exception]]:
+    """Yield each job with its rendered pictures, as soon as they are ready.
+
+    When there are several workers, the pictures are rendered
+    by a pool of processes, which read the original files by themselves.
+    If the rendering of a picture failed, the exception is yielded
+    instead of the pictures.
+    """
+    if workers <= 1:
+        for job in jobs:
+            try:
+                result = render_thumbnails(job.picture.file.read(), job.total_rotation)
+            except Exception as e:
+                result = e
+            yield job, result
+        return
+    executor = fork_process_pool(workers)
+    try:
+        futures = {
+            executor.submit(
+                _render_file_thumbnails,
+                settings.MEDIA_ROOT / job.picture.file.name,
+                job.total_rotation,
+            ): job
+            for job in jobs
+        }
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = e
+            yield futures[future], result
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def _render_file_thumbnails(path: Path, rotation: int) -> tuple[bytes, bytes]:
+    return render_thumbnails(path.read_bytes(), rotation)
+
+
+def read_dimensions(path: Path) -> tuple[int, int] | None:
+    """Read the dimensions of a picture in the headers of its file.
+
+    Returns:
+        The width and height of the picture,
+        or None if the file isn't a readable image.
+    """
+    try:
+        with Image.open(path) as im:
+            return get_image_size(im)
+    except (OSError, ValueError):
+        return None
+
 
 class SASPictureManager(models.Manager):
     def get_queryset(self):
@@ -86,14 +231,44 @@ class Picture(SasFile):
     class Meta:
         proxy = True
 
+    THUMBNAIL_PLACEHOLDER: ClassVar[str] = "sas/img/placeholder.svg"
+    """Static image shown instead of the thumbnails which aren't ready yet."""
+
+    ALBUM_KEY: ClassVar[Coalesce] = Coalesce("album_date", "date")
+    """Date of the album of the pictures, as used to sort them.
+
+    The album date isn't set on the pictures which have been created
+    with `bulk_create` or edited with `update()`,
+    so the date of the picture itself is used instead.
+    """
+
+    KEYSET_ORDERING: ClassVar[tuple[OrderBy | str, ...]] = (
+        ALBUM_KEY.desc(),
+        "date",
+        "id",
+    )
+    """Ordering of the pictures which is backed by an index.
+
+    The pictures are sorted by album, from the most recent to the oldest,
+    then by date.
+    """
+
     objects = SASPictureManager.from_queryset(PictureQuerySet)()
 
     @property
-    def is_vertical(self):
-        with open(settings.MEDIA_ROOT / self.file.name, "rb") as f:
-            im = Image.open(BytesIO(f.read()))
-            (w, h) = im.size
-            return (w / h) < 1
+    def is_vertical(self) -> bool:
+        """True if this picture is higher than it is wide.
+
+        Pictures whose dimensions aren't known yet are considered horizontal.
+        """
+        if self.width is None or self.height is None:
+            return False
+        return self.width < self.height
+
+    @property
+    def album_key(self) -> datetime:
+        """The value of `Picture.ALBUM_KEY` for this picture."""
+        return self.album_date or self.date
 
     def get_download_url(self):
         return reverse("sas:download", kwargs={"picture_id": self.id})
@@ -107,50 +282,110 @@ class Picture(SasFile):
     def get_absolute_url(self):
         return reverse("sas:picture", kwargs={"picture_id": self.id})
 
+    @property
+    def thumbnail_status(self) -> ThumbnailJob.Status:
+        """The status of the generation of the compressed picture and thumbnail."""
+        try:
+            return self.thumbnail_job.status
+        except ThumbnailJob.DoesNotExist:
+            return ThumbnailJob.Status.READY
+
+    @property
+    def pending_rotation(self) -> int:
+        """The rotation of this picture, in degrees counter-clockwise,
+        which hasn't been applied to its files yet.
+        """
+        try:
+            return self.thumbnail_job.rotation
+        except ThumbnailJob.DoesNotExist:
+            return 0
+
     def generate_thumbnails(self, *, overwrite=False):
-        im = Image.open(BytesIO(self.file.read()))
-        with contextlib.suppress(Exception):
-            im = exif_auto_rotate(im)
-        # convert the compressed image and the thumbnail into webp
-        # The original image keeps its original type, because it's not
-        # meant to be shown on the website, but rather to keep the real image
-        # for less frequent cases (like downloading the pictures of an user)
-        extension = self.mime_type.split("/")[-1]
-        # the HD version of the image doesn't need to be optimized, because :
-        # - it isn't frequently queried
-        # - optimizing large images takes a lot time, which greatly hinders the UX
-        # - photographers usually already optimize their images
-        file = resize_image(im, max(im.size), extension, optimize=False)
-        thumb = resize_image(im, 200, "webp")
-        compressed = resize_image(im, 1200, "webp")
+        """Generate the compressed version and the thumbnail of this picture.
+
+        This is done synchronously ; when a lot of pictures are uploaded,
+        prefer creating [ThumbnailJob][sas.models.ThumbnailJob]
+        and letting the `generate_thumbnails` command deal with them.
+        """
+        self.save_thumbnails(
+            *render_thumbnails(self.file.read(), self.rotation), overwrite=overwrite
+        )
+
+    def save_thumbnails(
+        self,
+        thumb: bytes,
+        compressed: bytes,
+        *,
+        rotation: int | None = None,
+        overwrite=False,
+    ):
+        """Save the result of [render_thumbnails][sas.models.render_thumbnails].
+
+        Only the variants of the picture are saved,
+        so that what has been changed while the thumbnails were rendered
+        (like the moderation of the picture) isn't overwritten.
+        The dimensions of the picture are kept up to date by
+        [rotate][sas.models.Picture.rotate], so they are only
+        saved if they weren't known yet.
+
+        Args:
+            thumb: the rendered thumbnail
+            compressed: the rendered compressed version
+            rotation: the rotation of the original file
+                which has been applied to the variants, if it changed
+            overwrite: if True, the former variants are deleted
+        """
         if overwrite:
-            self.file.delete()
             self.thumbnail.delete()
             self.compressed.delete()
         new_extension_name = str(Path(self.name).with_suffix(".webp"))
-        self.file = file
-        self.file.name = self.name
-        self.thumbnail = thumb
-        self.thumbnail.name = new_extension_name
-        self.compressed = compressed
-        self.compressed.name = new_extension_name
-        self.save()
-
-    def rotate(self, degree):
-        for attr in ["file", "compressed", "thumbnail"]:
-            name = self.__getattribute__(attr).name
-            with open(settings.MEDIA_ROOT / name, "r+b") as file:
-                if file:
-                    im = Image.open(BytesIO(file.read()))
-                    file.seek(0)
-                    im = im.rotate(degree, expand=True)
-                    im.save(
-                        fp=file,
-                        format=self.mime_type.split("/")[-1].upper(),
-                        quality=90,
-                        optimize=True,
-                        progressive=True,
-                    )
+        update_fields = ["thumbnail", "compressed"]
+        if rotation is not None:
+            self.rotation = rotation
+            update_fields.append("rotation")
+        if self.width is None or self.height is None:
+            with Image.open(self.file) as im:
+                self.width, self.height = get_image_size(im)
+            if self.rotation % 180 == 90:
+                self.width, self.height = self.height, self.width
+            update_fields += ["width", "height"]
+        self.thumbnail = ContentFile(thumb, name=new_extension_name)
+        self.compressed = ContentFile(compressed, name=new_extension_name)
+        if self._state.adding:
+            self.save()
+        else:
+            self.save(update_fields=update_fields)
+
+    def rotate(self, degree: int):
+        """Rotate this picture by the given angle, in degrees counter-clockwise.
+
+        The files aren't touched here : the rotation is recorded
+        in the thumbnail job of the picture, and applied to the variants
+        of the picture when the job is processed.
+        The original file itself is never rotated, so that it isn't re-encoded.
+        Until then, the former variants are still served,
+        and the pending rotation is applied when the picture is displayed.
+        If the job is being processed, it's left to its worker,
+        which will give it back with the rotation that remains to be done.
+        The dimensions of the picture are swapped right away,
+        if the rotation is a quarter turn.
+        """
+        with transaction.atomic():
+            job = ThumbnailJob.objects.get_or_create(picture=self)[0]
+            processing = ThumbnailJob.Status.PROCESSING
+            ThumbnailJob.objects.filter(pk=job.pk).update(
+                rotation=Mod(F("rotation") + degree % 360, 360),
+                status=Case(
+                    When(status=processing, then=Value(processing)),
+                    default=Value(ThumbnailJob.Status.PENDING),
+                ),
+                error="",
+            )
+            if degree % 180 == 90:
+                Picture.objects.filter(pk=self.pk).update(
+                    width=F("height"), height=F("width")
+                )
+                self.width, self.height = self.height, self.width
 
     def get_next(self):
         if self.is_moderated:
@@ -177,6 +412,149 @@ class Picture(SasFile):
         return pictures_qs.order_by("-id").first()
 
 
+class ThumbnailJob(models.Model):
+    """The pending generation of the thumbnails of a picture.
+
+    Generating the thumbnails of a picture is expensive,
+    so uploading a picture only stores the original file
+    and creates a job, which is processed later
+    by the `generate_thumbnails` management command.
+    Rotating a picture also creates a job,
+    which generates the thumbnails once again with the new orientation.
+    The job is deleted once the thumbnails have been generated.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending", _("pending")
+        PROCESSING = "processing", _("processing")
+        FAILED = "failed", _("failed")
+        READY = "ready", _("ready")
+        """The thumbnails have been generated.
+
+        Jobs are deleted when they are done,
+        so this status is only used by pictures without a job.
+        """
+
+    picture = models.OneToOneField(
+        Picture,
+        primary_key=True,
+        verbose_name=_("picture"),
+        related_name="thumbnail_job",
+        on_delete=models.CASCADE,
+    )
+    status = models.CharField(
+        _("status"),
+        max_length=10,
+        choices=Status.choices,
+        default=Status.PENDING,
+        db_index=True,
+    )
+    created_at = models.DateTimeField(_("created at"), auto_now_add=True)
+    rotation = models.PositiveSmallIntegerField(
+        _("rotation"),
+        default=0,
+        help_text=_(
+            "The angle, in degrees counter-clockwise, "
+            "by which the picture must be rotated."
+        ),
+    )
+    error = models.TextField(_("error"), blank=True, default="")
+    claim_token = models.UUIDField(
+        _("claim token"), null=True, blank=True, editable=False
+    )  # identifies the worker processing the job, set by claim()
+    claimed_at = models.DateTimeField(
+        _("claimed at"), null=True, blank=True, editable=False
+    )  # allows to take back the jobs of the workers which died, set by claim()
+
+    class Meta:
+        verbose_name = _("thumbnail job")
+
+    def __str__(self):
+        return f"Thumbnails of {self.picture} ({self.status})"
+
+    @property
+    def total_rotation(self) -> int:
+        """The rotation of the original file to apply to the variants,
+        once this job is done.
+        """
+        return (self.picture.rotation + self.rotation) % 360
+
+    @classmethod
+    def claim(cls, count: int) -> list[ThumbnailJob]:
+        """Mark at most `count` pending jobs as being processed and return them.
+
+        Jobs which are being claimed by another worker are skipped,
+        so that several workers can run at the same time.
+        The claimed jobs are marked with a token, so that only the jobs
+        which have actually been claimed by this worker are returned,
+        even by databases which can't lock rows.
+
+        The jobs which have been processed for more than
+        `SITH_SAS_THUMBNAIL_JOB_TIMEOUT` minutes are considered abandoned
+        by their worker (which may have crashed), and are claimed again.
+        """
+        token = uuid.uuid4()
+        now = timezone.now()
+        timeout = now - timedelta(minutes=settings.SITH_SAS_THUMBNAIL_JOB_TIMEOUT)
+        claimable = Q(status=cls.Status.PENDING) | Q(
+            Q(claimed_at__lt=timeout) | Q(claimed_at=None),
+            status=cls.Status.PROCESSING,
+        )
+        with transaction.atomic():
+            pks = list(
+                cls.objects.select_for_update(skip_locked=True)
+                .filter(claimable)
+                .order_by("created_at")
+                .values_list("pk", flat=True)[:count]
+            )
+            cls.objects.filter(claimable, pk__in=pks).update(
+                status=cls.Status.PROCESSING, claim_token=token, claimed_at=now
+            )
+        return list(
+            cls.objects.filter(claim_token=token, status=cls.Status.PROCESSING)
+            .select_related("picture")
+            .order_by("created_at")
+        )
+
+    @classmethod
+    def process_pending(cls, *, workers: int = 1, batch_size: int = 100) -> int:
+        """Generate the thumbnails of all the pending jobs.
+
+        The pictures are rendered in parallel by `workers` processes,
+        by batches of `batch_size` pictures.
+        The processes only render the pictures, the files and the database
+        are updated by the main process.
+
+        Returns:
+            The number of pictures whose thumbnails have been generated.
+        """
+        logger = logging.getLogger("main")
+        done = 0
+        while jobs := cls.claim(batch_size):
+            for job, result in _render_jobs(jobs, workers):
+                claimed = cls.objects.filter(pk=job.pk, claim_token=job.claim_token)
+                if isinstance(result, Exception):
+                    logger.warning(f"Could not generate the thumbnails of {job}")
+                    claimed.update(status=cls.Status.FAILED, error=repr(result))
+                    continue
+                job.picture.save_thumbnails(
+                    *result, rotation=job.total_rotation, overwrite=True
+                )
+                deleted = claimed.filter(rotation=job.rotation).delete()[0]
+                if not deleted:
+                    # the picture has been rotated again while being processed.
+                    # Only the rotation which hasn't been applied remains to be done.
+                    claimed.update(
+                        rotation=Mod(F("rotation") - job.rotation + 360, 360),
+                        status=cls.Status.PENDING,
+                        claim_token=None,
+                        claimed_at=None,
+                    )
+                done += 1
+            logger.info(f"Generated the thumbnails of {done} pictures")
+        return done
+
+
 class AlbumQuerySet(models.QuerySet):
     def viewable_by(self, user: User) -> Self:
         """Filter the albums that this user can view.
@@ -249,7 +627,10 @@ class Album(SasFile):
             .first()
         )
         if p and p.file:
-            image = resize_image(Image.open(BytesIO(p.file.read())), 200, "webp")
+            im = Image.open(BytesIO(p.file.read()))
+            if p.rotation in _ROTATIONS:
+                im = im.transpose(_ROTATIONS[p.rotation])
+            image = resize_image(im, 200, "webp")
             self.file = image
             self.file.name = f"{self.name}/thumb.webp"
             self.save()
@@ -1,12 +1,15 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import datetime
 from pathlib import Path
+from typing import Self
 
+from django.contrib.staticfiles.storage import staticfiles_storage
 from django.urls import reverse
 from ninja import FilterSchema, ModelSchema, Schema
 from pydantic import Field, NonNegativeInt
 
 from core.schemas import SimpleUserSchema, UserProfileSchema
-from sas.models import Album, Picture, PictureModerationRequest
+from sas.models import Album, Picture, PictureModerationRequest, ThumbnailJob
 
 
 class AlbumSchema(ModelSchema):
@@ -31,13 +34,24 @@ class PictureFilterSchema(FilterSchema):
 class PictureSchema(ModelSchema):
     class Meta:
         model = Picture
-        fields = ["id", "name", "date", "size", "is_moderated", "asked_for_removal"]
+        fields = [
+            "id",
+            "name",
+            "date",
+            "size",
+            "width",
+            "height",
+            "is_moderated",
+            "asked_for_removal",
+        ]
 
     owner: UserProfileSchema
     sas_url: str
     full_size_url: str
     compressed_url: str
     thumb_url: str
+    thumbnail_status: ThumbnailJob.Status
+    pending_rotation: int
     album: str
 
     @staticmethod
@@ -50,12 +64,57 @@ class PictureSchema(ModelSchema):
 
     @staticmethod
     def resolve_compressed_url(obj: Picture) -> str:
+        if not obj.compressed:
+            return staticfiles_storage.url(Picture.THUMBNAIL_PLACEHOLDER)
         return obj.get_download_compressed_url()
 
     @staticmethod
     def resolve_thumb_url(obj: Picture) -> str:
+        if not obj.thumbnail:
+            return staticfiles_storage.url(Picture.THUMBNAIL_PLACEHOLDER)
         return obj.get_download_thumb_url()
 
+    @staticmethod
+    def resolve_thumbnail_status(obj: Picture) -> ThumbnailJob.Status:
+        return obj.thumbnail_status
+
+    @staticmethod
+    def resolve_pending_rotation(obj: Picture) -> int:
+        return obj.pending_rotation
+
+
+class PictureCursorSchema(Schema):
+    """The position of a picture in the keyset pagination of the pictures."""
+
+    album_date: datetime
+    """The album key of the picture, as defined by `Picture.ALBUM_KEY`."""
+    date: datetime
+    id: int
+
+    @classmethod
+    def from_picture(cls, picture: Picture) -> Self:
+        return cls(album_date=picture.album_key, date=picture.date, id=picture.id)
+
+    @classmethod
+    def decode(cls, cursor: str) -> Self:
+        """Read a cursor given by [encode][sas.schemas.PictureCursorSchema.encode].
+
+        Raises:
+            ValueError: if the cursor is invalid.
+        """
+        return cls.model_validate_json(urlsafe_b64decode(cursor.encode()))
+
+    def encode(self) -> str:
+        return urlsafe_b64encode(self.model_dump_json().encode()).decode()
+
+
+class PictureKeysetPageSchema(Schema):
+    count: int
+    """Estimation of the total number of pictures."""
+    next_cursor: str | None
+    """The cursor to give to fetch the next page, if there is one."""
+    results: list[PictureSchema]
+
 
 class PictureRelationCreationSchema(Schema):
     picture: NonNegativeInt
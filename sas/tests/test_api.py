@@ -1,6 +1,8 @@
 from django.conf import settings
 from django.core.cache import cache
 from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.test import TestCase
 from django.urls import reverse
 from model_bakery import baker
@@ -138,6 +140,70 @@ class TestPictureSearch(TestSas):
             self.client.get(self.url)
 
 
+class TestPictureKeyset(TestSas):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # the pictures have been bulk created, so their album date isn't set
+        Picture.objects.update(
+            album_date=Subquery(
+                SithFile.objects.filter(id=OuterRef("parent_id")).values("date")
+            )
+        )
+        cls.url = reverse("api:pictures_keyset")
+
+    def fetch_all_pages(self) -> list[int]:
+        """Go through all the pages, and return the ids of the pictures."""
+        pictures, cursor = [], None
+        while True:
+            query = f"?page_size=3&cursor={cursor}" if cursor else "?page_size=3"
+            res = self.client.get(self.url + query)
+            assert res.status_code == 200
+            assert len(res.json()["results"]) <= 3
+            pictures.extend(p["id"] for p in res.json()["results"])
+            cursor = res.json()["next_cursor"]
+            if cursor is None:
+                return pictures
+
+    def test_all_pages(self):
+        """Test that going through the pages returns all the pictures in order."""
+        self.client.force_login(self.user_b)
+        expected = list(
+            Picture.objects.order_by("-parent__date", "date", "id").values_list(
+                "id", flat=True
+            )
+        )
+        assert self.fetch_all_pages() == expected
+
+    def test_pictures_without_album_date(self):
+        """Test that the pictures whose album date isn't set are paginated too."""
+        Picture.objects.filter(parent=self.album_a).update(album_date=None)
+        self.client.force_login(self.user_b)
+        expected = list(
+            Picture.objects.order_by(
+                Coalesce("album_date", "date").desc(), "date", "id"
+            ).values_list("id", flat=True)
+        )
+        assert self.fetch_all_pages() == expected
+
+    def test_filter_by_user(self):
+        self.client.force_login(self.user_b)
+        res = self.client.get(self.url + f"?users_identified={self.user_a.id}")
+        assert res.status_code == 200
+        expected = list(
+            self.user_a.pictures.order_by(
+                "-picture__parent__date", "picture__date", "picture_id"
+            ).values_list("picture_id", flat=True)
+        )
+        assert [i["id"] for i in res.json()["results"]] == expected
+        assert res.json()["next_cursor"] is None
+
+    def test_invalid_cursor(self):
+        self.client.force_login(self.user_b)
+        res = self.client.get(self.url + "?cursor=not-a-cursor")
+        assert res.status_code == 400
+
+
 class TestPictureRelation(TestSas):
     def test_delete_relation_route_forbidden(self):
         """Test that unauthorized users are properly 403ed"""
@@ -1,10 +1,22 @@
+from datetime import timedelta
+from io import BytesIO
+from uuid import uuid4
+
+import pytest
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import TestCase
+from freezegun import freeze_time
 from model_bakery import baker
+from PIL import Image
 
+import sas.models
 from core.baker_recipes import old_subscriber_user, subscriber_user
 from core.models import User
 from sas.baker_recipes import picture_recipe
-from sas.models import Picture
+from sas.forms import SASForm
+from sas.models import Album, Picture, ThumbnailJob
 
 
 class TestPictureQuerySet(TestCase):
@@ -39,3 +51,165 @@ class TestPictureQuerySet(TestCase):
         user.pictures.create(picture=self.pictures[1])
         pictures = list(Picture.objects.viewable_by(user))
         assert pictures == [self.pictures[1]]
+
+
+@pytest.mark.django_db
+class TestThumbnailJob:
+    @pytest.fixture
+    def album(self) -> Album:
+        return baker.make(
+            Album,
+            name="Thumbnails",
+            parent_id=settings.SITH_SAS_ROOT_DIR_ID,
+            is_moderated=True,
+        )
+
+    def upload(self, album: Album, name: str, content: bytes) -> Picture:
+        form = SASForm(data={"album_name": ""})
+        assert form.is_valid()
+        file = SimpleUploadedFile(name, content, content_type="image/jpeg")
+        form.process(album, album.owner, [file], automodere=True)
+        assert form.is_valid()
+        return Picture.objects.select_related("thumbnail_job").get(
+            parent=album, name=name
+        )
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_upload_creates_job(self, album: Album, workers: int):
+        """Test that uploading a picture only stores it and creates a job."""
+        content = BytesIO()
+        Image.new("RGB", (400, 300)).save(content, format="JPEG")
+        picture = self.upload(album, f"{uuid4()}.jpg", content.getvalue())
+        assert picture.file
+        assert not picture.thumbnail
+        assert not picture.compressed
+        assert picture.thumbnail_status == ThumbnailJob.Status.PENDING
+        assert (picture.width, picture.height) == (400, 300)
+        assert not picture.is_vertical
+
+        assert ThumbnailJob.process_pending(workers=workers) == 1
+        picture = Picture.objects.get(id=picture.id)
+        assert picture.thumbnail_status == ThumbnailJob.Status.READY
+        assert Image.open(picture.thumbnail.file).size == (200, 150)
+        assert Image.open(picture.compressed.file).size == (1200, 900)
+
+    def test_rotate(self, album: Album):
+        """Test that rotations are deferred to the thumbnail jobs."""
+        content = BytesIO()
+        Image.new("RGB", (400, 300)).save(content, format="JPEG")
+        picture = self.upload(album, f"{uuid4()}.jpg", content.getvalue())
+        ThumbnailJob.process_pending()
+        picture = Picture.objects.get(id=picture.id)
+        picture.rotate(90)
+        picture.rotate(180)
+        picture = Picture.objects.select_related("thumbnail_job").get(id=picture.id)
+        assert picture.pending_rotation == 270
+        # the dimensions are right before the job is processed
+        assert (picture.width, picture.height) == (300, 400)
+        assert picture.is_vertical
+        # the former thumbnails are still available until the job is processed
+        assert Image.open(picture.thumbnail.file).size == (200, 150)
+
+        assert ThumbnailJob.process_pending() == 1
+        picture = Picture.objects.get(id=picture.id)
+        assert picture.pending_rotation == 0
+        assert picture.rotation == 270
+        assert (picture.width, picture.height) == (300, 400)
+        # only the variants are rotated, the original file is kept untouched
+        assert picture.file.read() == content.getvalue()
+        assert Image.open(picture.thumbnail.file).size == (150, 200)
+        assert Image.open(picture.compressed.file).size == (900, 1200)
+
+    def test_rotate_while_processing(self, album: Album, monkeypatch):
+        """Test that a job rotated while being processed isn't claimed twice."""
+        content = BytesIO()
+        Image.new("RGB", (400, 300)).save(content, format="JPEG")
+        picture = self.upload(album, f"{uuid4()}.jpg", content.getvalue())
+        ThumbnailJob.process_pending()
+        picture = Picture.objects.get(id=picture.id)
+        picture.rotate(90)
+        render_jobs = sas.models._render_jobs
+        rotated = False
+
+        def rotate_while_rendering(jobs, workers):
+            nonlocal rotated
+            for job, result in render_jobs(jobs, workers):
+                if not rotated:
+                    rotated = True
+                    picture.rotate(90)
+                    assert (
+                        ThumbnailJob.objects.get(pk=job.pk).status
+                        == ThumbnailJob.Status.PROCESSING
+                    )
+                    assert ThumbnailJob.claim(10) == []
+                yield job, result
+
+        monkeypatch.setattr(sas.models, "_render_jobs", rotate_while_rendering)
+        # the job is given back with the second rotation, then processed again
+        assert ThumbnailJob.process_pending() == 2
+        picture = Picture.objects.get(id=picture.id)
+        assert picture.thumbnail_status == ThumbnailJob.Status.READY
+        assert picture.rotation == 180
+        assert (picture.width, picture.height) == (400, 300)
+        assert Image.open(picture.thumbnail.file).size == (200, 150)
+
+    def test_edit_while_processing(self, album: Album, monkeypatch):
+        """Test that the edits made while a picture is rendered are kept."""
+        content = BytesIO()
+        Image.new("RGB", (400, 300)).save(content, format="JPEG")
+        picture = self.upload(album, f"{uuid4()}.jpg", content.getvalue())
+        Picture.objects.filter(id=picture.id).update(is_moderated=False)
+        render_jobs = sas.models._render_jobs
+
+        def moderate_while_rendering(jobs, workers):
+            for job, result in render_jobs(jobs, workers):
+                Picture.objects.filter(id=job.picture_id).update(
+                    is_moderated=True, asked_for_removal=True
+                )
+                yield job, result
+
+        monkeypatch.setattr(sas.models, "_render_jobs", moderate_while_rendering)
+        assert ThumbnailJob.process_pending() == 1
+        picture = Picture.objects.get(id=picture.id)
+        assert picture.thumbnail
+        assert picture.is_moderated
+        assert picture.asked_for_removal
+
+    def test_claim_abandoned_job(self, album: Album):
+        """Test that the jobs of the workers which died are claimed again."""
+        content = BytesIO()
+        Image.new("RGB", (400, 300)).save(content, format="JPEG")
+        picture = self.upload(album, f"{uuid4()}.jpg", content.getvalue())
+        with freeze_time() as frozen_time:
+            [job] = ThumbnailJob.claim(10)
+            assert ThumbnailJob.claim(10) == []
+            frozen_time.tick(
+                timedelta(minutes=settings.SITH_SAS_THUMBNAIL_JOB_TIMEOUT + 1)
+            )
+            [reclaimed] = ThumbnailJob.claim(10)
+        assert reclaimed.pk == picture.id
+        assert reclaimed.claim_token != job.claim_token
+
+    def test_failed_job(self, album: Album):
+        picture = self.upload(album, f"{uuid4()}.jpg", b"not an image")
+        assert ThumbnailJob.process_pending() == 0
+        picture.thumbnail_job.refresh_from_db()
+        assert picture.thumbnail_job.status == ThumbnailJob.Status.FAILED
+        assert picture.thumbnail_job.error != ""
+
+
+@pytest.mark.django_db
+def test_compute_picture_dimensions():
+    """Test that the dimensions of the old pictures are backfilled."""
+    content = BytesIO()
+    Image.new("RGB", (300, 400)).save(content, format="JPEG")
+    album = baker.make(Album, parent_id=settings.SITH_SAS_ROOT_DIR_ID)
+    picture = picture_recipe.make(
+        parent=album, file=SimpleUploadedFile(f"{uuid4()}.jpg", content.getvalue())
+    )
+    assert picture.width is None
+    assert not picture.is_vertical
+    call_command("compute_picture_dimensions", workers=2)
+    picture.refresh_from_db()
+    assert (picture.width, picture.height) == (300, 400)
+    assert picture.is_vertical
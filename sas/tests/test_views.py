@@ -16,6 +16,7 @@ from typing import Callable
 
 import pytest
 from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
 from django.core.cache import cache
 from django.test import Client, TestCase
 from django.urls import reverse
@@ -25,7 +26,7 @@ from pytest_django.asserts import assertInHTML, assertRedirects
 from core.baker_recipes import old_subscriber_user, subscriber_user
 from core.models import Group, User
 from sas.baker_recipes import picture_recipe
-from sas.models import Album, Picture
+from sas.models import Album, Picture, ThumbnailJob
 
 # Create your tests here.
 
@@ -171,3 +172,21 @@ class TestSasModeration(TestCase):
             "Vous avez déjà déposé une demande de retrait pour cette photo.</li></ul>",
             res.content.decode(),
         )
+
+
+@pytest.mark.django_db
+def test_thumbnail_placeholder(client: Client):
+    """Test that a placeholder is sent while the thumbnails aren't generated."""
+    album = baker.make(Album, parent_id=settings.SITH_SAS_ROOT_DIR_ID)
+    picture = picture_recipe.make(parent=album)
+    ThumbnailJob.objects.create(picture=picture)
+    client.force_login(subscriber_user.make())
+    for url_name in "sas:download_thumb", "sas:download_compressed":
+        res = client.get(reverse(url_name, kwargs={"picture_id": picture.id}))
+        assertRedirects(
+            res,
+            staticfiles_storage.url(Picture.THUMBNAIL_PLACEHOLDER),
+            fetch_redirect_response=False,
+        )
+    res = client.get(reverse("api:pictures") + f"?album_id={album.id}")
+    assert res.json()["results"][0]["thumbnail_status"] == "pending"
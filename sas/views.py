@@ -15,16 +15,17 @@
 from typing import Any
 
 from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
 from django.core.exceptions import PermissionDenied
 from django.http import Http404, HttpResponse, HttpResponseRedirect
-from django.shortcuts import get_object_or_404
+from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse, reverse_lazy
 from django.utils.translation import gettext_lazy as _
 from django.views.generic import DetailView, TemplateView
 from django.views.generic.edit import FormMixin, FormView, UpdateView
 
 from core.models import SithFile, User
-from core.views import CanEditMixin, CanViewMixin
+from core.views import CanEditMixin, CanViewMixin, can_view
 from core.views.files import FileView, send_file
 from sas.forms import (
     AlbumEditForm,
@@ -96,11 +97,24 @@ def send_pict(request, picture_id):
 
 
 def send_compressed(request, picture_id):
-    return send_file(request, picture_id, Picture, "compressed")
+    return _send_thumbnail(request, picture_id, "compressed")
 
 
 def send_thumb(request, picture_id):
-    return send_file(request, picture_id, Picture, "thumbnail")
+    return _send_thumbnail(request, picture_id, "thumbnail")
+
+
+def _send_thumbnail(request, picture_id: int, file_attr: str):
+    """Send a generated version of the picture.
+
+    As long as it hasn't been generated, redirect to a placeholder.
+    """
+    picture = get_object_or_404(Picture, id=picture_id)
+    if getattr(picture, file_attr):
+        return send_file(request, picture_id, Picture, file_attr)
+    if not can_view(picture, request.user):
+        raise PermissionDenied
+    return redirect(staticfiles_storage.url(Picture.THUMBNAIL_PLACEHOLDER))
 
 
 class AlbumUploadView(CanViewMixin, DetailView, FormMixin):
@@ -387,6 +387,9 @@ SITH_FORUM_PAGE_LENGTH = 30
 # SAS variables
 SITH_SAS_ROOT_DIR_ID = 4
 SITH_SAS_IMAGES_PER_PAGE = 60
+# Minutes after which a thumbnail job which is still being processed
+# is considered abandoned by its worker, and can be processed again
+SITH_SAS_THUMBNAIL_JOB_TIMEOUT = 30
 
 SITH_BOARD_SUFFIX = "-bureau"
 SITH_MEMBER_SUFFIX = "-membres"
@@ -628,6 +631,10 @@ SITH_MAXIMUM_FREE_ROLE = 1
 # Minutes to timeout the logged barmen
 SITH_BARMAN_TIMEOUT = 30
 
+# Seconds during which the barmen timeout isn't handled by the views
+# after the `sweep_barman_timeouts` command has been run
+SITH_BARMAN_TIMEOUT_SWEEP_INTERVAL = 120
+
 # Minutes to delete the last operations
 SITH_LAST_OPERATIONS_LIMIT = 10
 